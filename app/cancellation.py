@@ -0,0 +1,57 @@
+"""
+Cancelling the queries of requests whose client disconnected.
+
+A client that gives up on a slow analytics request (or an API Gateway that
+times it out) would otherwise leave its query running in the database. Each
+request to a CancelOnDisconnectRoute runs in a CancelScope and is watched
+for the disconnect message; when it arrives, the scope's queries are
+cancelled in the database (see connectors/cancellation.py).
+
+Disconnects are only visible while the client's connection is open to this
+process: behind API Gateway a request that times out keeps running, which
+the queries' statement timeouts bound instead.
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from app.metrics import HTTP_CLIENT_DISCONNECTS
+from app.profiling import ProfiledRoute
+from connectors.cancellation import CancelScope, cancel_scope
+
+logger = logging.getLogger(__name__)
+
+
+async def _watch_disconnect(request: Request, scope: CancelScope, route: str):
+    """Wait for the client to disconnect, then cancel the request's queries."""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            break
+    HTTP_CLIENT_DISCONNECTS.inc(route=route)
+    logger.debug("Client disconnected from %s, cancelling its queries", route)
+    # Sending the cancel requests blocks, so keep it off the event loop
+    await run_in_threadpool(scope.cancel)
+
+
+class CancelOnDisconnectRoute(ProfiledRoute):
+    """Route class cancelling a request's database queries when its client disconnects."""
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        handler = super().get_route_handler()
+
+        async def cancelling_handler(request: Request):
+            # Read the body first so the watcher is the only reader of
+            # further messages; the handler gets the cached body
+            await request.body()
+            scope = CancelScope()
+            with cancel_scope(scope):
+                watcher = asyncio.ensure_future(_watch_disconnect(request, scope, self.path))
+                try:
+                    return await handler(request)
+                finally:
+                    watcher.cancel()
+
+        return cancelling_handler
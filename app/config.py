@@ -6,6 +6,7 @@ error handling, and environment-specific configuration.
 """
 
 import os
+import tempfile
 from pathlib import Path
 from typing import Optional
 from dotenv import load_dotenv
@@ -67,8 +68,234 @@ class Config:
             "user": self.get("POSTGRES_USER", "postgres"),
             "password": self.get("POSTGRES_PASSWORD"),
             "database": self.get("POSTGRES_DB", "crafty"),
+            "replicas": self._parse_hosts(self.get("POSTGRES_REPLICAS", "")),
         }
 
+    def _parse_hosts(self, value: str) -> list:
+        """Parse a comma-separated list of host[:port] entries."""
+        hosts = []
+        for entry in value.split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            host, _, port = entry.partition(":")
+            hosts.append({"host": host, "port": port or self.get("POSTGRES_PORT", "5432")})
+        return hosts
+
+    @property
+    def replica_strategy(self) -> str:
+        """Get how reads are balanced across replicas: round_robin or least_connections."""
+        return self.get("POSTGRES_REPLICA_STRATEGY", "round_robin").lower()
+
+    @property
+    def replica_max_lag_seconds(self) -> float:
+        """Get the replication lag above which a replica stops serving reads."""
+        return float(self.get("POSTGRES_REPLICA_MAX_LAG_SECONDS", "30"))
+
+    @property
+    def replica_check_interval(self) -> float:
+        """Get how often replica health and lag are rechecked, in seconds."""
+        return float(self.get("POSTGRES_REPLICA_CHECK_INTERVAL", "10"))
+
+    @property
+    def pool_min_size(self) -> int:
+        """Get the number of connections each pool keeps open."""
+        return int(self.get("DB_POOL_MIN_SIZE", "1"))
+
+    @property
+    def pool_max_size(self) -> int:
+        """Get the maximum number of connections in each pool."""
+        return int(self.get("DB_POOL_MAX_SIZE", "10"))
+
+    @property
+    def pool_timeout(self) -> float:
+        """Get how long to wait for a pooled connection, in seconds."""
+        return float(self.get("DB_POOL_TIMEOUT", "10"))
+
+    @property
+    def health_check_interval(self) -> float:
+        """Get how often the background health checker refreshes, in seconds."""
+        return float(self.get("HEALTH_CHECK_INTERVAL", "10"))
+
+    @property
+    def single_flight_enabled(self) -> bool:
+        """Check if identical concurrent analytics queries share one execution."""
+        return self.get("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+    @property
+    def single_flight_timeout(self) -> Optional[float]:
+        """Get how long a caller waits for a shared execution, in seconds, if limited."""
+        value = self.get("SINGLE_FLIGHT_TIMEOUT", "30")
+        return None if value.lower() == "none" else float(value)
+
+    @property
+    def snapshots_enabled(self) -> bool:
+        """Check if default-parameter analytics are served from precomputed snapshots."""
+        return self.get("SNAPSHOTS_ENABLED", "true").lower() == "true"
+
+    @property
+    def snapshot_scheduler(self) -> bool:
+        """Check if the app runs its own snapshot refresh thread."""
+        return self.get("SNAPSHOT_SCHEDULER", "true").lower() == "true"
+
+    @property
+    def snapshot_interval(self) -> float:
+        """Get how often snapshots are refreshed, in seconds."""
+        return float(self.get("SNAPSHOT_INTERVAL", "60"))
+
+    @property
+    def snapshot_jitter(self) -> float:
+        """Get the fraction of the interval refreshes are randomly shifted by."""
+        return float(self.get("SNAPSHOT_JITTER", "0.1"))
+
+    @property
+    def snapshot_max_stale(self) -> float:
+        """Get the age in seconds past which a snapshot is no longer served."""
+        return float(self.get("SNAPSHOT_MAX_STALE", "600"))
+
+    @property
+    def columnar_engine(self) -> bool:
+        """Check if analytics are computed in-process over columnar copies of the tables."""
+        return self.get("COLUMNAR_ENGINE", "false").lower() == "true"
+
+    @property
+    def columnar_refresh_interval(self) -> float:
+        """Get how often the columnar engine ingests new rows, in seconds."""
+        return float(self.get("COLUMNAR_REFRESH_INTERVAL", "5"))
+
+    @property
+    def columnar_reload_interval(self) -> float:
+        """Get how often the columnar engine reloads the tables in full, in seconds."""
+        return float(self.get("COLUMNAR_RELOAD_INTERVAL", "300"))
+
+    @property
+    def approximate_sample_method(self) -> str:
+        """Get the TABLESAMPLE method of approximate analytics (only bernoulli is supported)."""
+        return self.get("APPROXIMATE_SAMPLE_METHOD", "bernoulli").upper()
+
+    @property
+    def approximate_sample_percent(self) -> float:
+        """Get the default percentage of a table sampled by approximate analytics."""
+        return float(self.get("APPROXIMATE_SAMPLE_PERCENT", "1"))
+
+    @property
+    def approximate_min_rows(self) -> int:
+        """Get the estimated table size below which approximate analytics run exactly."""
+        return int(self.get("APPROXIMATE_MIN_ROWS", "1000000"))
+
+    @property
+    def approximate_confidence(self) -> float:
+        """Get the confidence level of the intervals returned by approximate analytics."""
+        return float(self.get("APPROXIMATE_CONFIDENCE", "0.95"))
+
+    @property
+    def ingest_buffer_rows(self) -> int:
+        """Get how many rows each ingest buffer holds before rejecting writes."""
+        return int(self.get("INGEST_BUFFER_ROWS", "100000"))
+
+    @property
+    def ingest_batch_rows(self) -> int:
+        """Get how many buffered rows trigger an ingest flush."""
+        return int(self.get("INGEST_BATCH_ROWS", "5000"))
+
+    @property
+    def ingest_flush_interval(self) -> float:
+        """Get the longest a row waits in an ingest buffer before a flush, in seconds."""
+        return float(self.get("INGEST_FLUSH_INTERVAL", "0.5"))
+
+    @property
+    def ingest_ack(self) -> str:
+        """Get when ingest requests are acknowledged by default (enqueued or durable)."""
+        return self.get("INGEST_ACK", "durable").lower()
+
+    @property
+    def ingest_ack_timeout(self) -> float:
+        """Get how long a durable ingest request waits for its flush, in seconds."""
+        return float(self.get("INGEST_ACK_TIMEOUT", "10"))
+
+    @property
+    def cpu_offload_enabled(self) -> bool:
+        """Check if large /python requests run in a process pool (never on Lambda)."""
+        return not self.is_lambda and self.get("CPU_OFFLOAD", "true").lower() == "true"
+
+    @property
+    def cpu_offload_workers(self) -> int:
+        """Get the number of worker processes for offloaded requests."""
+        return int(self.get("CPU_OFFLOAD_WORKERS", str(os.cpu_count() or 1)))
+
+    @property
+    def cpu_offload_min_bytes(self) -> int:
+        """Get the request body size from which /python requests are offloaded."""
+        return int(self.get("CPU_OFFLOAD_MIN_BYTES", "262144"))
+
+    @property
+    def cpu_offload_max_queue(self) -> int:
+        """Get how many offloaded requests may wait for a busy worker before new ones get 503."""
+        return int(self.get("CPU_OFFLOAD_MAX_QUEUE", "64"))
+
+    @property
+    def cpu_task_timeout(self) -> float:
+        """Get how long an offloaded request may run in a worker before it is killed, in seconds."""
+        return float(self.get("CPU_TASK_TIMEOUT", "20"))
+
+    @property
+    def prepare_threshold(self) -> Optional[int]:
+        """
+        Get how many executions of a statement on a connection precede preparing it.
+
+        0 prepares on first execution; "none" disables server-side preparation.
+        """
+        value = self.get("DB_PREPARE_THRESHOLD", "5")
+        return None if value.lower() == "none" else int(value)
+
+    @property
+    def plan_cache_mode(self) -> Optional[str]:
+        """Get the plan_cache_mode set on pooled connections, if any."""
+        return self.get("DB_PLAN_CACHE_MODE") or None
+
+    @property
+    def py_fast_path(self) -> bool:
+        """Check if the Python question routes use the orjson fast path."""
+        return self.get("PY_FAST_PATH", "false").lower() == "true"
+
+    @property
+    def partition_months_ahead(self) -> int:
+        """Get how many months of future partitions to keep created."""
+        return int(self.get("PARTITION_MONTHS_AHEAD", "3"))
+
+    @property
+    def partition_retain_months(self) -> Optional[int]:
+        """Get how many months of partitions to keep attached, if limited."""
+        value = self.get("PARTITION_RETAIN_MONTHS")
+        return int(value) if value else None
+
+    @property
+    def profile_sample_rate(self) -> float:
+        """Get the fraction of requests profiled without an explicit header."""
+        return float(self.get("PROFILE_SAMPLE_RATE", "0"))
+
+    @property
+    def profile_token(self) -> Optional[str]:
+        """Get the value the profiling header must carry; the header is ignored without one."""
+        return self.get("PROFILE_TOKEN") or None
+
+    @property
+    def profile_dir(self) -> str:
+        """Get the directory profiling artifacts are written to."""
+        return self.get(
+            "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "crafty-profiles")
+        )
+
+    @property
+    def log_level(self) -> str:
+        """Get the level of the app's log messages (e.g. DEBUG, INFO, WARNING)."""
+        return self.get("LOG_LEVEL", "INFO").upper()
+
+    @property
+    def is_lambda(self) -> bool:
+        """Check if the app is running in AWS Lambda."""
+        return bool(self.get("AWS_LAMBDA_FUNCTION_NAME"))
+
     @property
     def is_production(self) -> bool:
         """Check if running in production environment."""
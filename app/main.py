@@ -1,14 +1,98 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from mangum import Mangum
-from routers import py_questions, sql_questions
-from connectors.database import Database
+from psycopg.errors import QueryCanceled
+from connectors.cancellation import QueryCancelled
+from connectors.replicas import get_replica_router
+from routers import export, ingest, py_questions, sql_questions
+from services.health_services import get_health_checker
+from services.ingest_services import get_ingest_service
+from services.partition_services import PartitionService
+from services.single_flight import SingleFlightTimeout
+from services.snapshot_services import get_snapshot_service
 from app.config import config
+from app.metrics import CONTENT_TYPE_LATEST, MetricsMiddleware, registry
+from app.offload import CPUQueueFull, CPUTaskTimeout, get_cpu_executor
+from app.profiling import ProfilingMiddleware
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the background health and replica checkers, snapshot scheduler and CPU offload workers and load the snapshots with the app, flush ingest buffers on shutdown."""
+    checker = get_health_checker()
+    checker.start()
+    replicas = get_replica_router()
+    replicas.start()
+    snapshots = get_snapshot_service()
+    if config.snapshots_enabled and not snapshots.loaded:
+        # Mangum runs the lifespan on every Lambda invocation; only the
+        # first one loads
+        await asyncio.to_thread(snapshots.load)
+    if config.snapshots_enabled and config.snapshot_scheduler:
+        snapshots.start()
+    if config.cpu_offload_enabled:
+        # Spawning the workers takes seconds; keep the event loop free meanwhile
+        await asyncio.to_thread(get_cpu_executor().start)
+    yield
+    get_ingest_service().stop(config.ingest_ack_timeout)
+    get_cpu_executor().stop()
+    snapshots.stop()
+    replicas.stop()
+    checker.stop()
+
+
+# The Lambda runtime installs its own handler on the root logger, which
+# basicConfig leaves alone, so the level is set separately
+logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logging.getLogger().setLevel(config.log_level)
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    ProfilingMiddleware,
+    sample_rate=config.profile_sample_rate,
+    token=config.profile_token,
+    output_dir=config.profile_dir,
+)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(SingleFlightTimeout)
+async def single_flight_timeout_handler(request: Request, exc: SingleFlightTimeout):
+    """A request that gave up waiting for a shared query execution."""
+    return JSONResponse({"detail": str(exc)}, status_code=504)
+
+
+@app.exception_handler(CPUTaskTimeout)
+async def cpu_task_timeout_handler(request: Request, exc: CPUTaskTimeout):
+    """A request whose offloaded work ran past the task timeout."""
+    return JSONResponse({"detail": str(exc)}, status_code=504)
+
+
+@app.exception_handler(CPUQueueFull)
+async def cpu_queue_full_handler(request: Request, exc: CPUQueueFull):
+    """A request turned away because too many offloaded requests are waiting for a worker."""
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(QueryCanceled)
+async def query_canceled_handler(request: Request, exc: QueryCanceled):
+    """A query the database cancelled, usually for running past its statement timeout."""
+    return JSONResponse({"detail": str(exc).strip()}, status_code=504)
+
+
+@app.exception_handler(QueryCancelled)
+async def query_cancelled_handler(request: Request, exc: QueryCancelled):
+    """A request whose client disconnected; the response is never read."""
+    return JSONResponse({"detail": str(exc)}, status_code=499)
+
 
 app.include_router(py_questions.router)
 app.include_router(sql_questions.router)
+app.include_router(export.router)
+app.include_router(ingest.router)
 
 
 @app.get("/")
@@ -21,29 +105,45 @@ def read_root():
     }
 
 
+@app.get("/health/live")
+def liveness():
+    """Liveness probe: the process is up and serving requests. Never touches the database."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def readiness():
+    """
+    Readiness probe: the cached result of the background database check.
+
+    Reports pool saturation, replica lag and the latency of the last real
+    query, and answers 503 until the first check and while the database is
+    unreachable.
+    """
+    status = get_health_checker().status()
+    return JSONResponse(status, status_code=200 if status["status"] == "healthy" else 503)
+
+
 @app.get("/health")
 def health_check():
-    """Health check endpoint to test database connectivity."""
-    try:
-        db = Database()
-        if db.test_connection():
-            return {
-                "status": "healthy",
-                "database": "connected",
-                "message": "API and database are working correctly",
-            }
-        else:
-            return {
-                "status": "unhealthy",
-                "database": "disconnected",
-                "message": "Database connection failed",
-            }
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "database": "error",
-            "message": f"Health check failed: {str(e)}",
-        }
+    """Health check endpoint, the cached readiness status (always 200 for existing probes)."""
+    return get_health_checker().status()
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Expose query and request metrics in the Prometheus text format."""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE_LATEST)
 
 
 handler = Mangum(app)
+
+
+def partition_maintenance_handler(event, context):
+    """Scheduled entry point creating upcoming partitions and detaching expired ones."""
+    return {"changes": PartitionService().maintain()}
+
+
+def refresh_handler(event, context):
+    """Scheduled entry point recomputing and persisting every analytics snapshot."""
+    return {"refreshed": get_snapshot_service().refresh()}
@@ -0,0 +1,459 @@
+"""
+Metrics collection for Crafty CRM.
+
+This module provides a small in-process metrics registry (counters, gauges
+and histograms) that renders in the Prometheus text exposition format.
+Recording a sample is a dictionary lookup and a few additions under a lock,
+so instrumentation can stay enabled on the hot paths.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, from sub-millisecond queries up to the 29s
+# API Gateway timeout
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+# Size buckets for row counts and payload sizes
+SIZE_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the text exposition format."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Format label names and values as a Prometheus label set."""
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value, keeping integers free of a trailing .0."""
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """Base class holding the name, help text and label names of a metric."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increment the counter for the given label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Get the current value for the given label values."""
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Gauge that is either set directly or read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the gauge for the given label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increment the gauge for the given label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        """Decrement the gauge for the given label values."""
+        self.inc(-amount, **labels)
+
+    def set_function(self, callback: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        """
+        Read the gauge values from a callback when metrics are rendered.
+
+        Args:
+            callback: Function returning a mapping of label value tuples to values
+        """
+        self._callback = callback
+
+    def _samples(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                items = list(self._callback().items())
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed upper bounds."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record an observation for the given label values."""
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, **labels: str) -> int:
+        """Get the number of observations for the given label values."""
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state[0]), state[1]) for key, state in self._values.items()]
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}"
+                )
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(names, key + ('+Inf',))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registry of metrics rendered together on the /metrics endpoint."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Get or create a counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Get or create a gauge."""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        """Get or create a histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all registered metrics in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry
+registry = MetricsRegistry()
+
+# Database query metrics, labelled by the SQLQueryService method that issued the query
+DB_QUERY_DURATION = registry.histogram(
+    "crafty_db_query_duration_seconds",
+    "Wall time spent executing a database query.",
+    ("query",),
+)
+DB_QUERY_ROWS = registry.histogram(
+    "crafty_db_query_rows",
+    "Rows returned by a database query.",
+    ("query",),
+    buckets=SIZE_BUCKETS,
+)
+DB_CONNECTION_ACQUIRE = registry.histogram(
+    "crafty_db_connection_acquire_seconds",
+    "Time spent acquiring a database connection.",
+    ("query",),
+)
+DB_QUERY_ERRORS = registry.counter(
+    "crafty_db_query_errors_total",
+    "Database queries that raised an error.",
+    ("query", "error"),
+)
+DB_QUERY_CANCELLATIONS = registry.counter(
+    "crafty_db_query_cancellations_total",
+    "Queries cancelled by their statement timeout or because every caller disconnected.",
+    ("query", "reason"),
+)
+DB_PREPARED_EXECUTIONS = registry.counter(
+    "crafty_db_prepared_statement_executions_total",
+    "Named query executions, by whether they reused a server-side prepared statement.",
+    ("query", "prepared"),
+)
+DB_READ_ROUTES = registry.counter(
+    "crafty_db_read_routes_total",
+    "Read-only queries by the database they were routed to.",
+    ("target",),
+)
+DB_REPLICA_FAILOVERS = registry.counter(
+    "crafty_db_replica_failovers_total",
+    "Reads that fell back to the primary after a replica failed.",
+    ("replica", "error"),
+)
+DB_REPLICA_LAG = registry.gauge(
+    "crafty_db_replica_lag_seconds",
+    "Replication lag measured by the last replica health check.",
+    ("replica",),
+)
+DB_REPLICA_HEALTHY = registry.gauge(
+    "crafty_db_replica_healthy",
+    "Whether a replica is currently serving reads (1) or not (0).",
+    ("replica",),
+)
+SINGLE_FLIGHT_CALLS = registry.counter(
+    "crafty_single_flight_calls_total",
+    "Coalesced query calls by whether they ran the query (leader) or waited (follower).",
+    ("query", "role"),
+)
+SINGLE_FLIGHT_SAVED = registry.counter(
+    "crafty_single_flight_saved_executions_total",
+    "Query executions saved by sharing an identical in-flight execution.",
+    ("query",),
+)
+SINGLE_FLIGHT_TIMEOUTS = registry.counter(
+    "crafty_single_flight_timeouts_total",
+    "Callers that gave up waiting for a shared in-flight execution.",
+    ("query",),
+)
+SINGLE_FLIGHT_ABANDONED = registry.counter(
+    "crafty_single_flight_abandoned_total",
+    "Callers that disconnected while waiting on a shared in-flight execution.",
+    ("query",),
+)
+SNAPSHOT_AGE = registry.gauge(
+    "crafty_snapshot_age_seconds",
+    "Age of the latest snapshot of each analytic.",
+    ("analytic",),
+)
+SNAPSHOT_REFRESHES = registry.counter(
+    "crafty_snapshot_refreshes_total",
+    "Snapshot refreshes by analytic and outcome (ok or error).",
+    ("analytic", "outcome"),
+)
+SNAPSHOT_REFRESH_DURATION = registry.histogram(
+    "crafty_snapshot_refresh_duration_seconds",
+    "Time taken to recompute a snapshot.",
+    ("analytic",),
+    LATENCY_BUCKETS,
+)
+
+# In-process columnar analytics engine
+COLUMNAR_ROWS = registry.gauge(
+    "crafty_columnar_rows",
+    "Rows held in memory by the columnar analytics engine, by table.",
+    ("table",),
+)
+COLUMNAR_REFRESHES = registry.counter(
+    "crafty_columnar_refreshes_total",
+    "Columnar engine refreshes by kind (full or incremental) and outcome (ok or error).",
+    ("kind", "outcome"),
+)
+
+# Buffered bulk ingest
+INGEST_ROWS = registry.counter(
+    "crafty_ingest_rows_total",
+    "Ingested rows by table and outcome (written, failed, rejected or dropped).",
+    ("table", "outcome"),
+)
+INGEST_BUFFERED_ROWS = registry.gauge(
+    "crafty_ingest_buffered_rows",
+    "Rows waiting in each ingest buffer.",
+    ("table",),
+)
+INGEST_DEAD_LETTER_ROWS = registry.gauge(
+    "crafty_ingest_dead_letter_rows",
+    "Rows acknowledged as enqueued whose flush failed, kept in each dead-letter queue for a retry.",
+    ("table",),
+)
+INGEST_FLUSH_DURATION = registry.histogram(
+    "crafty_ingest_flush_duration_seconds",
+    "Time taken to COPY a batch of buffered rows.",
+    ("table",),
+    LATENCY_BUCKETS,
+)
+
+# Process pool offload of CPU-bound requests
+CPU_TASKS = registry.counter(
+    "crafty_cpu_tasks_total",
+    "Requests run in the worker process pool by task and outcome (ok, error, timeout or rejected).",
+    ("task", "outcome"),
+)
+CPU_TASK_DURATION = registry.histogram(
+    "crafty_cpu_task_duration_seconds",
+    "Time from a worker picking up an offloaded request to its result.",
+    ("task",),
+    LATENCY_BUCKETS,
+)
+CPU_POOL_RESTARTS = registry.counter(
+    "crafty_cpu_pool_restarts_total",
+    "Worker processes replaced after their task timed out or they died.",
+)
+
+# HTTP request metrics, labelled by route template
+HTTP_REQUEST_DURATION = registry.histogram(
+    "crafty_http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ("method", "route", "status"),
+)
+HTTP_CLIENT_DISCONNECTS = registry.counter(
+    "crafty_http_client_disconnects_total",
+    "Requests whose client disconnected before the response, by route.",
+    ("route",),
+)
+# Bytes sent per response, not the cost of serializing any one query's rows
+RESPONSE_BYTES = registry.histogram(
+    "crafty_response_bytes",
+    "HTTP response body bytes sent, by route.",
+    ("method", "route"),
+    buckets=SIZE_BUCKETS,
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency and response size per route.
+
+    Implemented as plain ASGI rather than BaseHTTPMiddleware so the response
+    body is streamed through untouched and the per-request cost stays at a
+    couple of clock reads.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route on the scope, which keeps the
+            # label cardinality bounded to the route templates
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=method,
+                route=route_path,
+                status=str(status),
+            )
+            RESPONSE_BYTES.observe(size, method=method, route=route_path)
@@ -0,0 +1,299 @@
+"""
+Process pool offload for CPU-bound routes.
+
+Pure-Python work on a large request body holds the GIL for as long as it
+runs, so in the threadpool it stalls every other request of the process. A
+route marked with offload() hands bodies of at least CPU_OFFLOAD_MIN_BYTES
+to a task in a pool of warm worker processes instead, and runs smaller ones
+inline, where the round trip to a worker would cost more than it saves.
+
+Only the raw body, the PY_FAST_PATH setting and the serialized response
+cross the process boundary (see services/cpu_tasks.py). Each worker process
+is driven over a pipe by a dispatcher thread of its own, so a task's
+CPU_TASK_TIMEOUT runs from when a worker picks it up, not from when it was
+queued. A task past its timeout cannot be interrupted inside its worker, so
+that one worker is terminated and replaced; the others keep running. At most
+CPU_OFFLOAD_MAX_QUEUE tasks wait for a worker; beyond that requests are
+rejected rather than queued until they time out.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import Request
+from app.config import config
+from app.metrics import CPU_POOL_RESTARTS, CPU_TASK_DURATION, CPU_TASKS
+from app.profiling import ProfiledRoute
+from app.responses import FastJSONResponse
+from services.cpu_tasks import warm_up
+
+# Seconds a new worker process gets to start and import the tasks
+WARM_UP_TIMEOUT = 60.0
+
+logger = logging.getLogger(__name__)
+
+
+class CPUTaskTimeout(TimeoutError):
+    """Raised when an offloaded task runs past the task timeout."""
+
+
+class CPUQueueFull(Exception):
+    """Raised when too many offloaded tasks are already waiting for a worker."""
+
+
+class _WorkerDied(Exception):
+    """Raised when a worker process exits while running a task."""
+
+
+def _serve(conn: Connection):
+    """Worker process loop: run each task received on the pipe and send back its outcome."""
+    while True:
+        try:
+            task, body, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            outcome: Tuple[bool, Any] = (True, task(body, *args))
+        except Exception as e:
+            outcome = (False, e)
+        try:
+            conn.send(outcome)
+        except Exception as e:
+            # The exception could not be pickled
+            conn.send((False, RuntimeError(f"{type(outcome[1]).__name__}: {outcome[1]} ({e})")))
+
+
+class _Worker:
+    """One worker process and the pipe its dispatcher thread drives it over."""
+
+    def __init__(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve, args=(child,), name="cpu-offload-worker", daemon=True
+        )
+        self.process.start()
+        child.close()
+
+    def call(self, task: Callable[..., Any], body: bytes, args: tuple, timeout: float) -> Any:
+        """Run a task, raising CPUTaskTimeout if it runs longer than timeout seconds."""
+        try:
+            self.conn.send((task, body, args))
+            finished = self.conn.poll(timeout)
+            if finished:
+                ok, value = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise _WorkerDied(str(e)) from e
+        if not finished:
+            raise CPUTaskTimeout(f"{task.__name__} did not finish within {timeout}s")
+        if not ok:
+            raise value
+        return value
+
+    def terminate(self):
+        self.process.terminate()
+        self.process.join(1)
+        self.conn.close()
+
+
+class CPUExecutor:
+    """Pool of warm worker processes running CPU-bound tasks with a timeout."""
+
+    def __init__(self, workers: int, timeout: float, max_queue: int):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_queue = max_queue
+        # Workers are spawned rather than forked so they do not inherit the
+        # API process's threads, pools and sockets
+        self._context = multiprocessing.get_context("spawn")
+        self._dispatchers: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._processes: List[_Worker] = []
+        self._tasks = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the worker processes and wait until each has imported the tasks.
+
+        Blocks for as long as the workers take to spawn; call it off the event loop.
+        """
+        dispatchers = self._get_dispatchers()
+        # Submitted together, each warm-up gets a dispatcher thread, and so a
+        # worker process, of its own
+        barrier = threading.Barrier(self.workers)
+        for future in [dispatchers.submit(self._warm_up, barrier) for _ in range(self.workers)]:
+            future.result()
+        logger.info("Started %d CPU offload workers", self.workers)
+
+    def stop(self):
+        """Shut the worker processes down, cancelling queued tasks."""
+        with self._lock:
+            dispatchers, self._dispatchers = self._dispatchers, None
+            workers, self._processes = self._processes, []
+        if dispatchers is not None:
+            dispatchers.shutdown(wait=False, cancel_futures=True)
+        for worker in workers:
+            worker.terminate()
+
+    def _get_dispatchers(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._dispatchers is None:
+                self._dispatchers = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="cpu-offload"
+                )
+            return self._dispatchers
+
+    def _worker(self) -> _Worker:
+        """The worker process of the calling dispatcher thread, started if needed."""
+        worker = getattr(self._local, "worker", None)
+        if worker is None or not worker.process.is_alive():
+            worker = _Worker(self._context)
+            self._local.worker = worker
+            with self._lock:
+                self._processes.append(worker)
+        return worker
+
+    def _replace(self, worker: _Worker, reason: str):
+        """Terminate the calling dispatcher thread's worker; the next task starts a new one."""
+        logger.warning("Replacing a CPU offload worker: %s", reason)
+        CPU_POOL_RESTARTS.inc()
+        self._local.worker = None
+        with self._lock:
+            if worker in self._processes:
+                self._processes.remove(worker)
+        worker.terminate()
+
+    def _warm_up(self, barrier: threading.Barrier):
+        worker = self._worker()
+        try:
+            worker.call(warm_up, b"", (), WARM_UP_TIMEOUT)
+        except (CPUTaskTimeout, _WorkerDied) as e:
+            self._replace(worker, f"it did not start: {e}")
+        try:
+            barrier.wait(WARM_UP_TIMEOUT)
+        except threading.BrokenBarrierError:
+            pass
+
+    def _dispatch(self, task: Callable[..., Any], body: bytes, args: tuple) -> Any:
+        """Run a task on the calling dispatcher thread's worker; the timeout starts now."""
+        name = task.__name__
+        start = time.perf_counter()
+        for attempt in range(2):
+            worker = self._worker()
+            try:
+                result = worker.call(task, body, args, self.timeout)
+            except CPUTaskTimeout:
+                CPU_TASKS.inc(task=name, outcome="timeout")
+                self._replace(worker, f"{name} ran longer than {self.timeout}s")
+                raise
+            except _WorkerDied as e:
+                # Give the task one more try on a new worker
+                self._replace(worker, f"the worker died running {name}: {e}")
+                if attempt == 0:
+                    continue
+                CPU_TASKS.inc(task=name, outcome="error")
+                raise RuntimeError(f"The CPU offload worker running {name} died") from e
+            except Exception:
+                CPU_TASKS.inc(task=name, outcome="error")
+                raise
+            CPU_TASKS.inc(task=name, outcome="ok")
+            CPU_TASK_DURATION.observe(time.perf_counter() - start, task=name)
+            return result
+
+    def _release(self, _future):
+        with self._lock:
+            self._tasks -= 1
+
+    async def run(self, task: Callable[..., Any], body: bytes, *args: Any) -> Any:
+        """
+        Run a task on a request body in a worker process.
+
+        Args:
+            task: Module-level function of services.cpu_tasks
+            body: Raw request body passed to the task
+            args: Further picklable arguments passed to the task
+
+        Returns:
+            The task's return value
+        """
+        with self._lock:
+            if self._tasks >= self.workers + self.max_queue:
+                CPU_TASKS.inc(task=task.__name__, outcome="rejected")
+                raise CPUQueueFull(
+                    f"{self._tasks - self.workers} offloaded tasks are already waiting for a worker"
+                )
+            self._tasks += 1
+        try:
+            future = self._get_dispatchers().submit(self._dispatch, task, body, args)
+        except Exception:
+            self._release(None)
+            raise
+        # Released once the task finishes, or is cancelled before it starts
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+
+_executor: Optional[CPUExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_cpu_executor() -> CPUExecutor:
+    """Get the process-wide CPU executor."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = CPUExecutor(
+                    config.cpu_offload_workers,
+                    config.cpu_task_timeout,
+                    config.cpu_offload_max_queue,
+                )
+    return _executor
+
+
+def offload(task: Callable[[bytes, bool], bytes]):
+    """
+    Mark an endpoint of an OffloadRoute router to run large bodies in the worker pool.
+
+    Args:
+        task: Module-level function taking the raw body and the PY_FAST_PATH
+            setting and returning the serialized response, equivalent to the endpoint
+    """
+
+    def decorator(endpoint):
+        endpoint.offload_task = task
+        return endpoint
+
+    return decorator
+
+
+class OffloadRoute(ProfiledRoute):
+    """
+    Route class sending large request bodies of offload() endpoints to the worker pool.
+
+    The body is read before dispatching; the regular handler, used for small
+    bodies, gets the same cached body. Offloaded requests are not profiled.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        handler = super().get_route_handler()
+        task = getattr(self.endpoint, "offload_task", None)
+        if task is None:
+            return handler
+
+        async def offload_handler(request: Request):
+            if config.cpu_offload_enabled:
+                body = await request.body()
+                if len(body) >= config.cpu_offload_min_bytes:
+                    # The worker parses and serializes as this process's routes do
+                    content = await get_cpu_executor().run(task, body, config.py_fast_path)
+                    return FastJSONResponse(content)
+            return await handler(request)
+
+        return offload_handler
@@ -0,0 +1,139 @@
+"""
+Per-request profiling for Crafty CRM.
+
+A request is profiled when it carries the profiling header with the
+configured token, or when the configured sampling rate selects it; without
+a token the header is ignored. The selected request gets a cProfile
+profiler that is enabled only while its endpoint runs, and the resulting
+pstats artifact is written to the profile directory once the response has
+been sent. Unprofiled requests pay for one header lookup and one context
+variable read.
+"""
+
+import cProfile
+import functools
+import hmac
+import inspect
+import logging
+import os
+import random
+import uuid
+from contextvars import ContextVar
+from typing import Any, Callable, Iterable, Optional
+
+from fastapi.routing import APIRoute
+
+PROFILE_HEADER = b"x-crafty-profile"
+PROFILE_ID_HEADER = b"x-crafty-profile-id"
+
+logger = logging.getLogger(__name__)
+
+_active_profiler: ContextVar[Optional[cProfile.Profile]] = ContextVar(
+    "crafty_active_profiler", default=None
+)
+
+
+def call_profiled(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Call a function, profiling it if the current request was selected.
+
+    cProfile only sees the thread it was enabled in, so this must run in the
+    thread doing the work. Async endpoints that hand CPU work to the
+    threadpool should wrap that call with this function.
+
+    Args:
+        func: Function to call
+        *args: Positional arguments for the function
+        **kwargs: Keyword arguments for the function
+
+    Returns:
+        The function's return value
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        return func(*args, **kwargs)
+    profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+
+
+class ProfiledRoute(APIRoute):
+    """
+    Route class that runs synchronous endpoints under the request's profiler.
+
+    Sync endpoints are executed in FastAPI's threadpool, out of reach of a
+    profiler enabled in the middleware, so the endpoint itself is wrapped.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        if not inspect.iscoroutinefunction(endpoint):
+            original = endpoint
+
+            @functools.wraps(original)
+            def endpoint(*args, **kwargs):
+                return call_profiled(original, *args, **kwargs)
+
+        super().__init__(path, endpoint, **kwargs)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that selects requests for profiling and stores the artifacts."""
+
+    def __init__(
+        self,
+        app,
+        sample_rate: float = 0.0,
+        token: Optional[str] = None,
+        output_dir: str = "profiles",
+        path_prefixes: Iterable[str] = ("/python/", "/sql/"),
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.token = token.encode() if token else None
+        self.output_dir = output_dir
+        self.path_prefixes = tuple(path_prefixes)
+
+    def _selected(self, scope) -> bool:
+        """Decide whether a request should be profiled."""
+        if not scope["path"].startswith(self.path_prefixes):
+            return False
+        if self.token is not None:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return hmac.compare_digest(value, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._selected(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        profiler = cProfile.Profile()
+        context_token = _active_profiler.set(profiler)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER, profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _active_profiler.reset(context_token)
+            self._store(profiler, profile_id, scope)
+
+    def _store(self, profiler: cProfile.Profile, profile_id: str, scope) -> None:
+        """Write the pstats artifact for a profiled request."""
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            route = scope["path"].strip("/").replace("/", "_")
+            path = os.path.join(self.output_dir, f"{route}-{profile_id}.pstats")
+            profiler.dump_stats(path)
+            logger.info("Stored request profile %s at %s", profile_id, path)
+        except Exception:
+            logger.exception("Failed to store request profile %s", profile_id)
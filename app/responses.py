@@ -0,0 +1,30 @@
+"""
+Pre-serialized JSON responses.
+
+FastJSONResponse serializes its content with orjson when it is built, so an
+endpoint returning one skips FastAPI's jsonable_encoder and response model
+validation and does the serialization in the thread that ran the endpoint.
+"""
+
+import json
+from typing import Any
+import orjson
+from fastapi import Response
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson, or passed through if already bytes."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        try:
+            return orjson.dumps(content)
+        except TypeError:
+            # Integers beyond 64 bits and non-string keys; same output as
+            # FastAPI's JSONResponse
+            return json.dumps(
+                content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+            ).encode("utf-8")
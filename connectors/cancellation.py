@@ -0,0 +1,112 @@
+"""
+Cancellation of queries whose caller has gone away.
+
+A request runs inside a CancelScope, kept in a context variable so it
+follows the request into the threadpool. While a query runs, its connection
+is attached to the current scope; cancelling the scope (when the client
+disconnects) sends a cancel request to the backend of every attached
+connection, and queries started afterwards raise QueryCancelled at once.
+Code outside any scope, such as the snapshot scheduler, is never cancelled.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional, Set
+import psycopg
+from psycopg.errors import QueryCanceled
+
+# Reasons a query was cancelled, as reported in metrics
+STATEMENT_TIMEOUT = "statement_timeout"
+CLIENT_DISCONNECT = "client_disconnect"
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCancelled(Exception):
+    """Raised to a caller whose scope was cancelled before its query finished."""
+
+
+class CancelScope:
+    """Connections running queries on behalf of one caller, cancelled together."""
+
+    def __init__(self):
+        self.cancelled = False
+        self._connections: Set[psycopg.Connection] = set()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """Call a function when the scope is cancelled, at once if it already is."""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        """Cancel the queries running in this scope; blocks while the cancel requests are sent."""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+            connections = list(self._connections)
+        for callback in callbacks:
+            callback()
+        for conn in connections:
+            try:
+                conn.cancel_safe()
+            except Exception as e:
+                logger.warning("Failed to cancel query: %s", e)
+
+    @contextmanager
+    def running(self, conn: psycopg.Connection) -> Iterator[None]:
+        """Attach a connection to the scope while it runs a query."""
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled("The request was cancelled")
+            self._connections.add(conn)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+
+
+_current_scope: ContextVar[Optional[CancelScope]] = ContextVar(
+    "crafty_cancel_scope", default=None
+)
+
+
+def current_scope() -> Optional[CancelScope]:
+    """Get the cancel scope of the current request, if any."""
+    return _current_scope.get()
+
+
+@contextmanager
+def cancel_scope(scope: Optional[CancelScope]) -> Iterator[Optional[CancelScope]]:
+    """Make a scope current for the block; None runs the block outside any scope."""
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+
+
+@contextmanager
+def cancellable(conn: psycopg.Connection) -> Iterator[None]:
+    """Run a query on a connection that the current scope, if any, may cancel."""
+    scope = _current_scope.get()
+    if scope is None:
+        yield
+        return
+    with scope.running(conn):
+        yield
+
+
+def cancel_reason(error: QueryCanceled) -> str:
+    """Tell a statement timeout from a cancel request sent by a CancelScope."""
+    message = error.diag.message_primary or str(error)
+    return STATEMENT_TIMEOUT if "statement timeout" in message else CLIENT_DISCONNECT
@@ -5,19 +5,97 @@ Simple utilities for connecting to PostgreSQL database for running
 scripts and queries using psycopg for raw SQL.
 """
 
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 import psycopg
 import pandas as pd
 from psycopg.rows import dict_row
 from psycopg import OperationalError
+from psycopg.errors import QueryCanceled
+from psycopg_pool import ConnectionPool, PoolTimeout
 from app.config import config
+from app.metrics import (
+    DB_CONNECTION_ACQUIRE,
+    DB_PREPARED_EXECUTIONS,
+    DB_QUERY_CANCELLATIONS,
+    DB_QUERY_DURATION,
+    DB_QUERY_ERRORS,
+    DB_QUERY_ROWS,
+)
+from connectors.cancellation import cancel_reason, cancellable
+
+logger = logging.getLogger(__name__)
+
+# Metrics label used for queries that are not issued by a named service method
+ADHOC_QUERY = "adhoc"
+
+# COPY ... TO STDOUT sends about a row per block; copy_out gathers blocks into
+# chunks of at least this many bytes before yielding them
+COPY_CHUNK_SIZE = 256 * 1024
+
+# Sets statement_timeout until the end of the current transaction
+SET_STATEMENT_TIMEOUT = "SELECT set_config('statement_timeout', %s, true)"
+
+
+class CraftyConnection(psycopg.Connection):
+    """Connection that counts executions of named queries to report prepared statement reuse."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.query_executions: Dict[str, int] = {}
+
+
+def _configure_connection(conn: CraftyConnection):
+    """Apply the prepared statement settings to a new pooled connection."""
+    conn.prepare_threshold = config.prepare_threshold
+    if config.plan_cache_mode:
+        conn.execute(
+            "SELECT set_config('plan_cache_mode', %s, false)", (config.plan_cache_mode,)
+        )
+        conn.commit()
+
+
+# Latency in seconds, completion time and name of the last query run on
+# each database (keyed by host:port), for the health status
+_last_queries: Dict[str, Tuple[float, float, str]] = {}
+
+
+# Connection pools are shared by every Database instance in the process,
+# one per connection string
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(conninfo: str) -> ConnectionPool:
+    """Get the connection pool for a connection string, creating it on first use."""
+    pool = _pools.get(conninfo)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(conninfo)
+            if pool is None:
+                pool = ConnectionPool(
+                    conninfo,
+                    connection_class=CraftyConnection,
+                    kwargs={"row_factory": dict_row},
+                    configure=_configure_connection,
+                    min_size=config.pool_min_size,
+                    max_size=config.pool_max_size,
+                    timeout=config.pool_timeout,
+                    open=True,
+                )
+                _pools[conninfo] = pool
+    return pool
 
 
 class Database:
-    def __init__(self):
-        # Use the centralized configuration
+    def __init__(self, host: Optional[str] = None, port: Optional[str] = None):
+        # Use the centralized configuration; host and port select a replica
         db_config = config.database_config
-        self.host = db_config["host"]
-        self.port = db_config["port"]
+        self.host = host or db_config["host"]
+        self.port = port or db_config["port"]
         self.user = db_config["user"]
         self.password = db_config["password"]
         self.database = db_config["database"]
@@ -45,47 +123,305 @@ class Database:
             self._connection.close()
             self._connection = None
 
-    def execute_query(self, query: str, params: dict = None) -> dict:
-        """Execute SQL query and return raw results as dictionary."""
-        conn = self.get_connection()
+    @property
+    def pool(self) -> ConnectionPool:
+        """Get the shared connection pool for this database."""
+        return get_pool(self.connection_string)
+
+    @property
+    def name(self) -> str:
+        """Get the host:port this database is reached at, used as a metrics label."""
+        return f"{self.host}:{self.port}"
+
+    def _observe_duration(self, start: float, query_name: str):
+        """Record the duration of a query that started at the given perf_counter time."""
+        duration = time.perf_counter() - start
+        DB_QUERY_DURATION.observe(duration, query=query_name)
+        _last_queries[self.name] = (duration, time.time(), query_name)
+
+    def last_query(self) -> Optional[Dict[str, Any]]:
+        """
+        Get the latency of the last query this process ran on this database.
+
+        Returns:
+            Dictionary with the query name, its latency in milliseconds and
+            when it finished, or None if no query has run yet
+        """
+        last = _last_queries.get(self.name)
+        if last is None:
+            return None
+        duration, finished_at, query_name = last
+        return {
+            "query": query_name,
+            "latency_ms": round(duration * 1000, 3),
+            "finished_at": finished_at,
+        }
+
+    @contextmanager
+    def pooled_connection(
+        self, query_name: str = ADHOC_QUERY, timeout: Optional[float] = None
+    ) -> Iterator[CraftyConnection]:
+        """
+        Borrow a connection from the pool and record how long it took to acquire.
+
+        The transaction is committed when the block exits normally and rolled
+        back if it raises, then the connection goes back to the pool.
+
+        Args:
+            query_name: Name the acquisition is reported under in metrics
+            timeout: Seconds to wait for a connection, defaults to the pool timeout
+        """
+        start = time.perf_counter()
+        acquired = False
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(query, params or {})
-                result = cursor.fetchone()
-                return result if result else {}
-        except Exception as e:
-            print(f"Query execution failed: {e}")
-            raise
-        finally:
-            conn.close()
+            with self.pool.connection(timeout=timeout) as conn:
+                acquired = True
+                DB_CONNECTION_ACQUIRE.observe(time.perf_counter() - start, query=query_name)
+                yield conn
+        except (PoolTimeout, OperationalError) as e:
+            if acquired:
+                raise
+            DB_QUERY_ERRORS.inc(query=query_name, error=type(e).__name__)
+            raise ConnectionError(f"Failed to get database connection: {e}")
+
+    def execute_query(
+        self, query: str, params: dict = None, query_name: str = ADHOC_QUERY
+    ) -> dict:
+        """Execute SQL query and return raw results as dictionary."""
+        with self.pooled_connection(query_name) as conn:
+            start = time.perf_counter()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, params or {})
+                    result = cursor.fetchone()
+                    DB_QUERY_ROWS.observe(1 if result else 0, query=query_name)
+                    return result if result else {}
+            except Exception as e:
+                logger.error("Query execution failed: %s", e)
+                DB_QUERY_ERRORS.inc(query=query_name, error=type(e).__name__)
+                raise
+            finally:
+                self._observe_duration(start, query_name)
 
-    def execute_insert(self, query: str, params: dict = None) -> bool:
+    def execute_insert(
+        self, query: str, params: dict = None, query_name: str = ADHOC_QUERY
+    ) -> bool:
         """Execute INSERT query and return success status."""
-        conn = self.get_connection()
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(query, params or {})
-                conn.commit()
-                return True
-        except Exception as e:
-            print(f"Insert failed: {e}")
-            conn.rollback()
-            return False
-        finally:
-            conn.close()
+        with self.pooled_connection(query_name) as conn:
+            start = time.perf_counter()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, params or {})
+                    conn.commit()
+                    return True
+            except Exception as e:
+                logger.error("Insert failed: %s", e)
+                DB_QUERY_ERRORS.inc(query=query_name, error=type(e).__name__)
+                conn.rollback()
+                return False
+            finally:
+                self._observe_duration(start, query_name)
 
-    def execute_query_df(self, query: str, params: dict = None) -> pd.DataFrame:
+    def execute_query_df(
+        self, query: str, params: dict = None, query_name: str = ADHOC_QUERY
+    ) -> pd.DataFrame:
         """Execute SQL query and return results as a pandas DataFrame."""
-        conn = self.get_connection()
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(query, params or {})
-                return pd.DataFrame(cursor.fetchall())
-        except Exception as e:
-            print(f"DataFrame query failed: {e}")
-            raise
-        finally:
-            conn.close()
+        with self.pooled_connection(query_name) as conn:
+            start = time.perf_counter()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, params or {})
+                    rows = cursor.fetchall()
+                    DB_QUERY_ROWS.observe(len(rows), query=query_name)
+                    return pd.DataFrame(rows)
+            except Exception as e:
+                logger.error("DataFrame query failed: %s", e)
+                DB_QUERY_ERRORS.inc(query=query_name, error=type(e).__name__)
+                raise
+            finally:
+                self._observe_duration(start, query_name)
+
+    def execute_prepared(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        query_name: str = ADHOC_QUERY,
+        prepare: Optional[bool] = None,
+        statement_timeout_ms: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Execute SQL query as a server-side prepared statement and return all rows.
+
+        The query is cancelled if the current request's cancel scope is (see
+        connectors/cancellation.py).
+
+        Args:
+            query: SQL query to execute
+            params: Optional parameters for the query
+            query_name: Name the query is reported under in metrics
+            prepare: True prepares on first execution, False never prepares and
+                None prepares once the connection's prepare threshold is reached
+            statement_timeout_ms: Cancel the query after this many milliseconds,
+                None keeps the server's statement_timeout
+
+        Returns:
+            Result rows as dictionaries
+        """
+        with self.pooled_connection(query_name) as conn:
+            executions = conn.query_executions.get(query_name, 0)
+            conn.query_executions[query_name] = executions + 1
+            DB_PREPARED_EXECUTIONS.inc(
+                query=query_name,
+                prepared=str(_reuses_prepared(conn, prepare, executions)).lower(),
+            )
+
+            start = time.perf_counter()
+            try:
+                with cancellable(conn), conn.cursor() as cursor:
+                    if statement_timeout_ms is None:
+                        cursor.execute(query, params or {}, prepare=prepare)
+                    else:
+                        # Sent in one round-trip with the query
+                        with conn.pipeline():
+                            conn.execute(SET_STATEMENT_TIMEOUT, (str(statement_timeout_ms),))
+                            cursor.execute(query, params or {}, prepare=prepare)
+                    rows = cursor.fetchall()
+                    DB_QUERY_ROWS.observe(len(rows), query=query_name)
+                    return rows
+            except Exception as e:
+                logger.error("Prepared query failed: %s", e)
+                _count_error(e, query_name)
+                raise
+            finally:
+                self._observe_duration(start, query_name)
+
+    def execute_pipeline(
+        self,
+        statements: List[Tuple[str, Dict[str, Any], str, Optional[bool], Optional[int]]],
+        pipeline_name: str = ADHOC_QUERY,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Execute several queries on one connection in pipeline mode.
+
+        All statements are sent before any result is read, so the batch costs a
+        single network round-trip instead of one per query.
+
+        Args:
+            statements: (query, params, query_name, prepare, statement_timeout_ms)
+                for each statement, see execute_prepared
+            pipeline_name: Name the whole batch is reported under in metrics
+
+        Returns:
+            Result rows for each statement, in order
+        """
+        with self.pooled_connection(pipeline_name) as conn:
+            start = time.perf_counter()
+            try:
+                with cancellable(conn), conn.pipeline() as pipeline:
+                    cursors = []
+                    for query, params, query_name, prepare, timeout_ms in statements:
+                        executions = conn.query_executions.get(query_name, 0)
+                        conn.query_executions[query_name] = executions + 1
+                        DB_PREPARED_EXECUTIONS.inc(
+                            query=query_name,
+                            prepared=str(_reuses_prepared(conn, prepare, executions)).lower(),
+                        )
+                        if timeout_ms is not None:
+                            conn.execute(SET_STATEMENT_TIMEOUT, (str(timeout_ms),))
+                        cursor = conn.cursor()
+                        cursor.execute(query, params or {}, prepare=prepare)
+                        cursors.append(cursor)
+                    pipeline.sync()
+
+                    results = []
+                    for cursor, (_, _, query_name, _, _) in zip(cursors, statements):
+                        rows = cursor.fetchall()
+                        DB_QUERY_ROWS.observe(len(rows), query=query_name)
+                        results.append(rows)
+                        cursor.close()
+                    return results
+            except Exception as e:
+                logger.error("Pipeline failed: %s", e)
+                _count_error(e, pipeline_name)
+                raise
+            finally:
+                self._observe_duration(start, pipeline_name)
+
+    def copy_out(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        query_name: str = ADHOC_QUERY,
+        chunk_size: int = COPY_CHUNK_SIZE,
+    ) -> Iterator[bytes]:
+        """
+        Stream the output of a COPY ... TO STDOUT statement.
+
+        The connection is held until the generator is exhausted or closed, so
+        the caller should consume it promptly.
+
+        Args:
+            query: COPY statement writing to STDOUT
+            params: Optional parameters, bound client-side
+            query_name: Name the export is reported under in metrics
+            chunk_size: Bytes gathered from the server's blocks before each
+                chunk is yielded; the last chunk may be smaller
+
+        Yields:
+            Chunks of data, in the order the server sent it
+        """
+        with self.pooled_connection(query_name) as conn:
+            start = time.perf_counter()
+            try:
+                with conn.cursor() as cursor:
+                    with cursor.copy(query, params) as copy:
+                        chunk = bytearray()
+                        for block in copy:
+                            chunk += block
+                            if len(chunk) >= chunk_size:
+                                yield bytes(chunk)
+                                chunk.clear()
+                        if chunk:
+                            yield bytes(chunk)
+                    DB_QUERY_ROWS.observe(max(cursor.rowcount, 0), query=query_name)
+            except Exception as e:
+                logger.error("Copy failed: %s", e)
+                DB_QUERY_ERRORS.inc(query=query_name, error=type(e).__name__)
+                raise
+            finally:
+                self._observe_duration(start, query_name)
+
+    def copy_in(
+        self, query: str, rows: Iterable[Sequence[Any]], query_name: str = ADHOC_QUERY
+    ) -> int:
+        """
+        Load rows with a COPY ... FROM STDIN statement in one transaction.
+
+        Args:
+            query: COPY statement reading from STDIN
+            rows: Rows of values in the order of the statement's columns
+            query_name: Name the load is reported under in metrics
+
+        Returns:
+            Number of rows written
+        """
+        with self.pooled_connection(query_name) as conn:
+            start = time.perf_counter()
+            try:
+                with conn.cursor() as cursor:
+                    with cursor.copy(query) as copy:
+                        for row in rows:
+                            copy.write_row(row)
+                    written = max(cursor.rowcount, 0)
+                conn.commit()
+                DB_QUERY_ROWS.observe(written, query=query_name)
+                return written
+            except Exception as e:
+                logger.error("Copy failed: %s", e)
+                DB_QUERY_ERRORS.inc(query=query_name, error=type(e).__name__)
+                raise
+            finally:
+                self._observe_duration(start, query_name)
 
     def test_connection(self) -> bool:
         """Test database connection with proper error handling."""
@@ -94,11 +430,31 @@ class Database:
             with conn.cursor() as cursor:
                 cursor.execute("SELECT 1")
                 cursor.fetchone()
-                print("Database connection successful!")
+                logger.info("Database connection successful")
                 return True
         except Exception as e:
-            print(f"Database connection failed: {e}")
+            logger.error("Database connection failed: %s", e)
             return False
         finally:
             if conn:
                 conn.close()
+
+
+def _count_error(error: Exception, query_name: str):
+    """Count a failed query, and its cancellation if it was cancelled."""
+    DB_QUERY_ERRORS.inc(query=query_name, error=type(error).__name__)
+    if isinstance(error, QueryCanceled):
+        DB_QUERY_CANCELLATIONS.inc(query=query_name, reason=cancel_reason(error))
+
+
+def _reuses_prepared(conn: CraftyConnection, prepare: Optional[bool], executions: int) -> bool:
+    """
+    Tell whether an execution reuses a statement already prepared on the connection.
+
+    Mirrors psycopg's policy: a statement is prepared on the execution after
+    prepare_threshold previous ones (or on the first one when prepare is True).
+    """
+    if prepare is False or conn.prepare_threshold is None:
+        return False
+    threshold = 0 if prepare else conn.prepare_threshold
+    return executions > threshold
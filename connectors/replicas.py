@@ -0,0 +1,317 @@
+"""
+Read-replica routing for Crafty CRM.
+
+Read-only queries are spread over the configured read replicas, round-robin
+or to the replica with the fewest reads in flight. A background thread
+checks each replica's health, WAL receiver and replication lag every check
+interval, so routing a read never waits on a check. Replicas that are
+unreachable, no longer streaming from the primary, lag more than the
+allowed maximum or have not been checked recently are skipped, and reads
+fall back to the primary when no replica is usable or the chosen replica
+fails mid-query.
+"""
+
+import logging
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, TypeVar
+from psycopg import OperationalError
+from psycopg.errors import QueryCanceled
+from app.config import config
+from app.metrics import (
+    DB_READ_ROUTES,
+    DB_REPLICA_FAILOVERS,
+    DB_REPLICA_HEALTHY,
+    DB_REPLICA_LAG,
+)
+from connectors.database import Database
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ROUND_ROBIN = "round_robin"
+LEAST_CONNECTIONS = "least_connections"
+STRATEGIES = (ROUND_ROBIN, LEAST_CONNECTIONS)
+
+# Metrics label and query name used by the replica health check
+HEALTH_CHECK_QUERY = "replica_health_check"
+
+# Seconds a health check waits for a replica connection
+HEALTH_CHECK_TIMEOUT = 2.0
+
+# A check older than this many intervals (the checker thread died, or a
+# Lambda execution environment was frozen) no longer lets a replica serve
+STALE_INTERVALS = 3
+
+# Having replayed everything received only means no lag while the WAL
+# receiver is still streaming from the primary; a disconnected standby also
+# has equal LSNs. So the receiver's state and the age of its last message
+# are reported alongside, and lag is zero when caught up (an idle primary
+# would otherwise make the replay timestamp look old) and on a server that
+# is not a standby at all. Reading pg_stat_wal_receiver needs superuser or
+# pg_read_all_stats.
+REPLICA_LAG_SQL = """
+SELECT
+    pg_is_in_recovery() AS in_recovery,
+    receiver.status AS receiver_status,
+    EXTRACT(EPOCH FROM now() - receiver.last_msg_receipt_time)::float AS receipt_age_seconds,
+    CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END::float AS lag_seconds
+FROM
+    (SELECT 1) standby
+    LEFT JOIN pg_stat_wal_receiver receiver ON true
+"""
+
+# The primary sends a keepalive at least this often while the receiver is
+# connected (half of the default wal_sender_timeout)
+KEEPALIVE_SECONDS = 30.0
+
+
+class Replica:
+    """A read replica and the result of its last health check."""
+
+    def __init__(self, database: Database):
+        self.database = database
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.checked_at = 0.0
+        self.in_flight = 0
+
+    @property
+    def name(self) -> str:
+        return self.database.name
+
+    def as_dict(self) -> dict:
+        return {
+            "replica": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "in_flight": self.in_flight,
+            "last_error": self.last_error,
+        }
+
+
+class ReplicaRouter:
+    """Routes read-only work to a healthy replica, falling back to the primary."""
+
+    def __init__(
+        self,
+        primary: Database,
+        replicas: List[Database],
+        strategy: str = ROUND_ROBIN,
+        max_lag_seconds: float = 30.0,
+        check_interval: float = 10.0,
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown replica strategy {strategy}, expected one of {STRATEGIES}")
+        self.primary = primary
+        self.replicas = [Replica(database) for database in replicas]
+        self.strategy = strategy
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._round_robin = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the background replica checker thread if there are replicas and it is not running."""
+        if not self.replicas:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="replica-checker", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background replica checker thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=HEALTH_CHECK_TIMEOUT * max(len(self.replicas), 1) + 1)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check(force=True)
+            self._stop.wait(self.check_interval)
+
+    def check(self, force: bool = False):
+        """
+        Refresh the health and lag of replicas whose last check is stale.
+
+        Only one thread checks at a time; others keep routing on the previous
+        results instead of waiting.
+
+        Args:
+            force: Check every replica regardless of when it was last checked
+        """
+        if not self._check_lock.acquire(blocking=force):
+            return
+        try:
+            now = time.monotonic()
+            for replica in self.replicas:
+                if force or now - replica.checked_at >= self.check_interval:
+                    self._check_replica(replica)
+        finally:
+            self._check_lock.release()
+
+    def _check_replica(self, replica: Replica):
+        """Run the lag query on a replica and record whether it may serve reads."""
+        try:
+            with replica.database.pooled_connection(
+                HEALTH_CHECK_QUERY, timeout=HEALTH_CHECK_TIMEOUT
+            ) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(REPLICA_LAG_SQL)
+                    row = cursor.fetchone()
+            replica.lag_seconds = row["lag_seconds"]
+            replica.last_error = _replication_problem(row, self.max_lag_seconds)
+            replica.healthy = replica.last_error is None
+        except (ConnectionError, OperationalError) as e:
+            replica.healthy = False
+            replica.last_error = str(e)
+        replica.checked_at = time.monotonic()
+
+        if replica.last_error:
+            logger.warning(
+                "Replica %s is not serving reads: %s", replica.name, replica.last_error
+            )
+        if replica.lag_seconds is not None:
+            DB_REPLICA_LAG.set(replica.lag_seconds, replica=replica.name)
+        DB_REPLICA_HEALTHY.set(1 if replica.healthy else 0, replica=replica.name)
+
+    def _choose(self) -> Optional[Replica]:
+        """Pick a healthy, recently checked replica according to the strategy, None if there is none."""
+        if not self.replicas:
+            return None
+        self.start()
+        checked_since = time.monotonic() - STALE_INTERVALS * self.check_interval
+        with self._lock:
+            healthy = [
+                replica
+                for replica in self.replicas
+                if replica.healthy and replica.checked_at >= checked_since
+            ]
+            if not healthy:
+                return None
+            if self.strategy == LEAST_CONNECTIONS:
+                replica = min(healthy, key=lambda r: r.in_flight)
+            else:
+                replica = healthy[next(self._round_robin) % len(healthy)]
+            replica.in_flight += 1
+            return replica
+
+    @contextmanager
+    def _borrow(self, replica: Replica) -> Iterator[Replica]:
+        try:
+            yield replica
+        finally:
+            with self._lock:
+                replica.in_flight -= 1
+
+    def run_read(self, operation: Callable[[Database], T]) -> T:
+        """
+        Run a read-only operation on a replica, or on the primary if none is usable.
+
+        If the replica cannot be reached or drops the connection the replica is
+        marked unhealthy and the operation is retried once on the primary.
+        Query errors, including statement timeouts, are raised as they are.
+
+        Args:
+            operation: Called with the Database to read from
+
+        Returns:
+            Whatever the operation returns
+        """
+        replica = self._choose()
+        if replica is None:
+            DB_READ_ROUTES.inc(target="primary")
+            return operation(self.primary)
+
+        with self._borrow(replica):
+            DB_READ_ROUTES.inc(target=replica.name)
+            try:
+                return operation(replica.database)
+            except (ConnectionError, OperationalError) as e:
+                if isinstance(e, QueryCanceled):
+                    raise
+                replica.healthy = False
+                replica.last_error = str(e)
+                DB_REPLICA_HEALTHY.set(0, replica=replica.name)
+                DB_REPLICA_FAILOVERS.inc(replica=replica.name, error=type(e).__name__)
+                logger.warning("Replica %s failed, reading from the primary: %s", replica.name, e)
+
+        DB_READ_ROUTES.inc(target="primary")
+        return operation(self.primary)
+
+    @contextmanager
+    def reading(self) -> Iterator[Database]:
+        """
+        Borrow a replica, or the primary if none is usable, for a long read.
+
+        Unlike run_read there is no failover: a stream that already sent data
+        cannot be restarted on another server.
+        """
+        replica = self._choose()
+        if replica is None:
+            DB_READ_ROUTES.inc(target="primary")
+            yield self.primary
+            return
+        with self._borrow(replica):
+            DB_READ_ROUTES.inc(target=replica.name)
+            yield replica.database
+
+    def status(self) -> List[dict]:
+        """Get the last health check result of every replica."""
+        return [replica.as_dict() for replica in self.replicas]
+
+
+def _replication_problem(row: dict, max_lag_seconds: float) -> Optional[str]:
+    """Why a replica's lag query result keeps it from serving reads, None if it may."""
+    if row["in_recovery"]:
+        if row["receiver_status"] is None:
+            return "WAL receiver is not running"
+        if row["receiver_status"] != "streaming":
+            return f"WAL receiver is {row['receiver_status']}, not streaming"
+        receipt_age = row["receipt_age_seconds"]
+        if receipt_age is None or receipt_age > KEEPALIVE_SECONDS + max_lag_seconds:
+            return f"no message from the primary for {receipt_age or 0:.0f}s"
+    if row["lag_seconds"] > max_lag_seconds:
+        return f"lag {row['lag_seconds']:.1f}s exceeds {max_lag_seconds}s"
+    return None
+
+
+_router: Optional[ReplicaRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_replica_router() -> ReplicaRouter:
+    """Get the process-wide replica router, built from the configuration on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ReplicaRouter(
+                    Database(),
+                    [
+                        Database(replica["host"], replica["port"])
+                        for replica in config.database_config["replicas"]
+                    ],
+                    strategy=config.replica_strategy,
+                    max_lag_seconds=config.replica_max_lag_seconds,
+                    check_interval=config.replica_check_interval,
+                )
+    return _router
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Allow streaming replication connections so the optional replica service
+# (docker-compose --profile replica) can clone and follow this database.
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -1,17 +1,18 @@
--- Database initialization script for Crafty CRM
--- This script creates the basic schema and tables
+-- Migration 0001: initial schema for Crafty CRM
+-- Creates the basic schema and tables. Uses IF NOT EXISTS so databases that
+-- were initialized by the old one-shot init.sql can adopt the migration history.
 
 -- Create extensions if needed
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
 -- Create tables
-CREATE TABLE companies (
+CREATE TABLE IF NOT EXISTS companies (
     Company_id SERIAL PRIMARY KEY,
     Company_name VARCHAR(255) NOT NULL,
     Created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE TABLE contacts (
+CREATE TABLE IF NOT EXISTS contacts (
     Contact_id SERIAL PRIMARY KEY,
     Contact_name VARCHAR(255) NOT NULL,
     Email VARCHAR(255),
@@ -19,7 +20,7 @@ CREATE TABLE contacts (
     Created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE TABLE client_engagements (
+CREATE TABLE IF NOT EXISTS client_engagements (
     Engagement_id SERIAL PRIMARY KEY,
     Timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     Type VARCHAR(32),
@@ -27,7 +28,7 @@ CREATE TABLE client_engagements (
     Company_id INTEGER REFERENCES companies(Company_id)
 );
 
-CREATE TABLE support_tickets (
+CREATE TABLE IF NOT EXISTS support_tickets (
     Ticket_id SERIAL PRIMARY KEY,
     Created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     Closed_at TIMESTAMP,
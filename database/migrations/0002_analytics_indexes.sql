@@ -0,0 +1,38 @@
+-- Migration 0002: analytics-tuned index set
+-- Replaces the single-column company indexes with composites that also
+-- serve the time-window filters, and adds partial and BRIN indexes for the
+-- analytics queries in services/sql_query_services.py.
+
+-- Per-company time-window scans and the rolling-window self-join
+-- (Company_id equality plus a Timestamp range on the inner side)
+CREATE INDEX IF NOT EXISTS idx_engagements_company_timestamp
+    ON client_engagements (Company_id, Timestamp);
+CREATE INDEX IF NOT EXISTS idx_tickets_company_created_at
+    ON support_tickets (Company_id, Created_at);
+
+-- The composites lead with Company_id, so the foreign-key lookups they
+-- replaced are still index-backed
+DROP INDEX IF EXISTS idx_engagements_company_id;
+DROP INDEX IF EXISTS idx_tickets_company_id;
+
+-- Average resolution time only reads closed tickets; the predicate matches
+-- the query so the planner can use an index-only scan
+CREATE INDEX IF NOT EXISTS idx_tickets_closed_by_company
+    ON support_tickets (Company_id) INCLUDE (Created_at, Closed_at)
+    WHERE Status = 'Closed' AND Closed_at IS NOT NULL;
+
+-- The rolling-window bucket query counts open tickets per company
+CREATE INDEX IF NOT EXISTS idx_tickets_open_by_company
+    ON support_tickets (Company_id)
+    WHERE Status = 'Open';
+
+-- Status has a handful of values; the partial indexes above cover the
+-- statuses the analytics filter on
+DROP INDEX IF EXISTS idx_tickets_status;
+
+-- Both tables are append-mostly, so insertion order tracks the time columns
+-- and block-range indexes stay tiny while pruning the recent-window scans
+CREATE INDEX IF NOT EXISTS brin_engagements_timestamp
+    ON client_engagements USING BRIN (Timestamp);
+CREATE INDEX IF NOT EXISTS brin_tickets_created_at
+    ON support_tickets USING BRIN (Created_at);
@@ -0,0 +1,195 @@
+-- Migration 0003: monthly range partitioning of the time-series tables
+-- client_engagements is partitioned on Timestamp and support_tickets on
+-- Created_at, so the recent-window analytics only scan the latest months.
+-- Each table gets a DEFAULT partition that catches rows outside the
+-- created months; crafty_maintain_partitions() creates future partitions
+-- (moving any matching rows out of the default partition) and detaches
+-- partitions older than the retention window.
+
+-- Create the partition of a table for the month starting at month_start.
+-- Returns false if the partition already exists.
+CREATE OR REPLACE FUNCTION crafty_create_monthly_partition(parent TEXT, month_start DATE)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    partition_name TEXT := format('%s_p%s', parent, to_char(month_start, 'YYYY_MM'));
+    range_start TIMESTAMP := date_trunc('month', month_start);
+    range_end TIMESTAMP := date_trunc('month', month_start) + INTERVAL '1 month';
+    key_column TEXT;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+
+    SELECT a.attname INTO key_column
+    FROM pg_partitioned_table pt
+    JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+    WHERE pt.partrelid = parent::regclass;
+
+    -- Build the partition detached so rows that already landed in the default
+    -- partition for this month can be moved into it before it is attached
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        partition_name, parent
+    );
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM %I WHERE %I >= $1 AND %I < $2 RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        parent || '_default', key_column, key_column, partition_name
+    ) USING range_start, range_end;
+    EXECUTE format(
+        'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        parent, partition_name, range_start, range_end
+    );
+    RETURN TRUE;
+END;
+$$;
+
+-- Create partitions from the current month to months_ahead months out and,
+-- when retain_months is set, detach monthly partitions that ended more than
+-- retain_months months ago. Detached partitions are kept as plain tables.
+CREATE OR REPLACE FUNCTION crafty_maintain_partitions(
+    parent TEXT,
+    months_ahead INTEGER DEFAULT 3,
+    retain_months INTEGER DEFAULT NULL
+)
+RETURNS TABLE (action TEXT, partition_name TEXT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start TIMESTAMP;
+    cutoff DATE;
+    child RECORD;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(
+            date_trunc('month', LOCALTIMESTAMP),
+            date_trunc('month', LOCALTIMESTAMP) + make_interval(months => months_ahead),
+            INTERVAL '1 month'
+        )
+    LOOP
+        IF crafty_create_monthly_partition(parent, month_start::date) THEN
+            action := 'created';
+            partition_name := format('%s_p%s', parent, to_char(month_start, 'YYYY_MM'));
+            RETURN NEXT;
+        END IF;
+    END LOOP;
+
+    IF retain_months IS NULL THEN
+        RETURN;
+    END IF;
+
+    cutoff := date_trunc('month', LOCALTIMESTAMP) - make_interval(months => retain_months);
+    FOR child IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent::regclass
+          AND c.relname ~ ('^' || parent || '_p\d{4}_\d{2}$')
+          AND to_date(right(c.relname, 7), 'YYYY_MM') + INTERVAL '1 month' <= cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent, child.relname);
+        action := 'detached';
+        partition_name := child.relname;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$;
+
+-- client_engagements, partitioned on Timestamp
+ALTER TABLE client_engagements RENAME TO client_engagements_unpartitioned;
+ALTER INDEX client_engagements_pkey RENAME TO client_engagements_unpartitioned_pkey;
+ALTER SEQUENCE client_engagements_engagement_id_seq OWNED BY NONE;
+
+-- The partition key has to be part of the primary key, which makes it NOT NULL
+CREATE TABLE client_engagements (
+    Engagement_id INTEGER NOT NULL DEFAULT nextval('client_engagements_engagement_id_seq'),
+    Timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    Type VARCHAR(32),
+    Contact_id INTEGER REFERENCES contacts(Contact_id),
+    Company_id INTEGER REFERENCES companies(Company_id),
+    PRIMARY KEY (Engagement_id, Timestamp)
+) PARTITION BY RANGE (Timestamp);
+ALTER SEQUENCE client_engagements_engagement_id_seq OWNED BY client_engagements.Engagement_id;
+CREATE TABLE client_engagements_default PARTITION OF client_engagements DEFAULT;
+
+SELECT crafty_create_monthly_partition('client_engagements', month_start::date)
+FROM generate_series(
+    date_trunc('month', LEAST(
+        (SELECT MIN(Timestamp) FROM client_engagements_unpartitioned),
+        LOCALTIMESTAMP - INTERVAL '12 months'
+    )),
+    date_trunc('month', LOCALTIMESTAMP + INTERVAL '3 months'),
+    INTERVAL '1 month'
+) AS month_start;
+
+-- Rows without a timestamp are kept, in the default partition
+INSERT INTO client_engagements (Engagement_id, Timestamp, Type, Contact_id, Company_id)
+SELECT Engagement_id, COALESCE(Timestamp, '-infinity'), Type, Contact_id, Company_id
+FROM client_engagements_unpartitioned;
+
+DROP TABLE client_engagements_unpartitioned;
+
+CREATE INDEX IF NOT EXISTS idx_engagements_contact_id
+    ON client_engagements (Contact_id);
+CREATE INDEX IF NOT EXISTS idx_engagements_company_timestamp
+    ON client_engagements (Company_id, Timestamp);
+CREATE INDEX IF NOT EXISTS brin_engagements_timestamp
+    ON client_engagements USING BRIN (Timestamp);
+
+-- support_tickets, partitioned on Created_at
+ALTER TABLE support_tickets RENAME TO support_tickets_unpartitioned;
+ALTER INDEX support_tickets_pkey RENAME TO support_tickets_unpartitioned_pkey;
+ALTER SEQUENCE support_tickets_ticket_id_seq OWNED BY NONE;
+
+CREATE TABLE support_tickets (
+    Ticket_id INTEGER NOT NULL DEFAULT nextval('support_tickets_ticket_id_seq'),
+    Created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    Closed_at TIMESTAMP,
+    Status VARCHAR(32) DEFAULT 'Open',
+    Subject VARCHAR(500),
+    Company_id INTEGER REFERENCES companies(Company_id),
+    Contact_id INTEGER REFERENCES contacts(Contact_id),
+    Properties JSONB,
+    PRIMARY KEY (Ticket_id, Created_at)
+) PARTITION BY RANGE (Created_at);
+ALTER SEQUENCE support_tickets_ticket_id_seq OWNED BY support_tickets.Ticket_id;
+CREATE TABLE support_tickets_default PARTITION OF support_tickets DEFAULT;
+
+SELECT crafty_create_monthly_partition('support_tickets', month_start::date)
+FROM generate_series(
+    date_trunc('month', LEAST(
+        (SELECT MIN(Created_at) FROM support_tickets_unpartitioned),
+        LOCALTIMESTAMP - INTERVAL '12 months'
+    )),
+    date_trunc('month', LOCALTIMESTAMP + INTERVAL '3 months'),
+    INTERVAL '1 month'
+) AS month_start;
+
+INSERT INTO support_tickets (
+    Ticket_id, Created_at, Closed_at, Status, Subject, Company_id, Contact_id, Properties
+)
+SELECT
+    Ticket_id, COALESCE(Created_at, '-infinity'), Closed_at, Status, Subject,
+    Company_id, Contact_id, Properties
+FROM support_tickets_unpartitioned;
+
+DROP TABLE support_tickets_unpartitioned;
+
+CREATE INDEX IF NOT EXISTS idx_tickets_contact_id
+    ON support_tickets (Contact_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_company_created_at
+    ON support_tickets (Company_id, Created_at);
+CREATE INDEX IF NOT EXISTS idx_tickets_closed_by_company
+    ON support_tickets (Company_id) INCLUDE (Created_at, Closed_at)
+    WHERE Status = 'Closed' AND Closed_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_tickets_open_by_company
+    ON support_tickets (Company_id)
+    WHERE Status = 'Open';
+CREATE INDEX IF NOT EXISTS brin_tickets_created_at
+    ON support_tickets USING BRIN (Created_at);
+
+ANALYZE client_engagements;
+ANALYZE support_tickets;
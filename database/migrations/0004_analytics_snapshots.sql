@@ -0,0 +1,11 @@
+-- Migration 0004: precomputed analytics snapshots
+-- The snapshot scheduler stores the latest result of each analytic here so
+-- every process (and the scheduled Lambda refresh) shares one copy instead
+-- of recomputing it.
+
+CREATE TABLE IF NOT EXISTS analytics_snapshots (
+    Name VARCHAR(255) PRIMARY KEY,
+    Result JSONB NOT NULL,
+    Refreshed_at TIMESTAMPTZ NOT NULL,
+    Duration_ms DOUBLE PRECISION NOT NULL
+);
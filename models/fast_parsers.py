@@ -0,0 +1,144 @@
+"""
+Fast-path request parsing for the Python question routes.
+
+The raw request body is decoded with orjson and, when it has the shape the
+services depend on, used as is instead of building the pydantic models.
+Anything else falls back to the regular path: the body is decoded with the
+standard library and validated into the pydantic model, so clients get the
+same input, and the same 422, either way. That covers bodies orjson cannot
+decode (invalid JSON, NaN and Infinity, which the standard library accepts),
+integers orjson could only read as floats, and input that fails validation.
+"""
+
+import json
+from typing import Any, List, NamedTuple, Type, Union
+import orjson
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from models.input_models import QuestionOneInput, QuestionTwoInput
+
+# orjson reads integers outside [-2**63, 2**64) as floats instead of failing,
+# and a float read from just below -2**63 rounds to it
+_INT_MIN = -(2**63)
+_INT_MAX = 2**64 - 1
+
+_UNDECODED = object()
+
+
+class FastQuestionOneInput(NamedTuple):
+    """Stand-in for QuestionOneInput with the same attributes."""
+
+    Type: List[str]
+
+
+class FastQuestionTwoInput(NamedTuple):
+    """Stand-in for QuestionTwoInput with the same attributes."""
+
+    dictionary: dict
+    delimiter: str = "."
+    parent_key: str = ""
+
+
+def _decode(body: bytes) -> Any:
+    """Decode a body with orjson, _UNDECODED if it cannot."""
+    try:
+        return orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return _UNDECODED
+
+
+def _has_overflowed_integer(value: Any) -> bool:
+    """Check if a decoded value holds a float that orjson read from an integer beyond 64 bits."""
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        kind = type(item)
+        if kind is dict:
+            stack.extend(item.values())
+        elif kind is list:
+            stack.extend(item)
+        elif kind is float and not _INT_MIN < item <= _INT_MAX and item.is_integer():
+            # Also true of a literal like 1e20, which the regular path decodes
+            # to the same float, so falling back is merely slower
+            return True
+    return False
+
+
+def _load_standard(body: bytes) -> Any:
+    """Decode a body with the standard library, as the regular path does."""
+    try:
+        return json.loads(body)
+    except json.JSONDecodeError as e:
+        raise RequestValidationError(
+            [
+                {
+                    "type": "json_invalid",
+                    "loc": ("body", e.pos),
+                    "msg": "JSON decode error",
+                    "input": {},
+                    "ctx": {"error": e.msg},
+                }
+            ]
+        )
+
+
+def validate_body(model: Type[BaseModel], body: bytes) -> BaseModel:
+    """Decode and validate a body the regular way, raising the regular path's errors."""
+    data = _load_standard(body) if body else None
+    if data is None:
+        # FastAPI treats a null body like a missing one
+        raise RequestValidationError(
+            [{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}]
+        )
+    try:
+        # FastAPI validates bodies from attributes too, which words some errors differently
+        return model.model_validate(data, from_attributes=True)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
+
+def parse_question_one(body: bytes) -> Union[FastQuestionOneInput, QuestionOneInput]:
+    """
+    Parse and validate a QuestionOneInput body.
+
+    Args:
+        body: Raw JSON request body
+
+    Returns:
+        The validated input
+    """
+    data = _decode(body)
+    if type(data) is dict:
+        types = data.get("Type")
+        # JSON only produces exact str instances, so checking the set of
+        # element types is enough; strings cannot hold overflowed integers
+        if type(types) is list and set(map(type, types)) <= {str}:
+            return FastQuestionOneInput(types)
+    return validate_body(QuestionOneInput, body)
+
+
+def parse_question_two(body: bytes) -> Union[FastQuestionTwoInput, QuestionTwoInput]:
+    """
+    Parse and validate a QuestionTwoInput body.
+
+    Args:
+        body: Raw JSON request body
+
+    Returns:
+        The validated input
+    """
+    data = _decode(body)
+    if type(data) is dict:
+        dictionary = data.get("dictionary")
+        delimiter = data.get("delimiter", ".")
+        parent_key = data.get("parent_key", "")
+        if (
+            type(dictionary) is dict
+            and type(delimiter) is str
+            and type(parent_key) is str
+            and not _has_overflowed_integer(dictionary)
+        ):
+            return FastQuestionTwoInput(dictionary, delimiter, parent_key)
+    return validate_body(QuestionTwoInput, body)
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel, Field
 
 
 class QuestionOneInput(BaseModel):
@@ -9,3 +11,24 @@ class QuestionTwoInput(BaseModel):
     dictionary: dict
     delimiter: str = "."
     parent_key: str = ""
+
+
+class EngagementRecord(BaseModel):
+    """A client engagement to ingest; the timestamp defaults to now."""
+
+    timestamp: datetime = Field(default_factory=datetime.now)
+    type: Optional[str] = Field(None, max_length=32)
+    contact_id: Optional[int] = None
+    company_id: Optional[int] = None
+
+
+class TicketRecord(BaseModel):
+    """A support ticket to ingest; it is created now and Open by default."""
+
+    created_at: datetime = Field(default_factory=datetime.now)
+    closed_at: Optional[datetime] = None
+    status: Optional[str] = Field("Open", max_length=32)
+    subject: Optional[str] = Field(None, max_length=500)
+    company_id: Optional[int] = None
+    contact_id: Optional[int] = None
+    properties: Optional[dict] = None
@@ -0,0 +1,51 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.profiling import ProfiledRoute
+from services.export_services import (
+    CSV,
+    EXPORT_TABLES,
+    FORMATS,
+    MEDIA_TYPES,
+    ExportService,
+    ExportUnavailableError,
+)
+
+router = APIRouter(prefix="/export", route_class=ProfiledRoute)
+
+
+@router.get("/{table}")
+def export_table(
+    table: str,
+    export_format: str = Query(CSV, alias="format", description=f"One of {', '.join(FORMATS)}"),
+    start: Optional[datetime] = Query(None, description="Only rows at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only rows before this time"),
+):
+    """
+    Bulk export of a time-series table, streamed with COPY TO STDOUT.
+
+    Tables are client_engagements (filtered on timestamp) and support_tickets
+    (filtered on created_at). CSV is streamed as the database sends it, in
+    chunks of a few hundred KB;
+    Parquet and Arrow are written one record batch at a time.
+
+    Returns:
+        The rows in the requested format, as a streamed download
+    """
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table {table}")
+    export_service = ExportService()
+    try:
+        chunks = export_service.export(table, export_format, start, end)
+    except ExportUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    extension = "arrows" if export_format == "arrow" else export_format
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{extension}"'},
+    )
@@ -0,0 +1,103 @@
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Response
+from psycopg import DataError, IntegrityError
+from app.profiling import ProfiledRoute
+from models.input_models import EngagementRecord, TicketRecord
+from services.ingest_services import (
+    ACK_MODES,
+    DURABLE,
+    IngestBufferFull,
+    IngestTimeout,
+    get_ingest_service,
+)
+
+router = APIRouter(prefix="/ingest", route_class=ProfiledRoute)
+
+MAX_INGEST_ROWS = 10_000
+
+# Seconds a client rejected by a full buffer is asked to wait
+RETRY_AFTER_SECONDS = 1
+
+Ack = Query(
+    None, description=f"When to answer: {' or '.join(ACK_MODES)}; INGEST_ACK if omitted"
+)
+
+
+async def _ingest(table: str, records: list, ack: Optional[str], response: Response) -> dict:
+    """Buffer a batch of records and map ingest failures to HTTP errors."""
+    if len(records) > MAX_INGEST_ROWS:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MAX_INGEST_ROWS} rows per request"
+        )
+    ingest_service = get_ingest_service()
+    try:
+        result = await ingest_service.ingest(
+            table, [record.model_dump() for record in records], ack
+        )
+    except IngestBufferFull as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+        )
+    except IngestTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except (DataError, IntegrityError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ConnectionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    response.status_code = 201 if result["ack"] == DURABLE else 202
+    return result
+
+
+@router.post("/client_engagements", status_code=202)
+async def ingest_client_engagements(
+    records: List[EngagementRecord], response: Response, ack: Optional[str] = Ack
+):
+    """
+    Bulk ingest of client engagements.
+
+    Rows are buffered and written with COPY in batches. With ack=durable the
+    response (201) waits until they are committed; with ack=enqueued it (202)
+    returns once they are buffered. A full buffer answers 503 with Retry-After.
+    The durable wait is awaited on the event loop, not in a worker thread.
+
+    Returns:
+        The table, the number of rows accepted and how they were acknowledged
+    """
+    return await _ingest("client_engagements", records, ack, response)
+
+
+@router.post("/support_tickets", status_code=202)
+async def ingest_support_tickets(
+    records: List[TicketRecord], response: Response, ack: Optional[str] = Ack
+):
+    """
+    Bulk ingest of support tickets, buffered like client engagements.
+
+    Returns:
+        The table, the number of rows accepted and how they were acknowledged
+    """
+    return await _ingest("support_tickets", records, ack, response)
+
+
+@router.get("/dead_letters")
+def get_dead_letters():
+    """
+    Rows of answered requests whose flush failed, kept for a retry.
+
+    Returns:
+        The number of dead-lettered rows by table
+    """
+    return {"dead_letter_rows": get_ingest_service().dead_letters()}
+
+
+@router.post("/dead_letters/retry")
+def retry_dead_letters():
+    """
+    Buffer the dead-lettered rows to be flushed again, as far as the buffers have room.
+
+    Returns:
+        The number of rows requeued by table
+    """
+    return {"requeued_rows": get_ingest_service().retry_dead_letters()}
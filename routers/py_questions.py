@@ -1,5 +1,12 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Body, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from app.config import config
+from app.offload import OffloadRoute, offload
+from app.profiling import call_profiled
+from app.responses import FastJSONResponse
+from models.fast_parsers import parse_question_one, parse_question_two
 from models.input_models import QuestionOneInput, QuestionTwoInput
+from services import cpu_tasks
 from services.string_services import (
     normalize_strings_manual,
     normalize_strings_built_in,
@@ -10,31 +17,80 @@ from services.dictionary_services import (
     flatten_dictionary_library,
 )
 
-router = APIRouter(prefix="/python")
+router = APIRouter(prefix="/python", route_class=OffloadRoute)
 
 
-@router.post("/question_one_manual")
-def get_question_one_manual(input: QuestionOneInput) -> dict:
-    return normalize_strings_manual(input.Type)
+async def fast_question_one_input(request: Request):
+    """Parse a QuestionOneInput body with the fast-path parser, off the event loop."""
+    body = await request.body()
+    return await run_in_threadpool(call_profiled, parse_question_one, body)
 
 
-@router.post("/question_one_built_in")
-def get_question_one_built_in(input: QuestionOneInput) -> dict:
-    return normalize_strings_built_in(input.Type)
+async def fast_question_two_input(request: Request):
+    """Parse a QuestionTwoInput body with the fast-path parser, off the event loop."""
+    body = await request.body()
+    return await run_in_threadpool(call_profiled, parse_question_two, body)
 
 
-@router.post("/question_two_iterative")
-def get_question_two_iterative(input: QuestionTwoInput) -> dict:
-    return flatten_dictionary_iterative(input.dictionary, input.delimiter)
+def _body_schema(model) -> dict:
+    """OpenAPI request body for a route whose body is parsed by a dependency."""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": model.model_json_schema()}},
+        }
+    }
 
 
-@router.post("/question_two_recursive")
-def get_question_two_recursive(input: QuestionTwoInput) -> dict:
-    return flatten_dictionary_recursive(
-        input.dictionary, input.parent_key, input.delimiter
+# With PY_FAST_PATH the bodies are decoded with orjson and structurally
+# checked instead of being validated into pydantic models, and results are
+# serialized straight to bytes instead of going through jsonable_encoder
+if config.py_fast_path:
+    QuestionOneBody = Depends(fast_question_one_input)
+    QuestionTwoBody = Depends(fast_question_two_input)
+    question_one_openapi = _body_schema(QuestionOneInput)
+    question_two_openapi = _body_schema(QuestionTwoInput)
+else:
+    QuestionOneBody = Body()
+    QuestionTwoBody = Body()
+    question_one_openapi = None
+    question_two_openapi = None
+
+
+def respond(result: dict):
+    """Return a result pre-serialized in fast-path mode, as is otherwise."""
+    if config.py_fast_path:
+        return FastJSONResponse(result)
+    return result
+
+
+@router.post("/question_one_manual", openapi_extra=question_one_openapi)
+@offload(cpu_tasks.question_one_manual)
+def get_question_one_manual(input: QuestionOneInput = QuestionOneBody) -> dict:
+    return respond(normalize_strings_manual(input.Type))
+
+
+@router.post("/question_one_built_in", openapi_extra=question_one_openapi)
+@offload(cpu_tasks.question_one_built_in)
+def get_question_one_built_in(input: QuestionOneInput = QuestionOneBody) -> dict:
+    return respond(normalize_strings_built_in(input.Type))
+
+
+@router.post("/question_two_iterative", openapi_extra=question_two_openapi)
+@offload(cpu_tasks.question_two_iterative)
+def get_question_two_iterative(input: QuestionTwoInput = QuestionTwoBody) -> dict:
+    return respond(flatten_dictionary_iterative(input.dictionary, input.delimiter))
+
+
+@router.post("/question_two_recursive", openapi_extra=question_two_openapi)
+@offload(cpu_tasks.question_two_recursive)
+def get_question_two_recursive(input: QuestionTwoInput = QuestionTwoBody) -> dict:
+    return respond(
+        flatten_dictionary_recursive(input.dictionary, input.parent_key, input.delimiter)
     )
 
 
-@router.post("/question_two_library")
-def get_question_two_library(input: QuestionTwoInput) -> dict:
-    return flatten_dictionary_library(input.dictionary, input.delimiter)
+@router.post("/question_two_library", openapi_extra=question_two_openapi)
+@offload(cpu_tasks.question_two_library)
+def get_question_two_library(input: QuestionTwoInput = QuestionTwoBody) -> dict:
+    return respond(flatten_dictionary_library(input.dictionary, input.delimiter))
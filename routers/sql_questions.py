@@ -1,52 +1,292 @@
-from fastapi import APIRouter
-from services.sql_query_services import SQLQueryService
+from datetime import date
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Response
+from app.config import config
+from app.cancellation import CancelOnDisconnectRoute
+from services.sql_query_services import (
+    DEFAULT_HIGH_THRESHOLD,
+    DEFAULT_MEDIUM_THRESHOLD,
+    DEFAULT_WINDOW_DAYS,
+    FIRST_PAGE_CURSOR,
+    SQLQueryService,
+)
+from services.digest_services import DEFAULT_PERCENTILES, DigestService
+from services.snapshot_services import Snapshot, get_snapshot_service
 
-router = APIRouter(prefix="/sql")
+router = APIRouter(prefix="/sql", route_class=CancelOnDisconnectRoute)
+
+MAX_WINDOW_DAYS = 3650
+MAX_PAGE_SIZE = 10_000
+
+WindowDays = Query(
+    DEFAULT_WINDOW_DAYS, ge=1, le=MAX_WINDOW_DAYS, description="Window length in days"
+)
+CompanyIds = Query(None, alias="company_id", description="Only include these companies")
+PageSize = Query(
+    None, ge=1, le=MAX_PAGE_SIZE, description="Companies per page, all if omitted"
+)
+AfterCompanyId = Query(
+    FIRST_PAGE_CURSOR, ge=0, description="Cursor: next_cursor from the previous page"
+)
+MediumThreshold = Query(
+    DEFAULT_MEDIUM_THRESHOLD, ge=0, description="Lowest engagement count in the medium bucket"
+)
+HighThreshold = Query(
+    DEFAULT_HIGH_THRESHOLD, ge=0, description="Engagement counts above this are high"
+)
+Approximate = Query(
+    False, description="Estimate from a sample of the table, with confidence intervals"
+)
+SamplePercent = Query(
+    None, gt=0, le=100, description="Percentage of the table to sample when approximate"
+)
+
+
+def _snapshot(name: str, is_default: bool) -> Optional[Snapshot]:
+    """Get the latest snapshot of an analytic, for requests with its default parameters."""
+    if not is_default or not config.snapshots_enabled:
+        return None
+    if name == "get_dashboard":
+        return get_snapshot_service().get_dashboard()
+    return get_snapshot_service().get(name)
+
+
+def _serve(snapshot: Snapshot, response: Response) -> dict:
+    """Answer with a snapshot, its age in the Age header."""
+    response.headers["Age"] = str(int(snapshot.age))
+    return snapshot.result
+
+
+def _default_buckets(window_days, company_ids, medium_threshold, high_threshold) -> bool:
+    return (
+        window_days == DEFAULT_WINDOW_DAYS
+        and company_ids is None
+        and medium_threshold == DEFAULT_MEDIUM_THRESHOLD
+        and high_threshold == DEFAULT_HIGH_THRESHOLD
+    )
 
 
 @router.get("/question_one")
-def get_question_one():
+def get_question_one(
+    response: Response,
+    window_days: int = WindowDays,
+    company_ids: Optional[List[int]] = CompanyIds,
+    page_size: Optional[int] = PageSize,
+    after_company_id: int = AfterCompanyId,
+    approximate: bool = Approximate,
+    sample_percent: Optional[float] = SamplePercent,
+):
     """
     Question One: Get engagement counts by company for the last 30 days.
 
+    The window, company filter and keyset page are configurable; pass the
+    returned next_cursor as after_company_id to fetch the following page.
+    With the default parameters the latest snapshot is served. With
+    approximate the counts are estimated from a sample of the table.
+
     Returns:
-        List of companies with their engagement counts for the last 30 days
+        List of companies with their engagement counts for the window
     """
+    if approximate:
+        sql_service = SQLQueryService()
+        try:
+            return sql_service.get_engagement_counts_by_company_approximate(
+                window_days, company_ids, page_size, after_company_id, sample_percent
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    snapshot = _snapshot(
+        "get_engagement_counts_by_company",
+        window_days == DEFAULT_WINDOW_DAYS
+        and company_ids is None
+        and page_size is None
+        and after_company_id == FIRST_PAGE_CURSOR,
+    )
+    if snapshot is not None:
+        return _serve(snapshot, response)
     sql_service = SQLQueryService()
-    return sql_service.get_engagement_counts_by_company()
+    return sql_service.get_engagement_counts_by_company(
+        window_days, company_ids, page_size, after_company_id
+    )
 
 
 @router.get("/question_two")
-def get_question_two():
+def get_question_two(
+    response: Response,
+    company_ids: Optional[List[int]] = CompanyIds,
+    page_size: Optional[int] = PageSize,
+    after_company_id: int = AfterCompanyId,
+    approximate: bool = Approximate,
+    sample_percent: Optional[float] = SamplePercent,
+):
     """
     Question Two: Get average resolution time by company for closed tickets.
 
+    With approximate the averages are estimated from a sample of the table.
+
     Returns:
         List of companies with their average ticket resolution times in seconds
     """
+    if approximate:
+        sql_service = SQLQueryService()
+        try:
+            return sql_service.get_average_resolution_time_by_company_approximate(
+                company_ids, page_size, after_company_id, sample_percent
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    snapshot = _snapshot(
+        "get_average_resolution_time_by_company",
+        company_ids is None and page_size is None and after_company_id == FIRST_PAGE_CURSOR,
+    )
+    if snapshot is not None:
+        return _serve(snapshot, response)
     sql_service = SQLQueryService()
-    return sql_service.get_average_resolution_time_by_company()
+    return sql_service.get_average_resolution_time_by_company(
+        company_ids, page_size, after_company_id
+    )
 
 
 @router.get("/question_three")
-def get_question_three():
+def get_question_three(
+    response: Response,
+    window_days: int = WindowDays,
+    company_ids: Optional[List[int]] = CompanyIds,
+    medium_threshold: int = MediumThreshold,
+    high_threshold: int = HighThreshold,
+):
     """
     Question Three: Get ticket counts by engagement bucket (high/medium/low).
 
+    Always exact: there is no approximate option, since the bucket a company
+    falls in on a sample says nothing about the bucket it falls in on the
+    whole table, so sampled bucket counts cannot be scaled back up.
+
     Returns:
         Ticket counts grouped by engagement level buckets
     """
+    snapshot = _snapshot(
+        "get_ticket_counts_by_engagement_bucket",
+        _default_buckets(window_days, company_ids, medium_threshold, high_threshold),
+    )
+    if snapshot is not None:
+        return _serve(snapshot, response)
     sql_service = SQLQueryService()
-    return sql_service.get_ticket_counts_by_engagement_bucket()
+    try:
+        return sql_service.get_ticket_counts_by_engagement_bucket(
+            window_days, company_ids, medium_threshold, high_threshold
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
 
 @router.get("/question_three_alternative")
-def get_question_three_alternative():
+def get_question_three_alternative(
+    response: Response,
+    window_days: int = WindowDays,
+    company_ids: Optional[List[int]] = CompanyIds,
+    medium_threshold: int = MediumThreshold,
+    high_threshold: int = HighThreshold,
+):
     """
     Question Three: Get ticket counts by engagement bucket (high/medium/low).
 
+    Always exact: there is no approximate option, since the bucket a company
+    falls in on a sample says nothing about the bucket it falls in on the
+    whole table, so sampled bucket counts cannot be scaled back up.
+
     Returns:
         Ticket counts grouped by engagement level buckets
     """
+    snapshot = _snapshot(
+        "get_ticket_counts_by_engagement_bucket_alternative",
+        _default_buckets(window_days, company_ids, medium_threshold, high_threshold),
+    )
+    if snapshot is not None:
+        return _serve(snapshot, response)
+    sql_service = SQLQueryService()
+    try:
+        return sql_service.get_ticket_counts_by_engagement_bucket_alternative(
+            window_days, company_ids, medium_threshold, high_threshold
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.get("/dashboard")
+def get_dashboard(
+    response: Response,
+    window_days: int = WindowDays,
+    company_ids: Optional[List[int]] = CompanyIds,
+    medium_threshold: int = MediumThreshold,
+    high_threshold: int = HighThreshold,
+):
+    """
+    Dashboard: every analytic from questions one to three in a single request.
+
+    The queries are pipelined on one database connection, so the dashboard
+    costs one request and one round-trip instead of one per question.
+
+    Always exact: approximate results are only available from /question_one
+    and /question_two, and the dashboard includes the bucket questions, which
+    cannot be sampled.
+
+    Returns:
+        The results of each question keyed by analytic
+    """
+    snapshot = _snapshot(
+        "get_dashboard",
+        _default_buckets(window_days, company_ids, medium_threshold, high_threshold),
+    )
+    if snapshot is not None:
+        return _serve(snapshot, response)
+    sql_service = SQLQueryService()
+    try:
+        return sql_service.get_dashboard(
+            window_days, company_ids, medium_threshold, high_threshold
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.get("/resolution_time_percentiles")
+def get_resolution_time_percentiles(
+    percentiles: List[float] = Query(
+        list(DEFAULT_PERCENTILES), alias="percentile", description="Percentiles, 0 to 100"
+    ),
+    company_ids: Optional[List[int]] = CompanyIds,
+    start: Optional[date] = Query(None, description="Only tickets closed on or after this day"),
+    end: Optional[date] = Query(None, description="Only tickets closed before this day"),
+    by_company: bool = Query(True, description="Per company, or over all included tickets"),
+    page_size: Optional[int] = PageSize,
+    after_company_id: int = AfterCompanyId,
+):
+    """
+    Resolution time percentiles of closed tickets, per company or overall.
+
+    Served from per-company, per-day digests kept current as tickets close,
+    so any percentile costs a sum over small rows instead of a sort of the
+    tickets. Estimates are within relative_accuracy of the exact values.
+
+    Returns:
+        Ticket counts and the resolution time in seconds at each percentile
+    """
+    digest_service = DigestService()
+    try:
+        return digest_service.get_resolution_time_percentiles(
+            percentiles, company_ids, start, end, by_company, page_size, after_company_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.get("/query_stats")
+def get_query_stats():
+    """
+    Prepared statement reuse and planning cost of the registered analytics queries.
+
+    Returns:
+        Per-query execution counts, planning time and estimated planning time saved
+    """
     sql_service = SQLQueryService()
-    return sql_service.get_ticket_counts_by_engagement_bucket_alternative()
+    return sql_service.get_query_planning_stats()
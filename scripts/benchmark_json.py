@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Benchmark the regular and fast-path JSON handling of the /python routes.
+
+For each payload size the request body is taken through what the route does
+around the service call, both ways:
+
+- regular: json.loads, pydantic model validation, response model validation,
+  jsonable_encoder and JSONResponse rendering (what FastAPI does by default)
+- fast: orjson decoding with structural checks and FastJSONResponse rendering
+  (what PY_FAST_PATH=true does); the generated bodies never need the
+  fallback to the regular decoding and validation
+
+The service call itself is identical in both and is timed separately. Run
+it as a module from the repository root, so the app's packages import:
+
+    python -m scripts.benchmark_json
+"""
+
+import json
+import random
+import sys
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from app.responses import FastJSONResponse
+from models.fast_parsers import parse_question_one, parse_question_two
+from models.input_models import QuestionOneInput, QuestionTwoInput
+from scripts.payloads import question_one_body, question_two_body
+from services.dictionary_services import flatten_dictionary_iterative
+from services.string_services import normalize_strings_built_in
+
+KB = 1024
+MB = 1024 * KB
+DEFAULT_SIZES = [1 * KB, 10 * KB, 100 * KB, 1 * MB, 10 * MB, 100 * MB]
+
+# Each measurement repeats until it has run for at least this long
+MIN_SECONDS = 0.5
+MAX_REPEATS = 1000
+
+_response_model = TypeAdapter(dict)
+
+
+def _time(func: Callable[[], object]) -> float:
+    """Mean seconds per call of func."""
+    repeats = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        repeats += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SECONDS or repeats >= MAX_REPEATS:
+            return elapsed / repeats
+
+
+def _regular_response(result: dict) -> bytes:
+    return JSONResponse(jsonable_encoder(_response_model.validate_python(result))).body
+
+
+def _fast_response(result: dict) -> bytes:
+    return FastJSONResponse(result).body
+
+
+def benchmark(
+    name: str,
+    body: bytes,
+    model,
+    fast_parser: Callable[[bytes], object],
+    service: Callable[[object], dict],
+) -> dict:
+    """Time the regular and fast request/response handling of one payload."""
+    regular_input = model.model_validate(json.loads(body))
+    fast_input = fast_parser(body)
+    result = service(regular_input)
+    if service(fast_input) != result:
+        raise AssertionError(f"{name}: fast path result differs from the regular path")
+    if json.loads(_fast_response(result)) != json.loads(_regular_response(result)):
+        raise AssertionError(f"{name}: fast path response differs from the regular path")
+
+    regular_parse = _time(lambda: model.model_validate(json.loads(body)))
+    fast_parse = _time(lambda: fast_parser(body))
+    regular_render = _time(lambda: _regular_response(result))
+    fast_render = _time(lambda: _fast_response(result))
+    service_time = _time(lambda: service(regular_input))
+    regular = regular_parse + regular_render
+    fast = fast_parse + fast_render
+    return {
+        "route": name,
+        "bytes": len(body),
+        "regular_parse_ms": regular_parse * 1000,
+        "fast_parse_ms": fast_parse * 1000,
+        "regular_render_ms": regular_render * 1000,
+        "fast_render_ms": fast_render * 1000,
+        "service_ms": service_time * 1000,
+        "speedup": regular / fast if fast else float("inf"),
+    }
+
+
+def _format_size(size: int) -> str:
+    if size >= MB:
+        return f"{size / MB:.0f}MB"
+    return f"{size / KB:.0f}KB"
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """Main function to run the benchmark."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark fast-path JSON handling")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Payload sizes in bytes (default 1KB to 100MB)",
+    )
+    parser.add_argument(
+        "--route",
+        choices=["question_one", "question_two", "all"],
+        default="all",
+        help="Which payload shape to benchmark",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    cases: List[Tuple[str, Callable[[int, random.Random], bytes], object, Callable, Callable]] = [
+        (
+            "question_one",
+            question_one_body,
+            QuestionOneInput,
+            parse_question_one,
+            lambda input: normalize_strings_built_in(input.Type),
+        ),
+        (
+            "question_two",
+            question_two_body,
+            QuestionTwoInput,
+            parse_question_two,
+            lambda input: flatten_dictionary_iterative(input.dictionary, input.delimiter),
+        ),
+    ]
+
+    results = []
+    for name, make_body, model, fast_parser, service in cases:
+        if args.route not in (name, "all"):
+            continue
+        for size in args.sizes:
+            body = make_body(size, rng)
+            result = benchmark(name, body, model, fast_parser, service)
+            results.append(result)
+            if not args.json:
+                print(
+                    f"{name:<13} {_format_size(size):>6}  "
+                    f"parse {result['regular_parse_ms']:10.3f} -> {result['fast_parse_ms']:10.3f} ms  "
+                    f"render {result['regular_render_ms']:10.3f} -> {result['fast_render_ms']:10.3f} ms  "
+                    f"service {result['service_ms']:10.3f} ms  "
+                    f"x{result['speedup']:.1f}",
+                    flush=True,
+                )
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Check the columnar analytics engine against the SQL analytics.
+
+Every analytic is run both ways over a few parameter sets and the results
+are compared; the script exits non-zero on any difference. Bucket rows come
+back from SQL in no particular order, so they are compared as sets. Timings
+of both are printed for comparison.
+"""
+
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from services.columnar_services import ColumnarAnalytics
+from services.sql_query_services import (
+    DEFAULT_HIGH_THRESHOLD,
+    DEFAULT_MEDIUM_THRESHOLD,
+    DEFAULT_WINDOW_DAYS,
+    FIRST_PAGE_CURSOR,
+    SQLQueryService,
+)
+
+# Each repeat is timed and the best kept
+REPEATS = 5
+
+PARAMETER_SETS: List[Dict[str, Any]] = [
+    {},
+    {"window_days": 7},
+    {"window_days": 365, "medium_threshold": 1, "high_threshold": 2},
+    {"company_ids": [1, 2, 3, 5, 8]},
+]
+PAGE_SETS: List[Dict[str, Any]] = [
+    {},
+    {"page_size": 3},
+    {"page_size": 3, "after_company_id": 3},
+]
+
+
+def _best(func: Callable[[], Any]) -> float:
+    """Fastest of REPEATS calls of func, in milliseconds."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def _normalize(result: Dict[str, Any], unordered: bool) -> Any:
+    rows = [
+        {key: int(value) if key != "bucket" else value for key, value in row.items()}
+        for row in result["results"]
+    ]
+    if unordered:
+        rows = sorted(rows, key=lambda row: row["bucket"])
+    return {**result, "results": rows}
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """Main function to run the check."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check columnar analytics against SQL")
+    parser.add_argument("--quiet", action="store_true", help="Only print differences")
+    args = parser.parse_args(argv)
+
+    sql = SQLQueryService()
+    sql.columnar = None
+    columnar = ColumnarAnalytics()
+    columnar.refresh(full=True)
+
+    cases = []
+    for params in PARAMETER_SETS:
+        window = {key: params[key] for key in ("window_days", "company_ids") if key in params}
+        buckets = {
+            key: params[key]
+            for key in ("window_days", "company_ids", "medium_threshold", "high_threshold")
+            if key in params
+        }
+        for page in PAGE_SETS:
+            cases.append(("get_engagement_counts_by_company", {**window, **page}, False))
+            resolution = {key: params[key] for key in ("company_ids",) if key in params}
+            cases.append(("get_average_resolution_time_by_company", {**resolution, **page}, False))
+        cases.append(("get_ticket_counts_by_engagement_bucket", buckets, True))
+        cases.append(("get_ticket_counts_by_engagement_bucket_alternative", buckets, True))
+
+    defaults = {
+        "window_days": DEFAULT_WINDOW_DAYS,
+        "company_ids": None,
+        "page_size": None,
+        "after_company_id": FIRST_PAGE_CURSOR,
+        "medium_threshold": DEFAULT_MEDIUM_THRESHOLD,
+        "high_threshold": DEFAULT_HIGH_THRESHOLD,
+    }
+    # Analytics without a window repeat across parameter sets
+    cases = list({(case[0], repr(case[1])): case for case in cases}.values())
+
+    failures = 0
+    for name, params, unordered in cases:
+        sql_method = getattr(sql, name)
+        columnar_method = getattr(columnar, name)
+        arguments = sql_method.__code__.co_varnames[1 : sql_method.__code__.co_argcount]
+        columnar_params = {key: params.get(key, defaults[key]) for key in arguments}
+
+        expected = _normalize(sql_method(**params), unordered)
+        actual = _normalize(columnar_method(**columnar_params), unordered)
+        if expected != actual:
+            failures += 1
+            print(f"MISMATCH {name} {params}\n  sql:      {expected}\n  columnar: {actual}")
+            continue
+        if not args.quiet:
+            sql_ms = _best(lambda: sql_method(**params))
+            columnar_ms = _best(lambda: columnar_method(**columnar_params))
+            print(
+                f"ok  {name:<52} {str(params):<70} "
+                f"sql {sql_ms:8.3f} ms  columnar {columnar_ms:8.3f} ms",
+                flush=True,
+            )
+
+    if failures:
+        print(f"{failures} of {len(cases)} checks differ")
+        sys.exit(1)
+    print(f"All {len(cases)} checks match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Check the resolution time digests against exact percentiles.
+
+Percentiles served from the digests are compared, per company and overall,
+with percentile_disc over support_tickets. The script exits non-zero when a
+ticket count differs (the trigger missed a change) or an estimate is further
+from the exact value than the digests' relative accuracy, or for exact
+values of a second or less their absolute accuracy. Timings of both
+are printed for comparison.
+"""
+
+import argparse
+import sys
+import time
+from typing import Any, Dict, List, Optional
+from connectors.database import Database
+from services.digest_services import BUCKET_ZERO_ACCURACY, DigestService, RELATIVE_ACCURACY
+
+PERCENTILES = [1.0, 10.0, 50.0, 90.0, 99.0, 100.0]
+
+EXACT_QUERY = """
+    SELECT
+        {group} AS company_id,
+        COUNT(*) AS ticket_count,
+        percentile_disc(%(fractions)s::float8[]) WITHIN GROUP (
+            ORDER BY EXTRACT(EPOCH FROM (closed_at - created_at))
+        ) AS percentiles
+    FROM
+        support_tickets
+    WHERE
+        status = 'Closed'
+        AND closed_at IS NOT NULL
+        AND company_id IS NOT NULL
+    {group_by}
+"""
+
+
+def _timed(func) -> Any:
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _exact(db: Database, by_company: bool) -> List[Dict[str, Any]]:
+    query = EXACT_QUERY.format(
+        group="company_id" if by_company else "NULL::int",
+        group_by="GROUP BY company_id ORDER BY company_id" if by_company else "",
+    )
+    return db.execute_prepared(query, {"fractions": [p / 100 for p in PERCENTILES]}, "check_digests")
+
+
+def _compare(expected: Dict[str, Any], actual: Optional[Dict[str, Any]]) -> List[str]:
+    """Differences between an exact row and a digest row."""
+    if actual is None:
+        return ["missing from the digests"]
+    problems = []
+    if actual["ticket_count"] != expected["ticket_count"]:
+        problems.append(f"{actual['ticket_count']} tickets, expected {expected['ticket_count']}")
+    for percentile, exact in zip(PERCENTILES, expected["percentiles"]):
+        estimate = actual[f"p{percentile:g}"]
+        exact = float(exact)
+        # Bucket 0 stands for any resolution time of a second or less
+        error = abs(estimate - exact) if exact <= 1 else abs(estimate - exact) / exact
+        limit = BUCKET_ZERO_ACCURACY if exact <= 1 else RELATIVE_ACCURACY + 1e-9
+        if error > limit:
+            problems.append(f"p{percentile:g} {estimate} vs exact {exact}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quiet", action="store_true", help="Only print differences")
+    args = parser.parse_args()
+
+    db = Database()
+    service = DigestService()
+    failures = 0
+    checks = 0
+    for by_company in (True, False):
+        expected, exact_ms = _timed(lambda: _exact(db, by_company))
+        response, digest_ms = _timed(
+            lambda: service.get_resolution_time_percentiles(PERCENTILES, by_company=by_company)
+        )
+        actual = {row.get("company_id"): row for row in response["results"]}
+        for row in expected:
+            if not by_company and row["ticket_count"] == 0:
+                continue
+            checks += 1
+            problems = _compare(row, actual.get(row["company_id"]))
+            label = f"company {row['company_id']}" if by_company else "overall"
+            if problems:
+                failures += 1
+                print(f"MISMATCH {label}: {'; '.join(problems)}")
+        if not args.quiet:
+            scope = "by company" if by_company else "overall"
+            print(f"{scope:<11} exact {exact_ms:8.3f} ms  digests {digest_ms:8.3f} ms")
+
+    if failures:
+        print(f"{failures} of {checks} checks differ")
+        sys.exit(1)
+    print(
+        f"All {checks} checks within {RELATIVE_ACCURACY:.2%}, "
+        f"or {BUCKET_ZERO_ACCURACY}s at a second or less"
+    )
+
+
+if __name__ == "__main__":
+    main()
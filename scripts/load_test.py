@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Load test the API with a configurable mix of /python and /sql requests.
+
+The script starts the app with uvicorn on a local port (or targets a running
+one with --url) and drives it with asyncio and httpx in one of two modes:
+
+- closed: --concurrency clients each send a request, wait for its response
+  (and --think-time), then send the next; throughput follows latency.
+- open: requests arrive at --rate per second (Poisson arrivals) whether or
+  not earlier ones have finished. Latency is measured from each request's
+  scheduled arrival, so a server that falls behind is charged for the
+  queueing it causes rather than slowing the load down.
+
+Requests during --warmup are sent but not counted. Per route and overall the
+results report throughput, p50/p95/p99 latency and the error rate (non-2xx
+responses and failed requests), and are saved as JSON; --compare prints the
+change from an earlier results file. The /sql routes need a database seeded
+with scripts/seed_data.py.
+
+Run it as a module from the repository root, where the started server
+imports the app; the request bodies come from scripts/payloads.py, so the
+script itself needs only httpx:
+
+    python -m scripts.load_test
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import httpx
+from scripts.payloads import question_one_body, question_two_body
+
+KB = 1024
+
+
+@dataclass(frozen=True)
+class RouteSpec:
+    """A request the load test can send."""
+
+    method: str
+    path: str
+    # Builds query parameters for one request; None sends none
+    params: Optional[Callable[[random.Random, bool], Dict[str, Any]]] = None
+    # Name of the body builder for POST routes
+    body: Optional[str] = None
+
+
+def _window_params(rng: random.Random, live: bool) -> Dict[str, Any]:
+    # Non-default windows skip the snapshots and run the query
+    return {"window_days": rng.randint(1, 90)} if live else {}
+
+
+def _company_params(rng: random.Random, live: bool) -> Dict[str, Any]:
+    return {"company_id": rng.sample(range(1, 101), 5)} if live else {}
+
+
+def _percentile_params(rng: random.Random, live: bool) -> Dict[str, Any]:
+    return {"percentile": [50, 90, 99], "by_company": rng.random() < 0.5}
+
+
+ROUTES: Dict[str, RouteSpec] = {
+    "python_question_one_manual": RouteSpec(
+        "POST", "/python/question_one_manual", body="question_one"
+    ),
+    "python_question_one_built_in": RouteSpec(
+        "POST", "/python/question_one_built_in", body="question_one"
+    ),
+    "python_question_two_iterative": RouteSpec(
+        "POST", "/python/question_two_iterative", body="question_two"
+    ),
+    "python_question_two_recursive": RouteSpec(
+        "POST", "/python/question_two_recursive", body="question_two"
+    ),
+    "python_question_two_library": RouteSpec(
+        "POST", "/python/question_two_library", body="question_two"
+    ),
+    "sql_question_one": RouteSpec("GET", "/sql/question_one", _window_params),
+    "sql_question_two": RouteSpec("GET", "/sql/question_two", _company_params),
+    "sql_question_three": RouteSpec("GET", "/sql/question_three", _window_params),
+    "sql_question_three_alternative": RouteSpec(
+        "GET", "/sql/question_three_alternative", _window_params
+    ),
+    "sql_dashboard": RouteSpec("GET", "/sql/dashboard", _window_params),
+    "sql_resolution_time_percentiles": RouteSpec(
+        "GET", "/sql/resolution_time_percentiles", _percentile_params
+    ),
+}
+
+# Named route mixes, route -> relative weight
+MIXES: Dict[str, Dict[str, float]] = {
+    "python": {name: 1.0 for name in ROUTES if name.startswith("python_")},
+    "sql": {name: 1.0 for name in ROUTES if name.startswith("sql_")},
+    "mixed": {name: 1.0 for name in ROUTES},
+}
+
+BODY_BUILDERS = {"question_one": question_one_body, "question_two": question_two_body}
+
+# How long the started server gets to answer its liveness probe
+SERVER_START_TIMEOUT = 30.0
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse a mix name, or route=weight pairs separated by commas."""
+    if value in MIXES:
+        return MIXES[value]
+    mix = {}
+    for entry in value.split(","):
+        name, _, weight = entry.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise argparse.ArgumentTypeError(
+                f"Unknown route {name}; routes are {', '.join(ROUTES)}"
+            )
+        mix[name] = float(weight or 1)
+    return mix
+
+
+@dataclass
+class RouteStats:
+    """Latencies and outcomes of one route's counted requests."""
+
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+
+    def record(self, latency: float, status: str, ok: bool):
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if not ok:
+            self.errors += 1
+
+    def merge(self, other: "RouteStats"):
+        self.latencies.extend(other.latencies)
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        self.errors += other.errors
+
+    def summary(self, seconds: float) -> Dict[str, Any]:
+        """Throughput, latency percentiles in milliseconds and error rate."""
+        latencies = sorted(self.latencies)
+        requests = len(latencies)
+        return {
+            "requests": requests,
+            "rps": round(requests / seconds, 2) if seconds else 0.0,
+            "error_rate": round(self.errors / requests, 4) if requests else 0.0,
+            "errors": self.errors,
+            "statuses": dict(sorted(self.statuses.items())),
+            "mean_ms": round(1000 * sum(latencies) / requests, 3) if requests else None,
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "p99_ms": _percentile(latencies, 99),
+            "max_ms": round(1000 * latencies[-1], 3) if requests else None,
+        }
+
+
+def _percentile(sorted_latencies: List[float], percentile: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted latencies in seconds, in milliseconds."""
+    if not sorted_latencies:
+        return None
+    rank = max(math.ceil(percentile / 100 * len(sorted_latencies)), 1)
+    return round(1000 * sorted_latencies[rank - 1], 3)
+
+
+class LoadTest:
+    """Sends a weighted mix of requests and records their latency and outcome."""
+
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace):
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.names = list(args.mix)
+        self.weights = [args.mix[name] for name in self.names]
+        self.bodies = {
+            kind: builder(args.body_bytes, random.Random(args.seed))
+            for kind, builder in BODY_BUILDERS.items()
+            if any(ROUTES[name].body == kind for name in self.names)
+        }
+        self.stats: Dict[str, RouteStats] = {name: RouteStats() for name in self.names}
+        self.dropped = 0
+        self.measure_from = 0.0
+        self.measure_until = 0.0
+
+    async def send(self, name: str, scheduled: float):
+        """Send one request; it counts if it was scheduled inside the measured period."""
+        spec = ROUTES[name]
+        params = spec.params(self.rng, self.args.live) if spec.params else None
+        content = self.bodies[spec.body] if spec.body else None
+        headers = {"Content-Type": "application/json"} if content else None
+        try:
+            response = await self.client.request(
+                spec.method, spec.path, params=params, content=content, headers=headers
+            )
+            status, ok = str(response.status_code), response.is_success
+        except httpx.HTTPError as e:
+            status, ok = type(e).__name__, False
+        latency = time.perf_counter() - scheduled
+        if self.measure_from <= scheduled < self.measure_until:
+            self.stats[name].record(latency, status, ok)
+
+    def _choose(self) -> str:
+        return self.rng.choices(self.names, self.weights)[0]
+
+    async def run_closed(self):
+        """Each client sends its next request once the previous one is answered."""
+
+        async def client_loop():
+            while True:
+                now = time.perf_counter()
+                if now >= self.measure_until:
+                    return
+                await self.send(self._choose(), now)
+                if self.args.think_time:
+                    await asyncio.sleep(self.args.think_time)
+
+        await asyncio.gather(*(client_loop() for _ in range(self.args.concurrency)))
+
+    async def run_open(self):
+        """Requests arrive at the target rate regardless of how fast they are answered."""
+        in_flight = set()
+        scheduled = time.perf_counter()
+        while scheduled < self.measure_until:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= self.args.max_in_flight:
+                # The client itself would become the bottleneck
+                if self.measure_from <= scheduled:
+                    self.dropped += 1
+            else:
+                task = asyncio.ensure_future(self.send(self._choose(), scheduled))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            scheduled += self.rng.expovariate(self.args.rate)
+        if in_flight:
+            await asyncio.wait(in_flight)
+
+    async def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        self.measure_from = start + self.args.warmup
+        self.measure_until = self.measure_from + self.args.duration
+        if self.args.mode == "open":
+            await self.run_open()
+        else:
+            await self.run_closed()
+        return self.results()
+
+    def results(self) -> Dict[str, Any]:
+        seconds = self.args.duration
+        overall = RouteStats()
+        for stats in self.stats.values():
+            overall.merge(stats)
+        results = {
+            "overall": overall.summary(seconds),
+            "routes": {name: stats.summary(seconds) for name, stats in self.stats.items()},
+        }
+        if self.args.mode == "open":
+            results["overall"]["dropped"] = self.dropped
+        return results
+
+
+def start_server(args: argparse.Namespace) -> subprocess.Popen:
+    """Start uvicorn on the local port and wait until it is live."""
+    env = {**os.environ}
+    for assignment in args.env:
+        key, _, value = assignment.partition("=")
+        env[key] = value
+    command = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(args.port),
+        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+    ]
+    print(f"Starting {' '.join(command[2:])}")
+    server = subprocess.Popen(command, env=env)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+        try:
+            httpx.get(f"{args.url}/health/live", timeout=1).raise_for_status()
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"uvicorn did not become live within {SERVER_START_TIMEOUT}s")
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+async def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    connections = args.concurrency if args.mode == "closed" else args.max_in_flight
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+        if any(name.startswith("sql_") for name in args.mix):
+            ready = await client.get("/health/ready")
+            if ready.status_code != 200:
+                print("Warning: /health/ready reports the database down; /sql routes will fail")
+        return await LoadTest(client, args).run()
+
+
+def print_results(results: Dict[str, Any], previous: Optional[Dict[str, Any]] = None):
+    """Print a table of the results, with changes from a previous run if given."""
+    columns = ("requests", "rps", "p50_ms", "p95_ms", "p99_ms", "error_rate")
+    print(f"{'route':<34}" + "".join(f"{column:>14}" for column in columns))
+    rows: List[Tuple[str, Dict[str, Any]]] = list(results["routes"].items())
+    rows.append(("overall", results["overall"]))
+    for name, summary in rows:
+        line = f"{name:<34}"
+        for column in columns:
+            value = summary[column]
+            line += f"{'-' if value is None else value:>14}"
+        print(line)
+        if previous is None:
+            continue
+        before = previous["overall"] if name == "overall" else previous["routes"].get(name)
+        if before is None:
+            continue
+        line = f"{'  vs previous':<34}"
+        for column in columns:
+            line += f"{_change(before.get(column), summary[column]):>14}"
+        print(line)
+    if "dropped" in results["overall"]:
+        print(f"Arrivals dropped at --max-in-flight: {results['overall']['dropped']}")
+
+
+def _change(before: Optional[float], after: Optional[float]) -> str:
+    if before is None or after is None:
+        return "-"
+    if before == 0:
+        return "0%" if after == 0 else "new"
+    return f"{(after - before) / before:+.1%}"
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """Main function to run the load test."""
+    parser = argparse.ArgumentParser(description="Load test the API")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default="mixed",
+        help=f"{', '.join(MIXES)} or route=weight pairs, e.g. sql_dashboard=3,sql_question_one=1",
+    )
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients in closed mode")
+    parser.add_argument(
+        "--think-time", type=float, default=0.0, help="Seconds between a closed client's requests"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=100.0, help="Requests per second in open mode"
+    )
+    parser.add_argument(
+        "--max-in-flight", type=int, default=1000, help="Open mode arrivals beyond this are dropped"
+    )
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument(
+        "--warmup", type=float, default=5.0, help="Unmeasured seconds before the measurement"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30.0, help="Per-request timeout in seconds"
+    )
+    parser.add_argument(
+        "--body-bytes", type=int, default=10 * KB, help="Size of the /python request bodies"
+    )
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Vary the /sql parameters so requests run their queries instead of hitting snapshots",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--url", help="Target a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the started server")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="uvicorn workers of the started server"
+    )
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Environment variable for the started server, e.g. PY_FAST_PATH=true",
+    )
+    parser.add_argument("--output", help="Results file, load-test-<timestamp>.json if omitted")
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url is None:
+        args.url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args)
+    started_at = datetime.now(timezone.utc)
+    try:
+        print(
+            f"Running {args.mode} loop against {args.url} for {args.warmup:g}s warmup "
+            f"+ {args.duration:g}s over {len(args.mix)} routes"
+        )
+        results = asyncio.run(run_load_test(args))
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    config = {
+        key: value for key, value in vars(args).items() if key not in ("output", "compare")
+    }
+    results = {"started_at": started_at.isoformat(), "config": config, **results}
+    output = args.output or f"load-test-{started_at.strftime('%Y%m%dT%H%M%SZ')}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_results(results, previous)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for Crafty CRM.
+
+Migrations are the numbered SQL files in database/migrations. Each one is
+applied once, in version order and in its own transaction, and recorded in
+the schema_migrations table. A session advisory lock keeps concurrent
+deploys from applying the same migration twice.
+
+The check-plans command runs EXPLAIN on the analytics queries and verifies
+that the planner picks the indexes the migrations created for them and that
+the recent-window queries prune partitions. The test suite asserts the same
+plans against a freshly migrated database; check-plans is for operators
+checking a live one. The partitions command runs the same partition
+maintenance as the scheduled Lambda.
+"""
+
+import hashlib
+import json
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from connectors.database import Database
+from services.partition_services import PartitionService
+from services.sql_query_services import (
+    AVERAGE_RESOLUTION_TIME,
+    ENGAGEMENT_BUCKET,
+    ENGAGEMENT_BUCKET_ROLLING_WINDOW,
+    ENGAGEMENT_COUNTS,
+)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "database" / "migrations"
+MIGRATION_FILE_PATTERN = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+# Arbitrary constant identifying the migration advisory lock
+MIGRATION_LOCK_ID = 72011001
+
+# Indexes each analytics query is expected to use with its default
+# parameters, and whether its time window should prune partitions. A query passes when every pattern matches
+# at least one index in its plan; partition indexes are reported under the
+# name of the index they were created from.
+PLAN_EXPECTATIONS = {
+    "get_engagement_counts_by_company": (
+        ENGAGEMENT_COUNTS,
+        [r"brin_engagements_timestamp|idx_engagements_company_timestamp"],
+        True,
+    ),
+    "get_average_resolution_time_by_company": (
+        AVERAGE_RESOLUTION_TIME,
+        [r"idx_tickets_closed_by_company"],
+        False,
+    ),
+    "get_ticket_counts_by_engagement_bucket": (
+        ENGAGEMENT_BUCKET,
+        [
+            r"brin_engagements_timestamp|idx_engagements_company_timestamp",
+            r"idx_tickets_company_created_at",
+        ],
+        True,
+    ),
+    "get_ticket_counts_by_engagement_bucket_alternative": (
+        ENGAGEMENT_BUCKET_ROLLING_WINDOW,
+        [r"idx_engagements_company_timestamp", r"idx_tickets_open_by_company"],
+        False,
+    ),
+}
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    path: Path
+
+    @property
+    def sql(self) -> str:
+        return self.path.read_text()
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.path.read_bytes()).hexdigest()
+
+
+class MigrationRunner:
+    def __init__(self, migrations_dir: Path = MIGRATIONS_DIR):
+        self.db = Database()
+        self.migrations_dir = migrations_dir
+
+    def discover(self) -> List[Migration]:
+        """Find migration files, ordered by version."""
+        migrations = []
+        for path in self.migrations_dir.glob("*.sql"):
+            match = MIGRATION_FILE_PATTERN.match(path.name)
+            if match is None:
+                print(f"Skipping {path.name}: not named <version>_<name>.sql")
+                continue
+            migrations.append(Migration(int(match.group(1)), match.group(2), path))
+
+        migrations.sort(key=lambda m: m.version)
+        versions = [m.version for m in migrations]
+        if len(versions) != len(set(versions)):
+            raise ValueError(f"Duplicate migration versions in {self.migrations_dir}")
+        return migrations
+
+    def _ensure_history_table(self, conn):
+        """Create the migration history table if it does not exist yet."""
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    Version INTEGER PRIMARY KEY,
+                    Name VARCHAR(255) NOT NULL,
+                    Checksum VARCHAR(64) NOT NULL,
+                    Applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+        conn.commit()
+
+    def _applied(self, conn) -> Dict[int, dict]:
+        """Get the applied migrations keyed by version."""
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT version, name, checksum, applied_at FROM schema_migrations ORDER BY version"
+            )
+            return {row["version"]: row for row in cursor.fetchall()}
+
+    def upgrade(self, target: Optional[int] = None):
+        """Apply every pending migration up to and including the target version."""
+        conn = self.db.get_connection()
+        try:
+            self._ensure_history_table(conn)
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+
+            applied = self._applied(conn)
+            conn.commit()
+            pending = [
+                m
+                for m in self.discover()
+                if m.version not in applied and (target is None or m.version <= target)
+            ]
+            for migration in self.discover():
+                row = applied.get(migration.version)
+                if row and row["checksum"] != migration.checksum:
+                    print(
+                        f"Warning: migration {migration.version:04d}_{migration.name} "
+                        "changed after it was applied"
+                    )
+
+            if not pending:
+                print("Database schema is up to date.")
+                return
+
+            for migration in pending:
+                print(f"Applying migration {migration.version:04d}_{migration.name}...")
+                try:
+                    with conn.transaction():
+                        with conn.cursor() as cursor:
+                            cursor.execute(migration.sql)
+                            cursor.execute(
+                                """
+                                INSERT INTO schema_migrations (Version, Name, Checksum)
+                                VALUES (%s, %s, %s)
+                                """,
+                                (migration.version, migration.name, migration.checksum),
+                            )
+                except Exception as e:
+                    print(f"Migration {migration.version:04d}_{migration.name} failed: {e}")
+                    raise
+            print(f"Applied {len(pending)} migration(s).")
+        finally:
+            conn.close()
+
+    def status(self):
+        """Print applied and pending migrations."""
+        conn = self.db.get_connection()
+        try:
+            self._ensure_history_table(conn)
+            applied = self._applied(conn)
+        finally:
+            conn.close()
+
+        for migration in self.discover():
+            row = applied.get(migration.version)
+            state = f"applied {row['applied_at']:%Y-%m-%d %H:%M}" if row else "pending"
+            print(f"{migration.version:04d}_{migration.name}: {state}")
+
+    def check_plans(self, allow_seqscan: bool = False) -> bool:
+        """
+        Verify that the analytics queries are planned with the expected indexes.
+
+        Args:
+            allow_seqscan: Plan with the default planner settings. By default
+                sequential scans are disabled so the check is meaningful on small
+                development datasets where a sequential scan is always cheapest.
+
+        Returns:
+            Whether every query used its expected indexes
+        """
+        conn = self.db.get_connection()
+        passed = True
+        try:
+            with conn.cursor() as cursor:
+                if not allow_seqscan:
+                    cursor.execute("SET enable_seqscan = off")
+                for name, (query, expectations, prunes) in PLAN_EXPECTATIONS.items():
+                    indexes, removed = explain_plan(cursor, query)
+                    missing = missing_indexes(indexes, expectations)
+
+                    if missing:
+                        passed = False
+                        print(f"FAIL {name}: expected {missing}, plan used {sorted(indexes)}")
+                    elif prunes and not removed:
+                        passed = False
+                        print(f"FAIL {name}: time window did not prune any partitions")
+                    else:
+                        print(f"ok   {name}: {sorted(indexes)}, {removed} partition(s) pruned")
+            conn.rollback()
+        finally:
+            conn.close()
+        return passed
+
+
+def explain_plan(cursor, query) -> Tuple[Set[str], int]:
+    """
+    Plan a named query with its default parameters.
+
+    Args:
+        cursor: Cursor to run EXPLAIN on; its session settings apply
+        query: Registered query to plan
+
+    Returns:
+        The indexes the plan uses, with partition indexes reported under the
+        index they were created from, and the number of partitions pruned
+    """
+    cursor.execute("EXPLAIN (FORMAT JSON) " + query.sql, query.bind())
+    plan = cursor.fetchone()["QUERY PLAN"]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]["Plan"]
+
+    indexes = set()
+    for index in _plan_indexes(root):
+        cursor.execute("SELECT pg_partition_root(%s::regclass)::text AS root", (index,))
+        indexes.add(cursor.fetchone()["root"] or index)
+    return indexes, _plan_subplans_removed(root)
+
+
+def missing_indexes(indexes: Set[str], expectations: Sequence[str]) -> List[str]:
+    """The expected index patterns that no index in a plan matches."""
+    return [
+        pattern
+        for pattern in expectations
+        if not any(re.search(pattern, index) for index in indexes)
+    ]
+
+
+def _plan_indexes(node: dict) -> set:
+    """Collect the index names used anywhere in an EXPLAIN JSON plan node."""
+    indexes = set()
+    if "Index Name" in node:
+        indexes.add(node["Index Name"])
+    for child in node.get("Plans", []):
+        indexes |= _plan_indexes(child)
+    return indexes
+
+
+def _plan_subplans_removed(node: dict) -> int:
+    """Count the partitions pruned anywhere in an EXPLAIN JSON plan node."""
+    removed = node.get("Subplans Removed", 0)
+    for child in node.get("Plans", []):
+        removed += _plan_subplans_removed(child)
+    return removed
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """Main function to run migrations."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage database schema migrations")
+    subparsers = parser.add_subparsers(dest="command")
+
+    upgrade_parser = subparsers.add_parser("upgrade", help="Apply pending migrations")
+    upgrade_parser.add_argument(
+        "--target", type=int, default=None, help="Highest migration version to apply"
+    )
+    subparsers.add_parser("status", help="Show applied and pending migrations")
+    partitions_parser = subparsers.add_parser(
+        "partitions", help="Create upcoming partitions and detach expired ones"
+    )
+    partitions_parser.add_argument(
+        "--months-ahead", type=int, default=None, help="Months of future partitions"
+    )
+    partitions_parser.add_argument(
+        "--retain-months", type=int, default=None, help="Months of partitions to keep"
+    )
+    check_parser = subparsers.add_parser(
+        "check-plans", help="Verify the analytics queries use their indexes"
+    )
+    check_parser.add_argument(
+        "--allow-seqscan",
+        action="store_true",
+        help="Keep sequential scans enabled (for production-sized data)",
+    )
+
+    args = parser.parse_args(argv)
+    runner = MigrationRunner()
+
+    if args.command == "status":
+        runner.status()
+    elif args.command == "partitions":
+        changes = PartitionService().maintain(args.months_ahead, args.retain_months)
+        for change in changes:
+            print(f"{change['action']} {change['partition_name']}")
+        print(f"{len(changes)} partition change(s).")
+    elif args.command == "check-plans":
+        if not runner.check_plans(allow_seqscan=args.allow_seqscan):
+            sys.exit(1)
+    else:
+        runner.upgrade(target=getattr(args, "target", None))
+
+
+if __name__ == "__main__":
+    main()
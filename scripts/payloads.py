@@ -0,0 +1,43 @@
+"""
+Request bodies for the /python question routes.
+
+Shared by the benchmark and the load test. Only the standard library is
+used, so building bodies does not import fastapi, pydantic or the app.
+"""
+
+import json
+import random
+import string
+
+
+def question_one_body(size: int, rng: random.Random) -> bytes:
+    """Build a QuestionOneInput body of about size bytes."""
+    words = ["".join(rng.choices(string.ascii_letters, k=rng.randint(3, 10))) for _ in range(200)]
+    types = []
+    length = len('{"Type":[]}')
+    while length < size:
+        word = rng.choice(words)
+        value = rng.choice([word, word.upper(), f"  {word} ", word.lower()])
+        types.append(value)
+        length += len(value) + 3
+    return json.dumps({"Type": types}).encode()
+
+
+def question_two_body(size: int, rng: random.Random) -> bytes:
+    """Build a QuestionTwoInput body of about size bytes, nested a few levels deep."""
+    dictionary = {}
+    length = len('{"dictionary":{},"delimiter":"."}')
+    index = 0
+    while length < size:
+        record = {
+            "id": index,
+            "name": "".join(rng.choices(string.ascii_lowercase, k=8)),
+            "address": {"city": "Springfield", "geo": {"lat": rng.random(), "lng": rng.random()}},
+            "tags": ["a", "b"],
+            "active": index % 2 == 0,
+        }
+        key = f"record_{index}"
+        dictionary[key] = record
+        length += len(key) + len(json.dumps(record)) + 4
+        index += 1
+    return json.dumps({"dictionary": dictionary, "delimiter": "."}).encode()
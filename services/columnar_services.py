@@ -0,0 +1,624 @@
+"""
+Columnar analytics services.
+
+This module keeps client_engagements and support_tickets in memory as compact
+NumPy columns and answers the SQLQueryService analytics from them with
+vectorized group-bys, without a database round trip.
+
+Tables are loaded with binary COPY into fixed-width records that NumPy reads
+in place: ids as int32, timestamps as datetime64[us] and text columns as
+int16 codes into a list of categories. NULL ids and categories are stored as
+-1, a NULL timestamp as NaT and -infinity as the smallest datetime64.
+
+Refreshes ingest only the rows with an id above the last one seen. Updates to
+existing rows (a ticket being closed) and rows committed out of id order are
+only picked up by the periodic full reload.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.config import config
+from app.metrics import COLUMNAR_REFRESHES, COLUMNAR_ROWS
+from connectors.database import Database
+from connectors.replicas import get_replica_router
+
+logger = logging.getLogger(__name__)
+
+# Metrics label for the loads
+COLUMNAR_QUERY = "columnar_load"
+
+NULL_ID = -1
+NULL_CODE = -1
+
+# Binary COPY framing: signature, flags and header extension length, then
+# one record per row, then a -1 field count
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+COPY_HEADER_SIZE = len(COPY_SIGNATURE) + 8
+COPY_TRAILER_SIZE = 2
+
+# Postgres timestamps are microseconds since 2000-01-01, with the int64
+# extremes standing for -infinity and infinity
+PG_EPOCH_US = 946_684_800_000_000
+PG_NEG_INFINITY = np.iinfo(np.int64).min
+PG_POS_INFINITY = np.iinfo(np.int64).max
+
+# The smallest int64 is NaT, so -infinity is kept as the next one
+NAT = np.iinfo(np.int64).min
+NEG_INFINITY = np.iinfo(np.int64).min + 1
+
+US_PER_DAY = 86_400_000_000
+
+BUCKETS = ("low", "medium", "high")
+
+# How each kind of column is selected and laid out in the binary COPY
+COLUMN_KINDS = {
+    "id": ("COALESCE({column}, -1)::int4", ">i4"),
+    "timestamp": ("COALESCE({column}, 'infinity')", ">i8"),
+    "category": (
+        "COALESCE(array_position(%({column}_categories)s::text[], {column}::text) - 1, -1)::int2",
+        ">i2",
+    ),
+}
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    """A table loaded into columns."""
+
+    name: str
+    id_column: str
+    columns: Tuple[Tuple[str, str], ...]
+
+    def category_columns(self) -> List[str]:
+        return [column for column, kind in self.columns if kind == "category"]
+
+
+ENGAGEMENTS = TableSpec(
+    "client_engagements",
+    "engagement_id",
+    (
+        ("engagement_id", "id"),
+        ("timestamp", "timestamp"),
+        ("type", "category"),
+        ("company_id", "id"),
+    ),
+)
+TICKETS = TableSpec(
+    "support_tickets",
+    "ticket_id",
+    (
+        ("ticket_id", "id"),
+        ("created_at", "timestamp"),
+        ("closed_at", "timestamp"),
+        ("status", "category"),
+        ("company_id", "id"),
+    ),
+)
+
+
+@dataclass(frozen=True)
+class ColumnarTable:
+    """The columns of a table and the categories its codes refer to."""
+
+    columns: Dict[str, np.ndarray]
+    categories: Dict[str, Tuple[str, ...]]
+    last_id: int
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values())))
+
+    def code(self, column: str, value: str) -> int:
+        """Code of a category value, or one no row has if the value never occurs."""
+        categories = self.categories[column]
+        return categories.index(value) if value in categories else NULL_CODE - 1
+
+    @classmethod
+    def empty(cls, spec: TableSpec) -> "ColumnarTable":
+        return cls(
+            {column: _convert(np.empty(0, dtype=np.int64), kind) for column, kind in spec.columns},
+            {column: () for column in spec.category_columns()},
+            0,
+        )
+
+
+@dataclass(frozen=True)
+class _State:
+    """Everything the analytics read, swapped in whole on refresh."""
+
+    engagements: ColumnarTable
+    tickets: ColumnarTable
+    # Database session local time minus UTC, to reproduce CURRENT_TIMESTAMP
+    utc_offset: np.timedelta64
+    refreshed_at: float
+    reloaded_at: float
+
+
+class ColumnarAnalytics:
+    """In-memory columnar copies of the analytics tables and the analytics over them."""
+
+    def __init__(self, refresh_interval: float = 5.0, reload_interval: float = 300.0):
+        self.replicas = get_replica_router()
+        self.refresh_interval = refresh_interval
+        self.reload_interval = reload_interval
+        self._state: Optional[_State] = None
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._state_lock = threading.Lock()
+        COLUMNAR_ROWS.set_function(self._row_counts)
+
+    def _row_counts(self) -> Dict[Tuple[str], float]:
+        state = self._state
+        if state is None:
+            return {}
+        return {
+            (ENGAGEMENTS.name,): len(state.engagements),
+            (TICKETS.name,): len(state.tickets),
+        }
+
+    def refresh(self, full: bool = False, blocking: bool = True) -> bool:
+        """
+        Ingest new rows, or reload the tables in full.
+
+        A full reload happens anyway on first use and every reload interval.
+
+        Args:
+            full: Reload every row instead of only those above the last seen ids
+            blocking: Wait for a refresh already under way instead of skipping
+
+        Returns:
+            True if this call refreshed the tables
+        """
+        if not self._refresh_lock.acquire(blocking=blocking):
+            return False
+        try:
+            state = self._state
+            now = time.time()
+            full = full or state is None or now - state.reloaded_at >= self.reload_interval
+            kind = "full" if full else "incremental"
+            start = time.perf_counter()
+            try:
+                with self.replicas.reading() as db:
+                    engagements = self._load(
+                        db, ENGAGEMENTS, None if full else state.engagements
+                    )
+                    tickets = self._load(db, TICKETS, None if full else state.tickets)
+                    utc_offset = self._utc_offset(db)
+            except Exception:
+                COLUMNAR_REFRESHES.inc(kind=kind, outcome="error")
+                raise
+            COLUMNAR_REFRESHES.inc(kind=kind, outcome="ok")
+            self._state = _State(
+                engagements,
+                tickets,
+                utc_offset,
+                now,
+                now if full else state.reloaded_at,
+            )
+            if full:
+                logger.info(
+                    "Columnar tables loaded: %d engagements, %d tickets in %.1fms",
+                    len(engagements),
+                    len(tickets),
+                    (time.perf_counter() - start) * 1000,
+                )
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def _load(
+        self, db: Database, spec: TableSpec, current: Optional[ColumnarTable]
+    ) -> ColumnarTable:
+        """Copy the rows above the current table's last id and append them to it."""
+        if current is None:
+            current = ColumnarTable.empty(spec)
+        category_columns = spec.category_columns()
+        aggregates = "".join(
+            f", ARRAY_AGG(DISTINCT {column}::text) FILTER (WHERE {column} IS NOT NULL) AS {column}"
+            for column in category_columns
+        )
+        with db.pooled_connection(COLUMNAR_QUERY) as conn:
+            # Fix the id range first so the categories cover every copied row
+            new = conn.execute(
+                f"SELECT MAX({spec.id_column}) AS last_id{aggregates} "
+                f"FROM {spec.name} WHERE {spec.id_column} > %(after_id)s",
+                {"after_id": current.last_id},
+            ).fetchone()
+        if new["last_id"] is None:
+            return current
+
+        # New categories are appended so the existing codes stay valid
+        categories = {
+            column: current.categories[column]
+            + tuple(sorted(set(new[column] or ()) - set(current.categories[column])))
+            for column in category_columns
+        }
+        select = ", ".join(
+            COLUMN_KINDS[kind][0].format(column=column) for column, kind in spec.columns
+        )
+        params = {f"{column}_categories": list(categories[column]) for column in category_columns}
+        data = b"".join(
+            db.copy_out(
+                f"COPY (SELECT {select} FROM {spec.name} "
+                f"WHERE {spec.id_column} > %(after_id)s AND {spec.id_column} <= %(last_id)s) "
+                "TO STDOUT (FORMAT binary)",
+                {**params, "after_id": current.last_id, "last_id": new["last_id"]},
+                COLUMNAR_QUERY,
+            )
+        )
+        records = _parse_copy(data, spec)
+        columns = {
+            column: np.concatenate([current[column], _convert(records[column], kind)])
+            for column, kind in spec.columns
+        }
+        return ColumnarTable(columns, categories, new["last_id"])
+
+    def _utc_offset(self, db: Database) -> np.timedelta64:
+        with db.pooled_connection(COLUMNAR_QUERY) as conn:
+            row = conn.execute(
+                "SELECT EXTRACT(EPOCH FROM LOCALTIMESTAMP - (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'))"
+                "::float8 AS utc_offset"
+            ).fetchone()
+        return np.timedelta64(round(row["utc_offset"] * 1_000_000), "us")
+
+    def _current(self) -> _State:
+        """The current state, loading it on first use and refreshing it in the background when due."""
+        state = self._state
+        if state is None:
+            self.refresh()
+            return self._state
+        if time.time() - state.refreshed_at >= self.refresh_interval:
+            self._refresh_in_background()
+        return state
+
+    def _refresh_in_background(self):
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh(blocking=False)
+            except Exception:
+                logger.exception("Columnar refresh failed")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="columnar-refresh", daemon=True).start()
+
+    def get_engagement_counts_by_company(
+        self,
+        window_days: int,
+        company_ids: Optional[List[int]],
+        page_size: Optional[int],
+        after_company_id: int,
+    ) -> Dict[str, Any]:
+        """
+        Get engagement counts by company for a recent time window.
+
+        Args:
+            window_days: Length of the window in days, ending now
+            company_ids: Only include these companies
+            page_size: Maximum companies to return, all if None
+            after_company_id: Keyset cursor; only companies with a greater id are returned
+
+        Returns:
+            Dictionary with the page's results and the cursor for the next page
+        """
+        state = self._current()
+        engagements = state.engagements
+        company = engagements["company_id"]
+        mask = (
+            (engagements["timestamp"] >= _cutoff(state, window_days))
+            & (company != NULL_ID)
+            & (company > after_company_id)
+        )
+        if company_ids is not None:
+            mask &= np.isin(company, company_ids)
+
+        # Distinct (company, engagement) pairs, sorted by company
+        pairs = np.unique(
+            (company[mask].astype(np.int64) << 32)
+            | engagements["engagement_id"][mask].astype(np.int64)
+        )
+        companies, counts = np.unique(pairs >> 32, return_counts=True)
+        rows = [
+            {"company_id": int(company_id), "engagements_last_month": int(count)}
+            for company_id, count in zip(companies[:page_size], counts[:page_size])
+        ]
+        return _page(rows, page_size)
+
+    def get_average_resolution_time_by_company(
+        self,
+        company_ids: Optional[List[int]],
+        page_size: Optional[int],
+        after_company_id: int,
+    ) -> Dict[str, Any]:
+        """
+        Get average resolution time by company for closed tickets.
+
+        Args:
+            company_ids: Only include these companies
+            page_size: Maximum companies to return, all if None
+            after_company_id: Keyset cursor; only companies with a greater id are returned
+
+        Returns:
+            Dictionary with the page's results and the cursor for the next page
+        """
+        tickets = self._current().tickets
+        company = tickets["company_id"]
+        created_at = tickets["created_at"]
+        closed_at = tickets["closed_at"]
+        # Tickets created at -infinity make the SQL version fail; they are skipped
+        mask = (
+            (tickets["status"] == tickets.code("status", "Closed"))
+            & ~np.isnat(closed_at)
+            & (created_at.view(np.int64) != NEG_INFINITY)
+            & (company != NULL_ID)
+            & (company > after_company_id)
+        )
+        if company_ids is not None:
+            mask &= np.isin(company, company_ids)
+
+        company = company[mask]
+        order = np.argsort(company, kind="stable")
+        company = company[order]
+        durations = (closed_at[mask] - created_at[mask]).view(np.int64)[order]
+        starts = _segments(company)
+        if len(starts) == 0:
+            return _page([], page_size)
+        totals = np.add.reduceat(durations, starts)
+        counts = np.diff(np.append(starts, len(company)))
+        rows = [
+            {
+                "company_id": int(company[start]),
+                "avg_resolution_time_seconds": _round_average_seconds(int(total), int(count)),
+            }
+            for start, total, count in zip(starts[:page_size], totals[:page_size], counts[:page_size])
+        ]
+        return _page(rows, page_size)
+
+    def get_ticket_counts_by_engagement_bucket(
+        self,
+        window_days: int,
+        company_ids: Optional[List[int]],
+        medium_threshold: int,
+        high_threshold: int,
+    ) -> Dict[str, Any]:
+        """
+        Get ticket counts by engagement bucket (high/medium/low).
+
+        Like the SQL version, each company's engagements in the window are
+        joined with all of its tickets, and both the bucketed count and the
+        ticket count are the number of joined rows.
+
+        Args:
+            window_days: Length of the engagement window in days, ending now
+            company_ids: Only include these companies
+            medium_threshold: Lowest engagement count in the medium bucket
+            high_threshold: Highest engagement count in the medium bucket
+
+        Returns:
+            Dictionary with results containing ticket counts grouped by engagement level buckets
+        """
+        state = self._current()
+        engagements, tickets = state.engagements, state.tickets
+        company = engagements["company_id"]
+        mask = (engagements["timestamp"] >= _cutoff(state, window_days)) & (company != NULL_ID)
+        if company_ids is not None:
+            mask &= np.isin(company, company_ids)
+        ticket_company = tickets["company_id"]
+        ticket_company = ticket_company[ticket_company != NULL_ID]
+
+        size = _id_range(company[mask], ticket_company)
+        engagement_counts = np.bincount(company[mask], minlength=size).astype(np.int64)
+        ticket_counts = np.bincount(ticket_company, minlength=size).astype(np.int64)
+        joined = engagement_counts * ticket_counts
+        joined = joined[joined > 0]
+        return {
+            "results": _bucket_totals(
+                joined, joined, medium_threshold, high_threshold, "ticket_count"
+            )
+        }
+
+    def get_ticket_counts_by_engagement_bucket_alternative(
+        self,
+        window_days: int,
+        company_ids: Optional[List[int]],
+        medium_threshold: int,
+        high_threshold: int,
+    ) -> Dict[str, Any]:
+        """
+        Get open ticket counts by engagement bucket using a rolling window.
+
+        Like the SQL version, a company's activity is the most join rows any
+        of its engagement timestamps has with the engagements in the window
+        starting there, so duplicate timestamps count once per duplicate.
+
+        Args:
+            window_days: Length of the rolling window in days
+            company_ids: Only include these companies
+            medium_threshold: Lowest engagement count in the medium bucket
+            high_threshold: Highest engagement count in the medium bucket
+
+        Returns:
+            Dictionary with results containing open ticket counts grouped by engagement level buckets
+        """
+        state = self._current()
+        engagements, tickets = state.engagements, state.tickets
+        company = engagements["company_id"]
+        mask = company != NULL_ID
+        if company_ids is not None:
+            mask &= np.isin(company, company_ids)
+        company = company[mask]
+        timestamp = engagements["timestamp"][mask].view(np.int64)
+        if len(company) == 0:
+            return {"results": []}
+
+        order = np.lexsort((timestamp, company))
+        company, timestamp = company[order], timestamp[order]
+        window = window_days * US_PER_DAY
+        # -infinity plus a window is still -infinity, so those rows only ever
+        # see each other: move them further below every real timestamp than
+        # a window reaches, which keeps the order
+        finite = timestamp != NEG_INFINITY
+        lowest = int(timestamp[finite].min()) if finite.any() else 0
+        timestamp = np.where(finite, timestamp, lowest - window - 1)
+
+        starts = _segments(company)
+        activity = _max_window_activity(timestamp, starts, window)
+
+        ticket_company = tickets["company_id"][
+            (tickets["status"] == tickets.code("status", "Open"))
+            & (tickets["company_id"] != NULL_ID)
+        ]
+        companies = company[starts]
+        open_tickets = np.bincount(
+            ticket_company, minlength=_id_range(companies, ticket_company)
+        )[companies]
+        return {
+            "results": _bucket_totals(
+                activity, open_tickets, medium_threshold, high_threshold, "open_ticket_count"
+            )
+        }
+
+
+def _parse_copy(data: bytes, spec: TableSpec) -> np.ndarray:
+    """Read the fixed-width records of a binary COPY in place."""
+    if not data.startswith(COPY_SIGNATURE):
+        raise ValueError("Not a binary COPY stream")
+    offset = COPY_HEADER_SIZE + int.from_bytes(data[COPY_HEADER_SIZE - 4 : COPY_HEADER_SIZE], "big")
+    fields = [("field_count", ">i2")]
+    for column, kind in spec.columns:
+        fields += [(f"{column}_length", ">i4"), (column, COLUMN_KINDS[kind][1])]
+    dtype = np.dtype(fields)
+    size = len(data) - offset - COPY_TRAILER_SIZE
+    if size % dtype.itemsize:
+        raise ValueError(f"Unexpected binary COPY layout for {spec.name}")
+    records = np.frombuffer(data, dtype=dtype, count=size // dtype.itemsize, offset=offset)
+    if len(records) and (records["field_count"] != len(spec.columns)).any():
+        raise ValueError(f"Unexpected binary COPY layout for {spec.name}")
+    return records
+
+
+def _convert(values: np.ndarray, kind: str) -> np.ndarray:
+    """Turn a column of COPY values into its in-memory representation."""
+    if kind == "id":
+        return values.astype(np.int32)
+    if kind == "category":
+        return values.astype(np.int16)
+    raw = values.astype(np.int64)
+    timestamps = raw + PG_EPOCH_US
+    timestamps[raw == PG_NEG_INFINITY] = NEG_INFINITY
+    # NULLs were copied as infinity
+    timestamps[raw == PG_POS_INFINITY] = NAT
+    return timestamps.view("datetime64[us]")
+
+
+def _cutoff(state: _State, window_days: int) -> np.datetime64:
+    """Start of a window ending now, in the database's local time like CURRENT_TIMESTAMP."""
+    now = np.datetime64(time.time_ns() // 1000, "us") + state.utc_offset
+    return now - np.timedelta64(window_days, "D")
+
+
+def _segments(values: np.ndarray) -> np.ndarray:
+    """Start index of each run of equal values in a sorted array."""
+    if len(values) == 0:
+        return np.empty(0, dtype=np.intp)
+    return np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+
+
+def _id_range(*ids: np.ndarray) -> int:
+    """Length of a bincount covering every id."""
+    return max((int(values.max()) + 1 for values in ids if len(values)), default=0)
+
+
+def _max_window_activity(timestamp: np.ndarray, starts: np.ndarray, window: int) -> np.ndarray:
+    """
+    Most join rows any timestamp of each company has with the rows in the window starting there.
+
+    Each company's timestamps are shifted into their own range of one key
+    array, so a single searchsorted finds every window; companies are done
+    in batches small enough for the keys to fit in an int64.
+
+    Args:
+        timestamp: Microseconds, sorted within each company
+        starts: Start index of each company's rows
+        window: Window length in microseconds
+
+    Returns:
+        The maximum for each company
+    """
+    base = int(timestamp.min())
+    span = int(timestamp.max()) - base + window + 1
+    batch = max(1, (np.iinfo(np.int64).max - window) // span - 1)
+    ends = np.append(starts[1:], len(timestamp))
+    results = []
+    for first in range(0, len(starts), batch):
+        batch_starts = starts[first : first + batch]
+        lo, hi = batch_starts[0], ends[first + len(batch_starts) - 1]
+        group = np.repeat(
+            np.arange(len(batch_starts), dtype=np.int64), ends[first : first + batch] - batch_starts
+        )
+        key = (timestamp[lo:hi] - base) + group * span
+        equal_start = np.searchsorted(key, key, "left")
+        equal_end = np.searchsorted(key, key, "right")
+        window_end = np.searchsorted(key, key + window, "right")
+        in_window = (equal_end - equal_start) * (window_end - equal_start)
+        results.append(np.maximum.reduceat(in_window, batch_starts - lo))
+    return np.concatenate(results)
+
+
+def _bucket_totals(
+    activity: np.ndarray,
+    values: np.ndarray,
+    medium_threshold: int,
+    high_threshold: int,
+    field: str,
+) -> List[Dict[str, Any]]:
+    """Sum values by the bucket each company's activity falls in, skipping empty buckets."""
+    bucket = np.where(activity > high_threshold, 2, np.where(activity >= medium_threshold, 1, 0))
+    totals = np.bincount(bucket, weights=values, minlength=len(BUCKETS))
+    return [
+        {"bucket": BUCKETS[index], field: int(totals[index])}
+        for index in sorted(range(len(BUCKETS)), key=BUCKETS.__getitem__)
+        if totals[index] > 0
+    ]
+
+
+def _round_average_seconds(total_us: int, count: int) -> int:
+    """Average of count durations totalling total_us, in seconds rounded half away from zero like ROUND."""
+    denominator = count * 1_000_000
+    rounded = (2 * abs(total_us) + denominator) // (2 * denominator)
+    return rounded if total_us >= 0 else -rounded
+
+
+def _page(rows: List[Dict[str, Any]], page_size: Optional[int]) -> Dict[str, Any]:
+    """Wrap a keyset page of company rows with the cursor for the next page."""
+    next_cursor = None
+    if page_size is not None and len(rows) == page_size:
+        next_cursor = rows[-1]["company_id"]
+    return {"results": rows, "next_cursor": next_cursor}
+
+
+_engine: Optional[ColumnarAnalytics] = None
+_engine_lock = threading.Lock()
+
+
+def get_columnar_engine() -> ColumnarAnalytics:
+    """Get the process-wide columnar analytics engine."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ColumnarAnalytics(
+                    config.columnar_refresh_interval, config.columnar_reload_interval
+                )
+    return _engine
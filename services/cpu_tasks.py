@@ -0,0 +1,88 @@
+"""
+CPU-bound tasks run in the worker process pool.
+
+Each task takes a raw request body and returns the serialized response, so
+only bytes cross the process boundary in either direction. The API process
+passes its PY_FAST_PATH setting along, and the worker handles the body as
+the inline route would: with the fast-path parsers and orjson, or validated
+into the pydantic models and serialized through jsonable_encoder like a
+regular response. Validation failures raise the same RequestValidationError
+as the inline routes, which pickles back to the API process as a 422.
+
+Tasks must be module-level functions so they can be pickled by reference.
+"""
+
+import os
+from typing import Any, Dict, Union
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app.responses import FastJSONResponse
+from models.fast_parsers import (
+    FastQuestionOneInput,
+    FastQuestionTwoInput,
+    parse_question_one,
+    parse_question_two,
+    validate_body,
+)
+from models.input_models import QuestionOneInput, QuestionTwoInput
+from services.string_services import (
+    normalize_strings_manual,
+    normalize_strings_built_in,
+)
+from services.dictionary_services import (
+    flatten_dictionary_iterative,
+    flatten_dictionary_recursive,
+    flatten_dictionary_library,
+)
+
+
+def _question_one(body: bytes, fast_path: bool) -> Union[FastQuestionOneInput, QuestionOneInput]:
+    if fast_path:
+        return parse_question_one(body)
+    return validate_body(QuestionOneInput, body)
+
+
+def _question_two(body: bytes, fast_path: bool) -> Union[FastQuestionTwoInput, QuestionTwoInput]:
+    if fast_path:
+        return parse_question_two(body)
+    return validate_body(QuestionTwoInput, body)
+
+
+def _serialize(result: Dict[str, Any], fast_path: bool) -> bytes:
+    if fast_path:
+        return FastJSONResponse(result).body
+    return JSONResponse(jsonable_encoder(result)).body
+
+
+def warm_up(body: bytes = b"") -> int:
+    """No-op run once per worker at startup so the modules above are imported."""
+    return os.getpid()
+
+
+def question_one_manual(body: bytes, fast_path: bool) -> bytes:
+    input = _question_one(body, fast_path)
+    return _serialize(normalize_strings_manual(input.Type), fast_path)
+
+
+def question_one_built_in(body: bytes, fast_path: bool) -> bytes:
+    input = _question_one(body, fast_path)
+    return _serialize(normalize_strings_built_in(input.Type), fast_path)
+
+
+def question_two_iterative(body: bytes, fast_path: bool) -> bytes:
+    input = _question_two(body, fast_path)
+    return _serialize(flatten_dictionary_iterative(input.dictionary, input.delimiter), fast_path)
+
+
+def question_two_recursive(body: bytes, fast_path: bool) -> bytes:
+    input = _question_two(body, fast_path)
+    return _serialize(
+        flatten_dictionary_recursive(input.dictionary, input.parent_key, input.delimiter),
+        fast_path,
+    )
+
+
+def question_two_library(body: bytes, fast_path: bool) -> bytes:
+    input = _question_two(body, fast_path)
+    return _serialize(flatten_dictionary_library(input.dictionary, input.delimiter), fast_path)
+
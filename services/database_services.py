@@ -5,8 +5,16 @@ This module contains business logic for database operations,
 including query execution and data processing.
 """
 
-from typing import Dict, Any, Optional
-from connectors.database import Database
+import json
+from typing import Dict, Any, List, Optional, Tuple
+from connectors.database import ADHOC_QUERY, Database
+from connectors.replicas import get_replica_router
+from app.config import config
+from services.query_registry import NamedQuery
+from services.single_flight import SingleFlight, freeze
+
+# Identical named queries in flight anywhere in the process share one execution
+_single_flight = SingleFlight()
 
 
 class DatabaseService:
@@ -14,9 +22,13 @@ class DatabaseService:
 
     def __init__(self):
         self.db = Database()
+        self.replicas = get_replica_router()
 
     def execute_query(
-        self, query: str, params: Optional[Dict[str, Any]] = None
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        query_name: str = ADHOC_QUERY,
     ) -> Dict[str, Any]:
         """
         Execute a SQL query and return results.
@@ -24,14 +36,18 @@ class DatabaseService:
         Args:
             query: SQL query to execute
             params: Optional parameters for the query
+            query_name: Name the query is reported under in metrics
 
         Returns:
             Query results as dictionary
         """
-        return self.db.execute_query(query, params)
+        return self.db.execute_query(query, params, query_name)
 
     def execute_insert(
-        self, query: str, params: Optional[Dict[str, Any]] = None
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        query_name: str = ADHOC_QUERY,
     ) -> bool:
         """
         Execute an INSERT query.
@@ -39,24 +55,125 @@ class DatabaseService:
         Args:
             query: SQL INSERT query to execute
             params: Optional parameters for the query
+            query_name: Name the query is reported under in metrics
 
         Returns:
             Success status
         """
-        return self.db.execute_insert(query, params)
-
-    def execute_query_df(self, query: str, params: Optional[Dict[str, Any]] = None):
+        return self.db.execute_insert(query, params, query_name)
+
+    def execute_query_df(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        query_name: str = ADHOC_QUERY,
+    ):
         """
         Execute a SQL query and return results as DataFrame.
 
         Args:
             query: SQL query to execute
             params: Optional parameters for the query
+            query_name: Name the query is reported under in metrics
 
         Returns:
             Query results as pandas DataFrame
         """
-        return self.db.execute_query_df(query, params)
+        return self.db.execute_query_df(query, params, query_name)
+
+    def execute_named(
+        self, query: NamedQuery, params: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Execute a registered query as a server-side prepared statement.
+
+        Read-only queries are routed to a read replica when one is configured
+        and healthy. Concurrent identical read-only calls share one execution
+        and its result rows, which callers must not mutate.
+
+        Args:
+            query: Registered query to execute
+            params: Parameter values, validated against the query's declared types
+
+        Returns:
+            Result rows as dictionaries
+        """
+        bound = query.bind(params)
+
+        def execute(db: Database) -> List[Dict[str, Any]]:
+            return db.execute_prepared(
+                query.sql, bound, query.name, query.prepare, query.statement_timeout_ms
+            )
+
+        if not query.read_only:
+            return execute(self.db)
+        return self._coalesce(
+            (query.name, freeze(bound)),
+            lambda: self.replicas.run_read(execute),
+            query.name,
+        )
+
+    def execute_named_pipeline(
+        self,
+        queries: List[Tuple[NamedQuery, Optional[Dict[str, Any]]]],
+        pipeline_name: str = ADHOC_QUERY,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Execute several registered queries on one connection in pipeline mode.
+
+        The batch is routed to a read replica when every query in it is read-only.
+
+        Args:
+            queries: (query, params) pairs to execute
+            pipeline_name: Name the whole batch is reported under in metrics
+
+        Returns:
+            Result rows for each query, in order
+        """
+        statements = [
+            (query.sql, query.bind(params), query.name, query.prepare, query.statement_timeout_ms)
+            for query, params in queries
+        ]
+
+        def execute(db: Database) -> List[List[Dict[str, Any]]]:
+            return db.execute_pipeline(statements, pipeline_name)
+
+        if not all(query.read_only for query, _ in queries):
+            return execute(self.db)
+        return self._coalesce(
+            (pipeline_name, tuple((name, freeze(params)) for _, params, name, _, _ in statements)),
+            lambda: self.replicas.run_read(execute),
+            pipeline_name,
+        )
+
+    def _coalesce(self, key, func, name: str):
+        """Run a read through single-flight coalescing when it is enabled."""
+        if not config.single_flight_enabled:
+            return func()
+        return _single_flight.do(key, func, config.single_flight_timeout, name)
+
+    def explain_planning_time(
+        self, query: NamedQuery, params: Optional[Dict[str, Any]] = None
+    ) -> float:
+        """
+        Measure how long the planner takes for a registered query.
+
+        Args:
+            query: Registered query to plan
+            params: Parameter values, defaults to the query's defaults
+
+        Returns:
+            Planning time in milliseconds as reported by EXPLAIN
+        """
+        result = self.db.execute_query(
+            "EXPLAIN (SUMMARY ON, FORMAT JSON) " + query.sql,
+            query.bind(params),
+            f"{query.name}.explain",
+        )
+        plan = result["QUERY PLAN"]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Planning Time"]
 
     def test_connection(self) -> bool:
         """
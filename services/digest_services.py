@@ -0,0 +1,249 @@
+"""
+Resolution time digest services.
+
+This module serves resolution time percentiles from the digests kept in
+the resolution_time_digests table (migration 0005) instead of sorting the
+closed tickets. A digest is a histogram of ticket counts over logarithmic
+buckets of resolution time: bucket i > 0 counts resolution times in
+(DIGEST_GAMMA^(i-1), DIGEST_GAMMA^i] seconds and bucket 0 those of a second
+or less. Any percentile above a second read from it is within
+RELATIVE_ACCURACY of the exact value, and one of a second or less within
+BUCKET_ZERO_ACCURACY seconds of it. Digests of different companies or days
+merge by adding their counts, so the queries below only sum small rows.
+"""
+
+import math
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from services.database_services import DatabaseService
+from services.query_registry import query_registry
+from services.sql_query_services import FIRST_PAGE_CURSOR, PAGE_TIMEOUT_MS
+
+# Must match the base of crafty_resolution_time_bucket in migration 0005
+DIGEST_GAMMA = 1.02
+RELATIVE_ACCURACY = (DIGEST_GAMMA - 1) / (DIGEST_GAMMA + 1)
+
+# Bucket 0 holds every resolution time in [0, 1] seconds, so no value is
+# within a relative accuracy of all of them; its midpoint is within this
+# many seconds of each
+BUCKET_ZERO_VALUE = 0.5
+BUCKET_ZERO_ACCURACY = 0.5
+
+DEFAULT_PERCENTILES = (50.0, 90.0, 99.0)
+
+RESOLUTION_TIME_DIGESTS_BY_COMPANY_QUERY = """
+    SELECT
+        company_id,
+        ARRAY_AGG(bucket ORDER BY bucket) AS buckets,
+        ARRAY_AGG(tickets ORDER BY bucket) AS counts
+    FROM (
+        SELECT
+            rtd.company_id,
+            rtd.bucket,
+            SUM(rtd.tickets)::bigint AS tickets
+        FROM
+            resolution_time_digests rtd
+        WHERE
+            rtd.company_id > %(after_company_id)s
+            AND (%(company_ids)s::int[] IS NULL OR rtd.company_id = ANY(%(company_ids)s::int[]))
+            AND (%(start)s::date IS NULL OR rtd.closed_on >= %(start)s::date)
+            AND (%(end)s::date IS NULL OR rtd.closed_on < %(end)s::date)
+        GROUP BY
+            rtd.company_id, rtd.bucket
+        HAVING
+            SUM(rtd.tickets) > 0
+    ) digests
+    GROUP BY
+        company_id
+    ORDER BY
+        company_id
+    LIMIT %(page_size)s;
+"""
+
+RESOLUTION_TIME_DIGEST_QUERY = """
+    SELECT
+        rtd.bucket,
+        SUM(rtd.tickets)::bigint AS tickets
+    FROM
+        resolution_time_digests rtd
+    WHERE
+        (%(company_ids)s::int[] IS NULL OR rtd.company_id = ANY(%(company_ids)s::int[]))
+        AND (%(start)s::date IS NULL OR rtd.closed_on >= %(start)s::date)
+        AND (%(end)s::date IS NULL OR rtd.closed_on < %(end)s::date)
+    GROUP BY
+        rtd.bucket
+    HAVING
+        SUM(rtd.tickets) > 0;
+"""
+
+DIGEST_PARAMS = {"company_ids": list, "start": date, "end": date}
+DIGEST_DEFAULTS = {"company_ids": None, "start": None, "end": None}
+
+RESOLUTION_TIME_DIGESTS_BY_COMPANY = query_registry.register(
+    "get_resolution_time_digests_by_company",
+    RESOLUTION_TIME_DIGESTS_BY_COMPANY_QUERY,
+    params={**DIGEST_PARAMS, "after_company_id": int, "page_size": int},
+    defaults={**DIGEST_DEFAULTS, "after_company_id": FIRST_PAGE_CURSOR, "page_size": None},
+    statement_timeout_ms=PAGE_TIMEOUT_MS,
+)
+RESOLUTION_TIME_DIGEST = query_registry.register(
+    "get_resolution_time_digest",
+    RESOLUTION_TIME_DIGEST_QUERY,
+    params=DIGEST_PARAMS,
+    defaults=DIGEST_DEFAULTS,
+    statement_timeout_ms=PAGE_TIMEOUT_MS,
+)
+
+
+class LogHistogram:
+    """Mergeable digest of resolution times: ticket counts per logarithmic bucket."""
+
+    def __init__(self, counts: Optional[Dict[int, int]] = None):
+        self.counts: Dict[int, int] = dict(counts or {})
+
+    @classmethod
+    def from_buckets(cls, buckets: Iterable[int], counts: Iterable[int]) -> "LogHistogram":
+        return cls(dict(zip(buckets, counts)))
+
+    @staticmethod
+    def bucket(seconds: float) -> int:
+        """The bucket of a resolution time, as crafty_resolution_time_bucket computes it."""
+        if seconds <= 1:
+            return 0
+        return min(math.ceil(math.log(seconds) / math.log(DIGEST_GAMMA)), 32767)
+
+    @staticmethod
+    def value(bucket: int) -> float:
+        """
+        The resolution time a bucket stands for.
+
+        It is within RELATIVE_ACCURACY of the bucket's members, or for
+        bucket 0 within BUCKET_ZERO_ACCURACY seconds of them.
+        """
+        if bucket == 0:
+            return BUCKET_ZERO_VALUE
+        return 2 * DIGEST_GAMMA**bucket / (DIGEST_GAMMA + 1)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, seconds: float, count: int = 1):
+        """Count a resolution time."""
+        bucket = self.bucket(seconds)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+
+    def merge(self, other: "LogHistogram") -> "LogHistogram":
+        """Add another digest's counts to this one."""
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        return self
+
+    def quantiles(self, percentiles: Sequence[float]) -> List[Optional[float]]:
+        """
+        Estimate resolution times at several percentiles in one pass.
+
+        Percentiles follow percentile_disc: the smallest value with at least
+        that share of tickets at or below it.
+
+        Args:
+            percentiles: Percentiles between 0 and 100
+
+        Returns:
+            The estimated resolution time in seconds for each percentile, in
+            the order given, or None for each if the digest is empty
+        """
+        total = self.count
+        if total == 0:
+            return [None] * len(percentiles)
+        ranks = sorted(
+            (max(math.ceil(p / 100 * total), 1), index) for index, p in enumerate(percentiles)
+        )
+        values: List[Optional[float]] = [None] * len(percentiles)
+        position = 0
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            while position < len(ranks) and ranks[position][0] <= seen:
+                values[ranks[position][1]] = round(self.value(bucket), 3)
+                position += 1
+        return values
+
+
+class DigestService:
+    """Service class for percentiles served from resolution time digests."""
+
+    def __init__(self):
+        self.db_service = DatabaseService()
+
+    def get_resolution_time_percentiles(
+        self,
+        percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+        company_ids: Optional[List[int]] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        by_company: bool = True,
+        page_size: Optional[int] = None,
+        after_company_id: int = FIRST_PAGE_CURSOR,
+    ) -> Dict[str, Any]:
+        """
+        Get resolution time percentiles of closed tickets from the digests.
+
+        Args:
+            percentiles: Percentiles between 0 and 100
+            company_ids: Only include these companies
+            start: Only include tickets closed on or after this day
+            end: Only include tickets closed before this day
+            by_company: Percentiles per company if True, else over every
+                included ticket
+            page_size: Maximum companies to return when by company, all if None
+            after_company_id: Keyset cursor when by company; only companies
+                with a greater id are returned
+
+        Returns:
+            Dictionary with results containing ticket counts and a
+            p<percentile> resolution time in seconds for each percentile
+        """
+        for percentile in percentiles:
+            if not 0 <= percentile <= 100:
+                raise ValueError(f"Percentiles must be between 0 and 100, not {percentile}")
+        params = {"company_ids": company_ids, "start": start, "end": end}
+        response: Dict[str, Any] = {
+            "percentiles": list(percentiles),
+            "relative_accuracy": round(RELATIVE_ACCURACY, 6),
+            # Percentiles of a second or less are only this accurate
+            "min_accuracy_seconds": BUCKET_ZERO_ACCURACY,
+        }
+
+        if not by_company:
+            rows = self.db_service.execute_named(RESOLUTION_TIME_DIGEST, params)
+            digest = LogHistogram({row["bucket"]: row["tickets"] for row in rows})
+            response["results"] = [_percentile_row(digest, percentiles)]
+            return response
+
+        rows = self.db_service.execute_named(
+            RESOLUTION_TIME_DIGESTS_BY_COMPANY,
+            {**params, "after_company_id": after_company_id, "page_size": page_size},
+        )
+        response["results"] = [
+            {
+                "company_id": row["company_id"],
+                **_percentile_row(
+                    LogHistogram.from_buckets(row["buckets"], row["counts"]), percentiles
+                ),
+            }
+            for row in rows
+        ]
+        next_cursor = None
+        if page_size is not None and len(rows) == page_size:
+            next_cursor = rows[-1]["company_id"]
+        response["next_cursor"] = next_cursor
+        return response
+
+
+def _percentile_row(digest: LogHistogram, percentiles: Sequence[float]) -> Dict[str, Any]:
+    """Ticket count and percentile estimates of a digest, keyed p50, p99.9 and so on."""
+    row: Dict[str, Any] = {"ticket_count": digest.count}
+    for percentile, value in zip(percentiles, digest.quantiles(percentiles)):
+        row[f"p{percentile:g}"] = value
+    return row
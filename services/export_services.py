@@ -0,0 +1,245 @@
+"""
+Export services.
+
+This module contains business logic for bulk exports of the time-series
+tables. Rows are streamed with COPY ... TO STDOUT, so the data goes from the
+server to the client without being turned into Python row objects. CSV is
+passed through in chunks of COPY_CHUNK_SIZE bytes; Parquet and Arrow are
+built incrementally by parsing the CSV stream in blocks with pyarrow, one
+record batch at a time.
+"""
+
+import io
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from connectors.replicas import get_replica_router
+
+CSV = "csv"
+PARQUET = "parquet"
+ARROW = "arrow"
+FORMATS = (CSV, PARQUET, ARROW)
+
+MEDIA_TYPES = {
+    CSV: "text/csv",
+    PARQUET: "application/vnd.apache.parquet",
+    ARROW: "application/vnd.apache.arrow.stream",
+}
+
+# Bytes of CSV parsed into each Arrow record batch (and Parquet row group)
+ARROW_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Exportable tables: the column the time range filters on and each column
+# with its Arrow type name
+EXPORT_TABLES: Dict[str, Tuple[str, List[Tuple[str, str]]]] = {
+    "client_engagements": (
+        "timestamp",
+        [
+            ("engagement_id", "int32"),
+            ("timestamp", "timestamp"),
+            ("type", "string"),
+            ("contact_id", "int32"),
+            ("company_id", "int32"),
+        ],
+    ),
+    "support_tickets": (
+        "created_at",
+        [
+            ("ticket_id", "int32"),
+            ("created_at", "timestamp"),
+            ("closed_at", "timestamp"),
+            ("status", "string"),
+            ("subject", "string"),
+            ("company_id", "int32"),
+            ("contact_id", "int32"),
+            ("properties", "string"),
+        ],
+    ),
+}
+
+
+class ExportUnavailableError(Exception):
+    """Raised when an export format needs an optional dependency that is not installed."""
+
+
+class ExportService:
+    """Service class for bulk exports."""
+
+    def __init__(self):
+        self.replicas = get_replica_router()
+
+    def _copy_sql(self, table: str, file_format: str) -> str:
+        """Build the COPY statement exporting a table over an optional time range."""
+        time_column, columns = EXPORT_TABLES[table]
+        if file_format == CSV:
+            select = ", ".join(name for name, _ in columns)
+            options = "FORMAT csv, HEADER true"
+        else:
+            # Arrow cannot represent +-infinity; export them as nulls
+            select = ", ".join(
+                f"CASE WHEN isfinite({name}) THEN {name} END AS {name}"
+                if arrow_type == "timestamp"
+                else name
+                for name, arrow_type in columns
+            )
+            options = "FORMAT csv"
+        return (
+            f"COPY (SELECT {select} FROM {table} "
+            f"WHERE (%(start)s::timestamp IS NULL OR {time_column} >= %(start)s::timestamp) "
+            f"AND (%(end)s::timestamp IS NULL OR {time_column} < %(end)s::timestamp)) "
+            f"TO STDOUT WITH ({options})"
+        )
+
+    def export(
+        self,
+        table: str,
+        file_format: str = CSV,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Iterator[bytes]:
+        """
+        Export a table's rows in a time range.
+
+        Args:
+            table: One of EXPORT_TABLES
+            file_format: csv, parquet or arrow
+            start: Only rows at or after this time
+            end: Only rows before this time
+
+        Returns:
+            Iterator of file chunks, to be streamed to the client
+        """
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Unknown table {table}, expected one of {sorted(EXPORT_TABLES)}")
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown format {file_format}, expected one of {FORMATS}")
+        if start is not None and end is not None and start >= end:
+            raise ValueError("start must be before end")
+
+        if file_format != CSV:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ExportUnavailableError(f"{file_format} export requires pyarrow")
+
+        copy_sql = self._copy_sql(table, file_format)
+        params = {"start": start, "end": end}
+        query_name = f"export_{table}_{file_format}"
+        chunks = self._copy(copy_sql, params, query_name)
+        if file_format == CSV:
+            return chunks
+        return self._to_arrow(chunks, EXPORT_TABLES[table][1], file_format)
+
+    def _copy(self, query: str, params: dict, query_name: str) -> Iterator[bytes]:
+        """Stream a COPY from a read replica, or the primary if none is usable."""
+        with self.replicas.reading() as db:
+            yield from db.copy_out(query, params, query_name)
+
+    def _to_arrow(
+        self, chunks: Iterator[bytes], columns: List[Tuple[str, str]], file_format: str
+    ) -> Iterator[bytes]:
+        """Convert a headerless CSV stream to Parquet or an Arrow IPC stream, batch by batch."""
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+
+        types = {
+            "int32": pa.int32(),
+            "string": pa.string(),
+            "timestamp": pa.timestamp("us"),
+        }
+        schema = pa.schema([(name, types[arrow_type]) for name, arrow_type in columns])
+        sink = _ChunkSink()
+        if file_format == PARQUET:
+            writer = pq.ParquetWriter(sink, schema)
+        else:
+            writer = pa.ipc.new_stream(sink, schema)
+
+        source = _ChunkReader(chunks)
+        try:
+            # pyarrow refuses an empty CSV, so an empty range is written as a
+            # file with the schema and no rows
+            if source.peek():
+                reader = pa_csv.open_csv(
+                    source,
+                    read_options=pa_csv.ReadOptions(
+                        column_names=schema.names, block_size=ARROW_BLOCK_SIZE
+                    ),
+                    parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+                    convert_options=pa_csv.ConvertOptions(
+                        column_types=schema, strings_can_be_null=True
+                    ),
+                )
+                for batch in reader:
+                    writer.write_batch(batch)
+                    if sink.pending:
+                        yield sink.drain()
+        finally:
+            writer.close()
+            source.close()
+        yield sink.drain()
+
+
+class _ChunkReader(io.RawIOBase):
+    """Read-only file over an iterator of byte chunks."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def peek(self) -> bytes:
+        """Get the buffered data, fetching the next chunk if needed; empty at the end."""
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                break
+        return self._buffer
+
+    def readinto(self, buffer) -> int:
+        # Fill the whole buffer, across chunks, so pyarrow parses full blocks
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < len(view) and self.peek():
+            size = min(len(view) - filled, len(self._buffer))
+            view[filled:filled + size] = self._buffer[:size]
+            self._buffer = self._buffer[size:]
+            filled += size
+        return filled
+
+    def close(self):
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+        super().close()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects output until it is drained."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._chunks)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
@@ -0,0 +1,142 @@
+"""
+Health services.
+
+This module contains the background health checker behind the readiness
+probe. A daemon thread borrows a pooled connection every interval, runs a
+trivial query and records the result together with the pool statistics,
+the latency of the last real query and the replica health, so probes only
+ever read the cached status and never touch the database.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+from connectors.database import Database
+from connectors.replicas import get_replica_router
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+# Metrics label and query name used by the health check
+HEALTH_CHECK_QUERY = "health_check"
+
+# Seconds a health check waits for a pooled connection
+HEALTH_CHECK_TIMEOUT = 2.0
+
+# A status older than this many intervals means the checker is not running
+# (e.g. a Lambda execution environment that was frozen); it is still served,
+# marked stale, while the restarted checker catches up
+STALE_INTERVALS = 3
+
+# Reported until the first check has finished
+STARTING_STATUS = {"status": "starting", "database": "unknown", "checked_at": None}
+
+
+class HealthChecker:
+    """Periodically checks the database and caches the result for probes."""
+
+    def __init__(self, interval: float = 10.0):
+        self.db = Database()
+        self.replicas = get_replica_router()
+        self.interval = interval
+        self._status: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the background checker thread if it is not running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="health-checker", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background checker thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=HEALTH_CHECK_TIMEOUT + 1)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def refresh(self) -> Dict[str, Any]:
+        """
+        Check the primary and cache the result with the replicas' last check.
+
+        Returns:
+            The new status
+        """
+        error = None
+        try:
+            with self.db.pooled_connection(HEALTH_CHECK_QUERY, timeout=HEALTH_CHECK_TIMEOUT) as conn:
+                conn.execute("SELECT 1").fetchone()
+        except Exception as e:
+            error = str(e)
+            logger.warning("Health check failed: %s", e)
+
+        last_query = self.db.last_query()
+        stats = self.db.pool.get_stats()
+        in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+        status = {
+            "status": "healthy" if error is None else "unhealthy",
+            "database": "connected" if error is None else "disconnected",
+            "error": error,
+            # The check query itself says little about how real queries fare
+            "query_latency_ms": last_query["latency_ms"] if last_query else None,
+            "last_query": last_query,
+            "checked_at": time.time(),
+            "pool": {
+                "size": stats.get("pool_size", 0),
+                "available": stats.get("pool_available", 0),
+                "max": stats.get("pool_max", 0),
+                "requests_waiting": stats.get("requests_waiting", 0),
+                "saturation": round(in_use / stats["pool_max"], 3) if stats.get("pool_max") else 0,
+            },
+            "replicas": self.replicas.status(),
+        }
+        self._status = status
+        return status
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Get the cached status, starting the checker on first use.
+
+        Never checks the database itself, so a probe cannot pile up on a slow
+        or unreachable database.
+
+        Returns:
+            The last status with its age in seconds and whether it is stale,
+            or a starting status before the first check has finished
+        """
+        self.start()
+        status = self._status
+        if status is None:
+            return dict(STARTING_STATUS)
+        age = time.time() - status["checked_at"]
+        return {
+            **status,
+            "age_seconds": round(age, 3),
+            "stale": age > STALE_INTERVALS * self.interval,
+        }
+
+
+_checker: Optional[HealthChecker] = None
+_checker_lock = threading.Lock()
+
+
+def get_health_checker() -> HealthChecker:
+    """Get the process-wide health checker."""
+    global _checker
+    if _checker is None:
+        with _checker_lock:
+            if _checker is None:
+                _checker = HealthChecker(config.health_check_interval)
+    return _checker
@@ -0,0 +1,475 @@
+"""
+Bulk ingest services.
+
+This module contains the buffers behind the ingest endpoints. Each table has
+a bounded in-process buffer that requests append their rows to, and a
+flusher thread that writes the buffered rows with COPY, one transaction per
+batch, whenever a batch fills up or the oldest row has waited for the flush
+interval.
+
+A request is acknowledged either once its rows are buffered (enqueued) or
+once they are committed (durable); a durable request awaits its flush on
+the event loop rather than holding a worker thread. When a buffer is full,
+new rows are rejected instead of queueing without bound. Rows that fail to
+flush after their request was answered are kept in a bounded dead-letter
+queue per table until they are retried.
+"""
+
+import asyncio
+import copy
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+from psycopg import OperationalError
+from psycopg.types.json import Jsonb
+from app.config import config
+from app.metrics import (
+    INGEST_BUFFERED_ROWS,
+    INGEST_DEAD_LETTER_ROWS,
+    INGEST_FLUSH_DURATION,
+    INGEST_ROWS,
+)
+from connectors.database import Database
+
+ENQUEUED = "enqueued"
+DURABLE = "durable"
+ACK_MODES = (ENQUEUED, DURABLE)
+
+# Columns written for each table, in the order rows are given
+INGEST_TABLES: Dict[str, Tuple[str, ...]] = {
+    "client_engagements": ("timestamp", "type", "contact_id", "company_id"),
+    "support_tickets": (
+        "created_at",
+        "closed_at",
+        "status",
+        "subject",
+        "company_id",
+        "contact_id",
+        "properties",
+    ),
+}
+
+# A batch that fails to connect is retried after each of these delays
+FLUSH_RETRY_DELAYS = (0.5, 1.0, 2.0)
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBufferFull(Exception):
+    """Raised when a buffer has no room for a request's rows."""
+
+
+class IngestTimeout(TimeoutError):
+    """Raised when a durable request's rows were not flushed in time."""
+
+
+class _Submission:
+    """The rows of one request and the outcome of their flush."""
+
+    def __init__(self, rows: List[Sequence[Any]], awaited: bool = False):
+        self.rows = rows
+        self.enqueued_at = time.monotonic()
+        # Whether a durable request is still waiting to report the outcome
+        self.awaited = awaited
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def add_done_callback(self, callback: Callable[[], None]):
+        """Call callback once the rows are flushed, from the flusher thread, or now if they are."""
+        with self._lock:
+            if not self.done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def set_done(self, error: Optional[BaseException] = None) -> bool:
+        """
+        Record the outcome of the flush and run the done callbacks.
+
+        Returns:
+            Whether a durable request is still waiting to report it
+        """
+        with self._lock:
+            self.error = error
+            self.done.set()
+            awaited = self.awaited
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+        return awaited
+
+    def abandon(self) -> bool:
+        """Stop waiting for the flush, so a failure is dead-lettered; False if it already finished."""
+        with self._lock:
+            if self.done.is_set():
+                return False
+            self.awaited = False
+            return True
+
+    async def wait(self, timeout: float) -> bool:
+        """
+        Wait on the event loop for the rows to be flushed.
+
+        Args:
+            timeout: Seconds to wait
+
+        Returns:
+            True if they were flushed, False if the wait timed out
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve():
+            if not future.done():
+                future.set_result(None)
+
+        def notify():
+            try:
+                loop.call_soon_threadsafe(resolve)
+            except RuntimeError:
+                # The loop has closed; nobody is waiting any more
+                pass
+
+        self.add_done_callback(notify)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class IngestBuffer:
+    """Bounded buffer of rows for one table, flushed with COPY by a background thread."""
+
+    def __init__(
+        self,
+        table: str,
+        columns: Sequence[str],
+        capacity: int = 100_000,
+        batch_rows: int = 5000,
+        flush_interval: float = 0.5,
+    ):
+        self.table = table
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.db = Database()
+        self._copy_sql = f"COPY {table} ({', '.join(self.columns)}) FROM STDIN"
+        self._pending: Deque[_Submission] = deque()
+        self._rows = 0
+        self._dead_letters: Deque[_Submission] = deque()
+        self._dead_letter_rows = 0
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def buffered_rows(self) -> int:
+        return self._rows
+
+    @property
+    def dead_letter_rows(self) -> int:
+        return self._dead_letter_rows
+
+    def submit(self, rows: List[Sequence[Any]], awaited: bool = False) -> _Submission:
+        """
+        Buffer rows to be flushed.
+
+        Args:
+            rows: Rows of values in the order of the buffer's columns
+            awaited: Whether the caller waits for the flush and reports a
+                failure itself; otherwise failed rows are dead-lettered
+
+        Returns:
+            The submission, whose done event is set once the rows are flushed
+        """
+        submission = _Submission(rows, awaited)
+        with self._condition:
+            self._enqueue(submission)
+        return submission
+
+    def retry_dead_letters(self) -> int:
+        """
+        Buffer the dead-lettered rows to be flushed again.
+
+        Returns:
+            Number of rows requeued; rows that fail again are dead-lettered again
+        """
+        requeued = 0
+        with self._condition:
+            # Oldest first, while the buffer has room; the rest stay dead-lettered
+            while self._dead_letters:
+                rows = self._dead_letters[0].rows
+                if self._rows + len(rows) > self.capacity:
+                    break
+                self._dead_letters.popleft()
+                self._dead_letter_rows -= len(rows)
+                self._enqueue(_Submission(rows))
+                requeued += len(rows)
+        return requeued
+
+    def _enqueue(self, submission: _Submission):
+        """Append a submission to the buffer; called with the condition held."""
+        rows = submission.rows
+        if self._rows + len(rows) > self.capacity:
+            INGEST_ROWS.inc(len(rows), table=self.table, outcome="rejected")
+            raise IngestBufferFull(
+                f"The {self.table} ingest buffer is full ({self._rows} of {self.capacity} rows)"
+            )
+        self._pending.append(submission)
+        self._rows += len(rows)
+        if self._rows >= self.batch_rows or len(self._pending) == 1:
+            self._condition.notify()
+        self._start()
+
+    def _start(self):
+        """Start the flusher thread; called with the condition held."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name=f"ingest-{self.table}", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Flush whatever is buffered and stop the flusher thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._flush(batch)
+
+    def _next_batch(self) -> Optional[List[_Submission]]:
+        """Wait for a full batch, or for the oldest row to have waited the flush interval."""
+        with self._condition:
+            while not self._pending:
+                if self._stopping:
+                    return None
+                self._condition.wait()
+            deadline = self._pending[0].enqueued_at + self.flush_interval
+            while self._rows < self.batch_rows and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            # Whole submissions, at least one, up to the batch size
+            batch = [self._pending.popleft()]
+            rows = len(batch[0].rows)
+            while self._pending and rows + len(self._pending[0].rows) <= self.batch_rows:
+                submission = self._pending.popleft()
+                batch.append(submission)
+                rows += len(submission.rows)
+            self._rows -= rows
+            return batch
+
+    def _flush(self, batch: List[_Submission]):
+        """
+        Write a batch in one COPY; if its rows are rejected, write each submission on its own.
+
+        Only the batch is retried while the database is unreachable; once
+        those retries are exhausted every submission in it fails at once.
+        """
+        try:
+            self._copy([row for submission in batch for row in submission.rows])
+        except (ConnectionError, OperationalError) as e:
+            for submission in batch:
+                self._finish(submission, e)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                self._finish(batch[0], e)
+                return
+            # Keep one bad request from failing the others in its batch
+            for submission in batch:
+                try:
+                    self._copy(submission.rows, retry=False)
+                except Exception as error:
+                    self._finish(submission, error)
+                else:
+                    self._finish(submission)
+            return
+        for submission in batch:
+            self._finish(submission)
+
+    def _copy(self, rows: List[Sequence[Any]], retry: bool = True):
+        """COPY rows in one transaction, retrying while the database is unreachable if retry."""
+        delays = FLUSH_RETRY_DELAYS if retry else ()
+        for delay in delays + (None,):
+            start = time.perf_counter()
+            try:
+                self.db.copy_in(self._copy_sql, rows, f"ingest_{self.table}")
+                return
+            except (ConnectionError, OperationalError) as e:
+                if delay is None:
+                    raise
+                logger.warning(
+                    "Ingest flush to %s failed, retrying in %ss: %s", self.table, delay, e
+                )
+                time.sleep(delay)
+            finally:
+                INGEST_FLUSH_DURATION.observe(time.perf_counter() - start, table=self.table)
+
+    def _finish(self, submission: _Submission, error: Optional[BaseException] = None):
+        if error is None:
+            INGEST_ROWS.inc(len(submission.rows), table=self.table, outcome="written")
+            submission.set_done()
+            return
+        INGEST_ROWS.inc(len(submission.rows), table=self.table, outcome="failed")
+        if submission.set_done(error):
+            logger.info(
+                "Ingest of %d rows into %s failed: %s", len(submission.rows), self.table, error
+            )
+            return
+        # Nobody is waiting to report it: the request was already answered
+        logger.error(
+            "Ingest of %d acknowledged rows into %s failed, dead-lettered: %s",
+            len(submission.rows),
+            self.table,
+            error,
+        )
+        self._dead_letter(submission)
+
+    def _dead_letter(self, submission: _Submission):
+        """Keep a failed submission for a retry, dropping the oldest beyond the buffer capacity."""
+        with self._condition:
+            self._dead_letters.append(submission)
+            self._dead_letter_rows += len(submission.rows)
+            while self._dead_letter_rows > self.capacity and len(self._dead_letters) > 1:
+                dropped = self._dead_letters.popleft()
+                self._dead_letter_rows -= len(dropped.rows)
+                INGEST_ROWS.inc(len(dropped.rows), table=self.table, outcome="dropped")
+                logger.error(
+                    "Dropped %d dead-lettered rows for %s: the queue is full",
+                    len(dropped.rows),
+                    self.table,
+                )
+
+
+class IngestService:
+    """Service class for buffered bulk ingest."""
+
+    def __init__(self):
+        self.buffers = {
+            table: IngestBuffer(
+                table,
+                columns,
+                config.ingest_buffer_rows,
+                config.ingest_batch_rows,
+                config.ingest_flush_interval,
+            )
+            for table, columns in INGEST_TABLES.items()
+        }
+        INGEST_BUFFERED_ROWS.set_function(
+            lambda: {(table,): buffer.buffered_rows for table, buffer in self.buffers.items()}
+        )
+        INGEST_DEAD_LETTER_ROWS.set_function(
+            lambda: {(table,): buffer.dead_letter_rows for table, buffer in self.buffers.items()}
+        )
+
+    async def ingest(
+        self, table: str, rows: List[Dict[str, Any]], ack: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Buffer rows for a table and acknowledge them.
+
+        A durable request awaits the flush without blocking the event loop or
+        a worker thread.
+
+        Args:
+            table: One of INGEST_TABLES
+            rows: Rows as dictionaries keyed by column; missing columns are NULL
+            ack: enqueued to return once buffered, durable to wait for the
+                commit; INGEST_ACK if None
+
+        Returns:
+            Dictionary with the number of rows accepted and how they were acknowledged
+        """
+        ack = ack or config.ingest_ack
+        if ack not in ACK_MODES:
+            raise ValueError(f"ack must be one of {', '.join(ACK_MODES)}, not {ack}")
+        if config.is_lambda:
+            # A frozen Lambda environment would never flush rows acknowledged early
+            ack = DURABLE
+
+        buffer = self.buffers[table]
+        submission = buffer.submit([_row(row, buffer.columns) for row in rows], ack == DURABLE)
+        if ack == DURABLE:
+            # Past the timeout the client is answered, so a later failure is
+            # dead-lettered like an enqueued one
+            if not await submission.wait(config.ingest_ack_timeout) and submission.abandon():
+                raise IngestTimeout(
+                    f"Rows were not flushed within {config.ingest_ack_timeout}s; "
+                    "they may still be written"
+                )
+            if submission.error is not None:
+                # A failed batch hands one error to every request in it;
+                # each raises its own copy so their tracebacks do not mix
+                raise _copy_error(submission.error) from submission.error
+        return {"table": table, "rows": len(rows), "ack": ack}
+
+    def dead_letters(self) -> Dict[str, int]:
+        """
+        Get how many dead-lettered rows each table holds.
+
+        Returns:
+            Dictionary of row counts keyed by table
+        """
+        return {table: buffer.dead_letter_rows for table, buffer in self.buffers.items()}
+
+    def retry_dead_letters(self) -> Dict[str, int]:
+        """
+        Buffer every table's dead-lettered rows to be flushed again.
+
+        Returns:
+            Dictionary of the rows requeued, keyed by table
+        """
+        return {table: buffer.retry_dead_letters() for table, buffer in self.buffers.items()}
+
+    def stop(self, timeout: Optional[float] = None):
+        """Flush every buffer and stop the flusher threads."""
+        for buffer in self.buffers.values():
+            buffer.stop(timeout)
+
+
+def _copy_error(error: BaseException) -> BaseException:
+    """A fresh exception of the flush error's type and arguments for one request to raise."""
+    try:
+        return copy.copy(error)
+    except Exception:
+        return RuntimeError(f"The ingest flush failed: {error!r}")
+
+
+def _row(values: Dict[str, Any], columns: Sequence[str]) -> Tuple[Any, ...]:
+    """Order a row's values as the COPY columns, adapting JSON values."""
+    return tuple(
+        Jsonb(values[column]) if isinstance(values.get(column), (dict, list)) else values.get(column)
+        for column in columns
+    )
+
+
+_ingest_service: Optional[IngestService] = None
+_ingest_service_lock = threading.Lock()
+
+
+def get_ingest_service() -> IngestService:
+    """Get the process-wide ingest service."""
+    global _ingest_service
+    if _ingest_service is None:
+        with _ingest_service_lock:
+            if _ingest_service is None:
+                _ingest_service = IngestService()
+    return _ingest_service
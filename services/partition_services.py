@@ -0,0 +1,63 @@
+"""
+Partition maintenance services.
+
+This module contains business logic for keeping the monthly range partitions
+of the time-series tables ahead of the clock and detaching old ones.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+from connectors.database import Database
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("client_engagements", "support_tickets")
+
+
+class PartitionService:
+    """Service class for partition maintenance."""
+
+    def __init__(self):
+        self.db = Database()
+
+    def maintain(
+        self,
+        months_ahead: Optional[int] = None,
+        retain_months: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Create upcoming monthly partitions and detach expired ones.
+
+        Args:
+            months_ahead: Months of future partitions to create, defaults to config
+            retain_months: Months of partitions to keep attached, defaults to config
+
+        Returns:
+            List of created and detached partitions
+        """
+        if months_ahead is None:
+            months_ahead = config.partition_months_ahead
+        if retain_months is None:
+            retain_months = config.partition_retain_months
+
+        conn = self.db.get_connection()
+        changes = []
+        try:
+            with conn.cursor() as cursor:
+                for table in PARTITIONED_TABLES:
+                    cursor.execute(
+                        "SELECT action, partition_name FROM crafty_maintain_partitions(%s, %s, %s)",
+                        (table, months_ahead, retain_months),
+                    )
+                    changes.extend(
+                        {"table": table, **row} for row in cursor.fetchall()
+                    )
+            conn.commit()
+            return changes
+        except Exception as e:
+            logger.error("Partition maintenance failed: %s", e)
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
@@ -0,0 +1,114 @@
+"""
+Named query registry.
+
+This module contains the registry the analytics SQL is declared in. Each
+query has a name, its SQL text, the types of its parameters and defaults
+used when the query is planned for statistics. Registered queries are
+executed as server-side prepared statements on pooled connections.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional
+
+
+@dataclass(frozen=True)
+class NamedQuery:
+    """A SQL statement declared once and executed by name."""
+
+    name: str
+    sql: str
+    params: Dict[str, type] = field(default_factory=dict)
+    defaults: Dict[str, Any] = field(default_factory=dict)
+    # True prepares on first execution, False never prepares, None defers
+    # to the connection's prepare threshold
+    prepare: Optional[bool] = None
+    # Read-only queries may be routed to a read replica
+    read_only: bool = True
+    # Budget after which the database cancels the query, None keeps the
+    # server's statement_timeout
+    statement_timeout_ms: Optional[int] = None
+
+    def bind(self, values: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Validate and coerce parameter values against the declared types.
+
+        Args:
+            values: Parameter values; missing ones fall back to the defaults
+
+        Returns:
+            Parameters ready to be sent with the query
+        """
+        values = {**self.defaults, **(values or {})}
+        unknown = set(values) - set(self.params)
+        if unknown:
+            raise ValueError(f"Unknown parameters for query {self.name}: {sorted(unknown)}")
+
+        bound = {}
+        for name, expected in self.params.items():
+            if name not in values:
+                raise ValueError(f"Missing parameter {name} for query {self.name}")
+            value = values[name]
+            if value is not None and not isinstance(value, expected):
+                try:
+                    value = expected(value)
+                except (TypeError, ValueError):
+                    raise TypeError(
+                        f"Parameter {name} for query {self.name} must be {expected.__name__}"
+                    )
+            bound[name] = value
+        return bound
+
+
+class QueryRegistry:
+    """Registry of named queries."""
+
+    def __init__(self):
+        self._queries: Dict[str, NamedQuery] = {}
+
+    def register(
+        self,
+        name: str,
+        sql: str,
+        params: Optional[Dict[str, type]] = None,
+        defaults: Optional[Dict[str, Any]] = None,
+        prepare: Optional[bool] = None,
+        read_only: bool = True,
+        statement_timeout_ms: Optional[int] = None,
+    ) -> NamedQuery:
+        """
+        Declare a named query.
+
+        Args:
+            name: Unique query name, also used as its metrics label
+            sql: SQL text with %(name)s placeholders
+            params: Parameter names and their types
+            defaults: Default parameter values
+            prepare: Prepare policy, see NamedQuery.prepare
+            read_only: Whether the query may run on a read replica
+            statement_timeout_ms: Budget in milliseconds after which the
+                database cancels the query
+
+        Returns:
+            The registered query
+        """
+        if name in self._queries:
+            raise ValueError(f"Query {name} is already registered")
+        query = NamedQuery(
+            name, sql, params or {}, defaults or {}, prepare, read_only, statement_timeout_ms
+        )
+        self._queries[name] = query
+        return query
+
+    def get(self, name: str) -> NamedQuery:
+        """Get a registered query by name."""
+        try:
+            return self._queries[name]
+        except KeyError:
+            raise KeyError(f"Unknown query {name}")
+
+    def __iter__(self) -> Iterator[NamedQuery]:
+        return iter(self._queries.values())
+
+
+# Global query registry
+query_registry = QueryRegistry()
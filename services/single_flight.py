@@ -0,0 +1,185 @@
+"""
+Single-flight coalescing of identical concurrent calls.
+
+The first caller for a key (the leader) runs the call; callers arriving with
+the same key while it is in flight (followers) wait for it and get the same
+result, or a copy of its exception chained from the leader's, instead of
+running the call again. A follower that waits
+longer than its timeout gives up with SingleFlightTimeout while the leader
+carries on. Results are shared between callers and must not be mutated.
+
+The call runs in a cancel scope of its own rather than the leader's. A
+caller whose request is cancelled (its client disconnected) stops waiting,
+and the call itself is cancelled only once no caller is left waiting for it.
+"""
+
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, TypeVar
+from app.metrics import (
+    SINGLE_FLIGHT_ABANDONED,
+    SINGLE_FLIGHT_CALLS,
+    SINGLE_FLIGHT_SAVED,
+    SINGLE_FLIGHT_TIMEOUTS,
+)
+from connectors.cancellation import CancelScope, QueryCancelled, cancel_scope, current_scope
+
+T = TypeVar("T")
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Raised to a follower whose shared call did not finish in time."""
+
+
+class SingleFlightError(RuntimeError):
+    """Raised to a follower when the leader's exception cannot be copied."""
+
+
+class _Waiter:
+    """One caller waiting on a call."""
+
+    def __init__(self):
+        self.wake = threading.Event()
+        self.left = False
+
+
+class _Call:
+    """An in-flight call and its outcome."""
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.scope = CancelScope()
+        # Callers currently waiting on the call, the leader included
+        self.waiters = 1
+        self.followers: List[_Waiter] = []
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(
+        self,
+        key: Hashable,
+        func: Callable[[], T],
+        timeout: Optional[float] = None,
+        name: str = "adhoc",
+    ) -> T:
+        """
+        Run func, or wait for the identical call already in flight.
+
+        Args:
+            key: Identifies identical calls, e.g. query name and parameters
+            func: The call to run when no identical call is in flight
+            timeout: Seconds a follower waits before giving up, None waits forever
+            name: Name the call is reported under in metrics
+
+        Returns:
+            The result of the shared call
+        """
+        waiter = _Waiter()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call(key)
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+                call.followers.append(waiter)
+
+        scope = current_scope()
+        if scope is not None:
+            scope.on_cancel(lambda: self._abandon(call, waiter, name))
+
+        if leader:
+            SINGLE_FLIGHT_CALLS.inc(query=name, role="leader")
+            try:
+                with cancel_scope(call.scope):
+                    call.result = func()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                    call.done.set()
+                for follower in call.followers:
+                    follower.wake.set()
+
+        SINGLE_FLIGHT_CALLS.inc(query=name, role="follower")
+        waiter.wake.wait(timeout)
+        with self._lock:
+            finished = call.done.is_set()
+            last = not finished and self._leave(call, waiter)
+        if last:
+            call.scope.cancel()
+        if not finished:
+            if scope is not None and scope.cancelled:
+                raise QueryCancelled(
+                    f"The request waiting for the in-flight {name} call was cancelled"
+                )
+            SINGLE_FLIGHT_TIMEOUTS.inc(query=name)
+            raise SingleFlightTimeout(
+                f"Timed out after {timeout}s waiting for the in-flight {name} call"
+            )
+        SINGLE_FLIGHT_SAVED.inc(query=name)
+        if call.error is not None:
+            # Each follower raises its own exception, so tracebacks and
+            # handlers do not mutate the instance the leader and others see
+            raise _copy_error(call.error, name) from call.error
+        return call.result
+
+    def _leave(self, call: _Call, waiter: _Waiter) -> bool:
+        """
+        Stop waiting on a call; called with the lock held.
+
+        Returns:
+            True if this was the last caller waiting, so the call should be cancelled
+        """
+        if waiter.left:
+            return False
+        waiter.left = True
+        call.waiters -= 1
+        if call.waiters > 0:
+            return False
+        # Later identical calls start afresh instead of joining a cancelled one
+        if self._calls.get(call.key) is call:
+            del self._calls[call.key]
+        return True
+
+    def _abandon(self, call: _Call, waiter: _Waiter, name: str):
+        """Withdraw a caller whose request was cancelled, cancelling the call if it was the last."""
+        with self._lock:
+            if call.done.is_set() or waiter.left:
+                return
+            last = self._leave(call, waiter)
+        SINGLE_FLIGHT_ABANDONED.inc(query=name)
+        waiter.wake.set()
+        if last:
+            call.scope.cancel()
+
+
+def freeze(value: Any) -> Hashable:
+    """Turn query parameters into a hashable key, recursively."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def _copy_error(error: BaseException, name: str) -> BaseException:
+    """A fresh exception of the leader's type and arguments for one follower to raise."""
+    try:
+        return copy.copy(error)
+    except Exception:
+        return SingleFlightError(f"The in-flight {name} call failed: {error!r}")
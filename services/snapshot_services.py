@@ -0,0 +1,334 @@
+"""
+Analytics snapshot services.
+
+This module contains the scheduler that precomputes every SQLQueryService
+analytic with its default parameters. Snapshots are kept in memory, so a
+request is answered with a dictionary lookup, and persisted to the
+analytics_snapshots table, so other processes and the scheduled Lambda
+refresh share them.
+
+Snapshots are served stale-while-revalidate: once a snapshot is older than
+the refresh interval, the request that notices still gets it immediately
+and a background refresh is started. On Lambda, where a background thread
+would be frozen with the execution environment, the request instead reloads
+what the scheduled refresh persisted. The persisted snapshots are first
+loaded with the app (see app.main's lifespan), never by a request; until
+then requests run the live query. Past the maximum staleness a snapshot
+is no longer served and requests run the live query. Refreshes never
+overlap: one at a time per process, and one at a time across processes
+through a session advisory lock held on a dedicated connection.
+"""
+
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from fastapi.encoders import jsonable_encoder
+from psycopg import Error as PsycopgError
+from psycopg.types.json import Jsonb
+from app.config import config
+from app.metrics import SNAPSHOT_AGE, SNAPSHOT_REFRESH_DURATION, SNAPSHOT_REFRESHES
+from connectors.database import Database
+from services.sql_query_services import SQLQueryService
+
+# SQLQueryService methods that are snapshotted, called with their defaults
+SNAPSHOT_ANALYTICS = (
+    "get_engagement_counts_by_company",
+    "get_average_resolution_time_by_company",
+    "get_ticket_counts_by_engagement_bucket",
+    "get_ticket_counts_by_engagement_bucket_alternative",
+)
+
+# Arbitrary constant identifying the snapshot refresh advisory lock
+SNAPSHOT_LOCK_ID = 72011002
+
+# Metrics label for the snapshot table reads and writes
+SNAPSHOT_QUERY = "analytics_snapshots"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """The result of an analytic at a point in time."""
+
+    name: str
+    result: Dict[str, Any]
+    refreshed_at: float
+    duration_ms: float
+
+    @property
+    def age(self) -> float:
+        """Seconds since the snapshot was computed."""
+        return max(0.0, time.time() - self.refreshed_at)
+
+
+class SnapshotService:
+    """Service class for precomputed analytics snapshots."""
+
+    def __init__(
+        self,
+        interval: float = 60.0,
+        jitter: float = 0.1,
+        max_stale: float = 600.0,
+    ):
+        self.sql_service = SQLQueryService()
+        self.db = Database()
+        self.interval = interval
+        self.jitter = jitter
+        self.max_stale = max_stale
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._loaded_at: Optional[float] = None
+        self._refresh_lock = threading.Lock()
+        self._revalidating = False
+        self._state_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        SNAPSHOT_AGE.set_function(
+            lambda: {(name,): snapshot.age for name, snapshot in self._snapshots.items()}
+        )
+
+    def get(self, name: str) -> Optional[Snapshot]:
+        """
+        Get the latest snapshot of an analytic.
+
+        A stale snapshot is still returned and triggers a background refresh,
+        or on Lambda a reload of the persisted snapshots. Before the first
+        load nothing is served; outside Lambda a background refresh, which
+        loads the persisted snapshots first, is started instead.
+
+        Args:
+            name: One of SNAPSHOT_ANALYTICS
+
+        Returns:
+            The snapshot, or None if there is none fresh enough to serve
+        """
+        if not self.loaded:
+            # The lifespan has not loaded them yet; do not block the request
+            self.revalidate()
+            return None
+        snapshot = self._snapshots.get(name)
+        if snapshot is None or snapshot.age >= self.interval:
+            if config.is_lambda:
+                # The scheduled refresh_handler recomputes them; reload at
+                # most once per half interval
+                if time.monotonic() - self._loaded_at >= self.interval / 2:
+                    self.load()
+                    snapshot = self._snapshots.get(name)
+            else:
+                self.revalidate()
+        if snapshot is None or snapshot.age > self.max_stale:
+            return None
+        return snapshot
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the persisted snapshots have been loaded in this process."""
+        return self._loaded_at is not None
+
+    def get_dashboard(self) -> Optional[Snapshot]:
+        """
+        Get the default dashboard assembled from the snapshots of its analytics.
+
+        Returns:
+            A snapshot as old as its oldest part, or None if a part is missing
+        """
+        parts = [self.get(name) for name in SNAPSHOT_ANALYTICS]
+        if any(part is None for part in parts):
+            return None
+        counts, resolution_times, buckets, rolling_window_buckets = parts
+        return Snapshot(
+            "get_dashboard",
+            {
+                "engagement_counts": {"results": counts.result["results"]},
+                "average_resolution_time": {"results": resolution_times.result["results"]},
+                "engagement_buckets": {"results": buckets.result["results"]},
+                "engagement_buckets_rolling_window": {
+                    "results": rolling_window_buckets.result["results"]
+                },
+            },
+            min(part.refreshed_at for part in parts),
+            sum(part.duration_ms for part in parts),
+        )
+
+    def load(self) -> int:
+        """
+        Load persisted snapshots that are newer than the ones in memory.
+
+        Returns:
+            Number of snapshots updated
+        """
+        self._loaded_at = time.monotonic()
+        try:
+            with self.db.pooled_connection(SNAPSHOT_QUERY) as conn:
+                rows = conn.execute(
+                    """
+                    SELECT name, result, EXTRACT(EPOCH FROM refreshed_at)::float AS refreshed_at,
+                           duration_ms
+                    FROM analytics_snapshots
+                    """
+                ).fetchall()
+        except (ConnectionError, PsycopgError) as e:
+            logger.warning("Loading analytics snapshots failed: %s", e)
+            return 0
+
+        updated = 0
+        for row in rows:
+            current = self._snapshots.get(row["name"])
+            if row["name"] in SNAPSHOT_ANALYTICS and (
+                current is None or current.refreshed_at < row["refreshed_at"]
+            ):
+                self._snapshots[row["name"]] = Snapshot(
+                    row["name"], row["result"], row["refreshed_at"], row["duration_ms"]
+                )
+                updated += 1
+        return updated
+
+    def refresh(self, max_age: Optional[float] = None) -> List[str]:
+        """
+        Recompute and persist the snapshots.
+
+        Does nothing if a refresh is already running in this or another
+        process. Snapshots another process refreshed within max_age seconds
+        are loaded instead of recomputed.
+
+        Args:
+            max_age: Only recompute snapshots older than this, all if None
+
+        Returns:
+            Names of the recomputed analytics
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return []
+        conn = None
+        try:
+            # The lock is held for the whole refresh, so it is taken on a
+            # connection of its own, in autocommit mode rather than a pooled
+            # connection left idle in a transaction, and released with it
+            conn = self.db.get_connection()
+            conn.autocommit = True
+            locked = conn.execute(
+                "SELECT pg_try_advisory_lock(%s) AS locked", (SNAPSHOT_LOCK_ID,)
+            ).fetchone()["locked"]
+            if not locked:
+                logger.info("Snapshots are being refreshed by another process")
+                return []
+            try:
+                return self._refresh(conn, max_age)
+            finally:
+                conn.execute("SELECT pg_advisory_unlock(%s)", (SNAPSHOT_LOCK_ID,))
+        except Exception:
+            # Must not kill the scheduler or revalidation thread
+            logger.exception("Snapshot refresh failed")
+            return []
+        finally:
+            if conn is not None:
+                self.db.close_connection()
+            self._refresh_lock.release()
+
+    def _refresh(self, conn, max_age: Optional[float]) -> List[str]:
+        """Recompute stale snapshots while holding the refresh lock, persisting them on its autocommit connection."""
+        self.load()
+        refreshed = []
+        for name in SNAPSHOT_ANALYTICS:
+            current = self._snapshots.get(name)
+            if max_age is not None and current is not None and current.age < max_age:
+                continue
+
+            start = time.perf_counter()
+            try:
+                result = getattr(self.sql_service, name)()
+            except Exception as e:
+                logger.error("Refreshing snapshot %s failed: %s", name, e)
+                SNAPSHOT_REFRESHES.inc(analytic=name, outcome="error")
+                continue
+            duration = time.perf_counter() - start
+            SNAPSHOT_REFRESH_DURATION.observe(duration, analytic=name)
+            SNAPSHOT_REFRESHES.inc(analytic=name, outcome="ok")
+
+            snapshot = Snapshot(name, result, time.time(), round(duration * 1000, 3))
+            self._snapshots[name] = snapshot
+            refreshed.append(name)
+            try:
+                conn.execute(
+                    """
+                    INSERT INTO analytics_snapshots (Name, Result, Refreshed_at, Duration_ms)
+                    VALUES (%s, %s, to_timestamp(%s), %s)
+                    ON CONFLICT (Name) DO UPDATE
+                    SET Result = EXCLUDED.Result,
+                        Refreshed_at = EXCLUDED.Refreshed_at,
+                        Duration_ms = EXCLUDED.Duration_ms
+                    """,
+                    (name, Jsonb(jsonable_encoder(result)), snapshot.refreshed_at, snapshot.duration_ms),
+                )
+            except PsycopgError as e:
+                logger.error("Persisting snapshot %s failed: %s", name, e)
+        return refreshed
+
+    def revalidate(self):
+        """
+        Refresh the snapshots in the background unless a refresh is already under way.
+
+        Does nothing on Lambda, where the thread would be frozen between
+        invocations; the scheduled refresh_handler keeps them fresh there.
+        """
+        if config.is_lambda:
+            return
+        with self._state_lock:
+            if self._revalidating:
+                return
+            self._revalidating = True
+
+        def run():
+            try:
+                self.refresh(self.interval / 2)
+            finally:
+                self._revalidating = False
+
+        threading.Thread(target=run, name="snapshot-revalidate", daemon=True).start()
+
+    def start(self):
+        """Start the scheduler thread refreshing the snapshots every interval."""
+        with self._state_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="snapshot-scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop the scheduler thread."""
+        self._stop.set()
+
+    def _run(self):
+        # Spread the first refresh so instances started together do not
+        # refresh in lockstep
+        self._stop.wait(random.uniform(0, self.jitter * self.interval))
+        while not self._stop.is_set():
+            # Snapshots refreshed in the last half interval, by another
+            # process or a revalidation, are not recomputed
+            self.refresh(self.interval / 2)
+            delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+            self._stop.wait(delay)
+
+
+_snapshot_service: Optional[SnapshotService] = None
+_snapshot_service_lock = threading.Lock()
+
+
+def get_snapshot_service() -> SnapshotService:
+    """Get the process-wide snapshot service."""
+    global _snapshot_service
+    if _snapshot_service is None:
+        with _snapshot_service_lock:
+            if _snapshot_service is None:
+                _snapshot_service = SnapshotService(
+                    config.snapshot_interval,
+                    config.snapshot_jitter,
+                    config.snapshot_max_stale,
+                )
+    return _snapshot_service
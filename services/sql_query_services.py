@@ -5,8 +5,285 @@ This module contains business logic for SQL query operations,
 including complex analytics queries and data processing.
 """
 
-from typing import Dict, Any
+import math
+import time
+from statistics import NormalDist
+from typing import Dict, Any, List, Optional, Tuple
+from app.config import config
+from app.metrics import DB_PREPARED_EXECUTIONS
+from services.columnar_services import get_columnar_engine
 from services.database_services import DatabaseService
+from services.query_registry import NamedQuery, query_registry
+
+ENGAGEMENT_COUNTS_QUERY = """
+    SELECT
+        ce.Company_id,
+        COUNT(DISTINCT ce.Engagement_id) AS engagements_last_month
+    FROM 
+        client_engagements ce
+    WHERE
+        ce.Timestamp >= CURRENT_TIMESTAMP - make_interval(days => %(window_days)s)
+        AND ce.Company_id > %(after_company_id)s
+        AND (%(company_ids)s::int[] IS NULL OR ce.Company_id = ANY(%(company_ids)s::int[]))
+    GROUP BY
+        ce.Company_id
+    ORDER BY
+        ce.Company_id
+    LIMIT %(page_size)s;
+"""
+
+AVERAGE_RESOLUTION_TIME_QUERY = """
+    SELECT
+        st.company_id,
+        ROUND(AVG(EXTRACT(EPOCH FROM (st.closed_at::timestamp - st.created_at::timestamp)))) AS avg_resolution_time_seconds
+    FROM 
+        support_tickets st
+    WHERE
+        st.status = 'Closed'
+        AND st.closed_at IS NOT NULL
+        AND st.company_id > %(after_company_id)s
+        AND (%(company_ids)s::int[] IS NULL OR st.company_id = ANY(%(company_ids)s::int[]))
+    GROUP BY
+        st.company_id
+    ORDER BY
+        st.company_id
+    LIMIT %(page_size)s;
+"""
+
+ENGAGEMENT_BUCKET_QUERY = """
+    WITH company_buckets AS (
+        SELECT
+            engagement.company_id,
+            /*
+            this calculates the engagement count twice, it simplifies the query but
+            I could separate this into another CTE to avoid the unnecessary compute
+            */
+            CASE
+                WHEN COUNT(engagement.engagement_id) > %(high_threshold)s THEN 'high'
+                WHEN COUNT(engagement.engagement_id) BETWEEN %(medium_threshold)s AND %(high_threshold)s THEN 'medium'
+                ELSE 'low'
+            END AS bucket,
+            COUNT(ticket.ticket_id) AS ticket_count
+        FROM
+            client_engagements engagement
+        JOIN 
+            support_tickets ticket
+        USING(company_id)
+        WHERE 
+            engagement.Timestamp >= CURRENT_TIMESTAMP - make_interval(days => %(window_days)s)
+            AND (%(company_ids)s::int[] IS NULL OR engagement.company_id = ANY(%(company_ids)s::int[]))
+        GROUP BY
+            engagement.company_id
+    )
+    SELECT
+        company_buckets.bucket,
+        SUM(company_buckets.ticket_count) AS ticket_count
+    FROM
+        company_buckets
+    GROUP BY
+        company_buckets.bucket;
+"""
+
+ENGAGEMENT_BUCKET_ROLLING_WINDOW_QUERY = """
+    WITH rolling_window_stats AS (
+        SELECT DISTINCT
+            e1.Company_id,
+            e1.Timestamp as window_start,
+            COUNT(e2.Engagement_id) as engagements_in_window
+        FROM 
+            client_engagements e1
+        JOIN 
+            client_engagements e2 
+            ON e1.Company_id = e2.Company_id
+            AND e2.Timestamp >= e1.Timestamp 
+            AND e2.Timestamp <= e1.Timestamp + make_interval(days => %(window_days)s)
+        WHERE
+            %(company_ids)s::int[] IS NULL OR e1.Company_id = ANY(%(company_ids)s::int[])
+        GROUP BY 
+            e1.Company_id, e1.Timestamp
+    ),
+    company_max_window_activity AS (
+        SELECT
+            Company_id,
+            MAX(engagements_in_window) AS max_engagements_in_any_window
+        FROM
+            rolling_window_stats
+        GROUP BY
+            Company_id
+    ),
+    company_buckets AS (
+        SELECT
+            Company_id,
+            CASE
+                WHEN max_engagements_in_any_window > %(high_threshold)s THEN 'high'
+                WHEN max_engagements_in_any_window BETWEEN %(medium_threshold)s AND %(high_threshold)s THEN 'medium'
+                ELSE 'low'
+            END AS bucket
+        FROM
+            company_max_window_activity
+    )
+    SELECT
+        cb.bucket,
+        COUNT(st.ticket_id) AS open_ticket_count
+    FROM
+        company_buckets cb
+    JOIN
+        support_tickets st
+    USING(company_id)
+    WHERE
+        st.status = 'Open'
+    GROUP BY
+        cb.bucket;
+"""
+
+# Approximate versions of the per-company analytics, over a TABLESAMPLE of
+# the table. They return the sample figures the estimates are scaled from.
+SAMPLED_ENGAGEMENT_COUNTS_QUERY = """
+    SELECT
+        ce.Company_id,
+        COUNT(*) AS sample_count
+    FROM
+        client_engagements ce TABLESAMPLE {method} (%(sample_percent)s)
+    WHERE
+        ce.Timestamp >= CURRENT_TIMESTAMP - make_interval(days => %(window_days)s)
+        AND ce.Company_id > %(after_company_id)s
+        AND (%(company_ids)s::int[] IS NULL OR ce.Company_id = ANY(%(company_ids)s::int[]))
+    GROUP BY
+        ce.Company_id
+    ORDER BY
+        ce.Company_id
+    LIMIT %(page_size)s;
+"""
+
+SAMPLED_AVERAGE_RESOLUTION_TIME_QUERY = """
+    SELECT
+        st.company_id,
+        COUNT(*) AS sample_count,
+        AVG(EXTRACT(EPOCH FROM (st.closed_at::timestamp - st.created_at::timestamp)))::float8 AS mean_seconds,
+        STDDEV_SAMP(EXTRACT(EPOCH FROM (st.closed_at::timestamp - st.created_at::timestamp)))::float8 AS stddev_seconds
+    FROM
+        support_tickets st TABLESAMPLE {method} (%(sample_percent)s)
+    WHERE
+        st.status = 'Closed'
+        AND st.closed_at IS NOT NULL
+        AND st.company_id > %(after_company_id)s
+        AND (%(company_ids)s::int[] IS NULL OR st.company_id = ANY(%(company_ids)s::int[]))
+    GROUP BY
+        st.company_id
+    ORDER BY
+        st.company_id
+    LIMIT %(page_size)s;
+"""
+
+# Planner row estimate of a table, summed over its partitions
+TABLE_ROW_ESTIMATE_QUERY = """
+    SELECT COALESCE(
+        (
+            SELECT SUM(GREATEST(c.reltuples, 0))
+            FROM pg_partition_tree(%(table_name)s::regclass) p
+            JOIN pg_class c ON c.oid = p.relid
+            WHERE p.isleaf
+        ),
+        (SELECT GREATEST(reltuples, 0) FROM pg_class WHERE oid = %(table_name)s::regclass)
+    )::bigint AS row_estimate;
+"""
+
+# The confidence intervals assume every row is sampled independently. SYSTEM
+# samples whole pages, and rows are clustered by company within pages, so its
+# intervals would be too narrow; approximate requests are rejected when it is
+# configured.
+SAMPLE_METHODS = ("BERNOULLI",)
+SAMPLE_METHOD = "BERNOULLI"
+
+# Table size estimates are cached this long, in seconds
+ROW_ESTIMATE_TTL = 60.0
+
+# Defaults reproduce the original fixed analytics: a 30 day window, every
+# company, and buckets of more than 10 (high) and 3 to 10 (medium) engagements
+DEFAULT_WINDOW_DAYS = 30
+DEFAULT_MEDIUM_THRESHOLD = 3
+DEFAULT_HIGH_THRESHOLD = 10
+
+# Keyset pagination starts below the first company id (ids are positive serials)
+FIRST_PAGE_CURSOR = 0
+
+PAGE_PARAMS = {"after_company_id": int, "page_size": int}
+PAGE_DEFAULTS = {"after_company_id": FIRST_PAGE_CURSOR, "page_size": None}
+BUCKET_PARAMS = {"medium_threshold": int, "high_threshold": int}
+BUCKET_DEFAULTS = {
+    "medium_threshold": DEFAULT_MEDIUM_THRESHOLD,
+    "high_threshold": DEFAULT_HIGH_THRESHOLD,
+}
+
+# Statement timeout budgets in milliseconds. All are below the 29s API
+# Gateway timeout, so a slow query is cancelled in the database instead of
+# running on after its request has been answered with a timeout
+PAGE_TIMEOUT_MS = 10_000
+BUCKET_TIMEOUT_MS = 20_000
+SAMPLED_TIMEOUT_MS = 5_000
+CATALOG_TIMEOUT_MS = 2_000
+
+ENGAGEMENT_COUNTS = query_registry.register(
+    "get_engagement_counts_by_company",
+    ENGAGEMENT_COUNTS_QUERY,
+    params={"window_days": int, "company_ids": list, **PAGE_PARAMS},
+    defaults={"window_days": DEFAULT_WINDOW_DAYS, "company_ids": None, **PAGE_DEFAULTS},
+    statement_timeout_ms=PAGE_TIMEOUT_MS,
+)
+AVERAGE_RESOLUTION_TIME = query_registry.register(
+    "get_average_resolution_time_by_company",
+    AVERAGE_RESOLUTION_TIME_QUERY,
+    params={"company_ids": list, **PAGE_PARAMS},
+    defaults={"company_ids": None, **PAGE_DEFAULTS},
+    statement_timeout_ms=PAGE_TIMEOUT_MS,
+)
+ENGAGEMENT_BUCKET = query_registry.register(
+    "get_ticket_counts_by_engagement_bucket",
+    ENGAGEMENT_BUCKET_QUERY,
+    params={"window_days": int, "company_ids": list, **BUCKET_PARAMS},
+    defaults={"window_days": DEFAULT_WINDOW_DAYS, "company_ids": None, **BUCKET_DEFAULTS},
+    statement_timeout_ms=BUCKET_TIMEOUT_MS,
+)
+ENGAGEMENT_BUCKET_ROLLING_WINDOW = query_registry.register(
+    "get_ticket_counts_by_engagement_bucket_alternative",
+    ENGAGEMENT_BUCKET_ROLLING_WINDOW_QUERY,
+    params={"window_days": int, "company_ids": list, **BUCKET_PARAMS},
+    defaults={"window_days": DEFAULT_WINDOW_DAYS, "company_ids": None, **BUCKET_DEFAULTS},
+    statement_timeout_ms=BUCKET_TIMEOUT_MS,
+)
+SAMPLED_ENGAGEMENT_COUNTS = query_registry.register(
+    "get_engagement_counts_by_company_sampled",
+    SAMPLED_ENGAGEMENT_COUNTS_QUERY.format(method=SAMPLE_METHOD),
+    params={"window_days": int, "company_ids": list, "sample_percent": float, **PAGE_PARAMS},
+    defaults={
+        "window_days": DEFAULT_WINDOW_DAYS,
+        "company_ids": None,
+        "sample_percent": config.approximate_sample_percent,
+        **PAGE_DEFAULTS,
+    },
+    statement_timeout_ms=SAMPLED_TIMEOUT_MS,
+)
+SAMPLED_AVERAGE_RESOLUTION_TIME = query_registry.register(
+    "get_average_resolution_time_by_company_sampled",
+    SAMPLED_AVERAGE_RESOLUTION_TIME_QUERY.format(method=SAMPLE_METHOD),
+    params={"company_ids": list, "sample_percent": float, **PAGE_PARAMS},
+    defaults={
+        "company_ids": None,
+        "sample_percent": config.approximate_sample_percent,
+        **PAGE_DEFAULTS,
+    },
+    statement_timeout_ms=SAMPLED_TIMEOUT_MS,
+)
+TABLE_ROW_ESTIMATE = query_registry.register(
+    "table_row_estimate",
+    TABLE_ROW_ESTIMATE_QUERY,
+    params={"table_name": str},
+    defaults={"table_name": "client_engagements"},
+    statement_timeout_ms=CATALOG_TIMEOUT_MS,
+)
+
+# Table name -> (row estimate, time it was read)
+_row_estimates: Dict[str, Tuple[int, float]] = {}
 
 
 class SQLQueryService:
@@ -14,159 +291,440 @@ class SQLQueryService:
 
     def __init__(self):
         self.db_service = DatabaseService()
+        # With COLUMNAR_ENGINE the analytics are computed in-process instead
+        self.columnar = get_columnar_engine() if config.columnar_engine else None
+
+    def _run(self, query: NamedQuery, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Execute a registered query and wrap its rows in the response shape."""
+        return {"results": self.db_service.execute_named(query, params)}
 
-    def get_engagement_counts_by_company(self) -> Dict[str, Any]:
+    def _run_page(
+        self, query: NamedQuery, params: Dict[str, Any], page_size: Optional[int]
+    ) -> Dict[str, Any]:
         """
-        Get engagement counts by company for the last 30 days.
+        Execute a company-keyed query one keyset page at a time.
 
         Returns:
-            Dictionary with results containing companies and their engagement counts
+            Dictionary with the page's results and the cursor for the next page,
+            which is None on the last page
         """
-        query = """
-        SELECT
-            ce.Company_id,
-            COUNT(DISTINCT ce.Engagement_id) AS engagements_last_month
-        FROM 
-            client_engagements ce
-        WHERE
-            ce.Timestamp >= CURRENT_TIMESTAMP - INTERVAL '30 days'
-        GROUP BY
-            ce.Company_id;
+        rows = self.db_service.execute_named(query, {**params, "page_size": page_size})
+        next_cursor = None
+        if page_size is not None and len(rows) == page_size:
+            next_cursor = rows[-1]["company_id"]
+        return {"results": rows, "next_cursor": next_cursor}
+
+    def get_engagement_counts_by_company(
+        self,
+        window_days: int = DEFAULT_WINDOW_DAYS,
+        company_ids: Optional[List[int]] = None,
+        page_size: Optional[int] = None,
+        after_company_id: int = FIRST_PAGE_CURSOR,
+    ) -> Dict[str, Any]:
         """
-        try:
-            results = self.db_service.execute_query_df(query)
-            return {"results": results.to_dict(orient="records")}
-        finally:
-            self.db_service.close_connection()
+        Get engagement counts by company for a recent time window.
+
+        Args:
+            window_days: Length of the window in days, ending now
+            company_ids: Only include these companies
+            page_size: Maximum companies to return, all if None
+            after_company_id: Keyset cursor; only companies with a greater id are returned
 
-    def get_average_resolution_time_by_company(self) -> Dict[str, Any]:
+        Returns:
+            Dictionary with results containing companies and their engagement counts
+        """
+        if self.columnar is not None:
+            return self.columnar.get_engagement_counts_by_company(
+                window_days, company_ids, page_size, after_company_id
+            )
+        return self._run_page(
+            ENGAGEMENT_COUNTS,
+            {
+                "window_days": window_days,
+                "company_ids": company_ids,
+                "after_company_id": after_company_id,
+            },
+            page_size,
+        )
+
+    def get_average_resolution_time_by_company(
+        self,
+        company_ids: Optional[List[int]] = None,
+        page_size: Optional[int] = None,
+        after_company_id: int = FIRST_PAGE_CURSOR,
+    ) -> Dict[str, Any]:
         """
         Get average resolution time by company for closed tickets.
 
+        Args:
+            company_ids: Only include these companies
+            page_size: Maximum companies to return, all if None
+            after_company_id: Keyset cursor; only companies with a greater id are returned
+
         Returns:
             Dictionary with results containing companies and their average resolution times
         """
-        query = """
-        SELECT
-            st.company_id,
-            ROUND(AVG(EXTRACT(EPOCH FROM (st.closed_at::timestamp - st.created_at::timestamp)))) AS avg_resolution_time_seconds
-        FROM 
-            support_tickets st
-        WHERE
-            st.status = 'Closed'
-            AND st.closed_at IS NOT NULL
-        GROUP BY
-            st.company_id;
+        if self.columnar is not None:
+            return self.columnar.get_average_resolution_time_by_company(
+                company_ids, page_size, after_company_id
+            )
+        return self._run_page(
+            AVERAGE_RESOLUTION_TIME,
+            {"company_ids": company_ids, "after_company_id": after_company_id},
+            page_size,
+        )
+
+    def get_engagement_counts_by_company_approximate(
+        self,
+        window_days: int = DEFAULT_WINDOW_DAYS,
+        company_ids: Optional[List[int]] = None,
+        page_size: Optional[int] = None,
+        after_company_id: int = FIRST_PAGE_CURSOR,
+        sample_percent: Optional[float] = None,
+    ) -> Dict[str, Any]:
         """
-        try:
-            results = self.db_service.execute_query_df(query)
-            return {"results": results.to_dict(orient="records")}
-        finally:
-            self.db_service.close_connection()
+        Estimate engagement counts by company from a sample of the table.
+
+        Counts are scaled up from the sample and come with a confidence
+        interval. Companies with no sampled engagement are missing. Small
+        tables are counted exactly, with zero-width intervals.
 
-    def get_ticket_counts_by_engagement_bucket(self) -> Dict[str, Any]:
+        Args:
+            window_days: Length of the window in days, ending now
+            company_ids: Only include these companies
+            page_size: Maximum companies to return, all if None
+            after_company_id: Keyset cursor; only companies with a greater id are returned
+            sample_percent: Percentage of rows to sample, APPROXIMATE_SAMPLE_PERCENT if None
+
+        Returns:
+            Dictionary with the page's estimates, the cursor for the next page
+            and how the estimates were made
+        """
+        sample_percent = _sample_percent(sample_percent)
+        if not self._should_sample("client_engagements"):
+            return _exact_estimates(
+                self.get_engagement_counts_by_company(
+                    window_days, company_ids, page_size, after_company_id
+                ),
+                "engagements_last_month",
+            )
+
+        page = self._run_page(
+            SAMPLED_ENGAGEMENT_COUNTS,
+            {
+                "window_days": window_days,
+                "company_ids": company_ids,
+                "after_company_id": after_company_id,
+                "sample_percent": sample_percent,
+            },
+            page_size,
+        )
+        fraction = sample_percent / 100
+        z = _z_score()
+        results = []
+        for row in page["results"]:
+            # Each row is sampled independently, so the sample count is
+            # binomial with variance N * f * (1 - f)
+            sampled = row["sample_count"]
+            estimate = sampled / fraction
+            margin = z * math.sqrt(sampled * (1 - fraction)) / fraction
+            results.append(
+                {
+                    "company_id": row["company_id"],
+                    "engagements_last_month": round(estimate),
+                    "engagements_last_month_ci": [
+                        max(sampled, round(estimate - margin)),
+                        round(estimate + margin),
+                    ],
+                }
+            )
+        return _estimates(results, page["next_cursor"], True, sample_percent)
+
+    def get_average_resolution_time_by_company_approximate(
+        self,
+        company_ids: Optional[List[int]] = None,
+        page_size: Optional[int] = None,
+        after_company_id: int = FIRST_PAGE_CURSOR,
+        sample_percent: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Estimate average resolution time by company from a sample of closed tickets.
+
+        Each average comes with a confidence interval, null when only one of
+        the company's tickets was sampled. Small tables are averaged exactly,
+        with zero-width intervals.
+
+        Args:
+            company_ids: Only include these companies
+            page_size: Maximum companies to return, all if None
+            after_company_id: Keyset cursor; only companies with a greater id are returned
+            sample_percent: Percentage of rows to sample, APPROXIMATE_SAMPLE_PERCENT if None
+
+        Returns:
+            Dictionary with the page's estimates, the cursor for the next page
+            and how the estimates were made
+        """
+        sample_percent = _sample_percent(sample_percent)
+        if not self._should_sample("support_tickets"):
+            return _exact_estimates(
+                self.get_average_resolution_time_by_company(
+                    company_ids, page_size, after_company_id
+                ),
+                "avg_resolution_time_seconds",
+            )
+
+        page = self._run_page(
+            SAMPLED_AVERAGE_RESOLUTION_TIME,
+            {
+                "company_ids": company_ids,
+                "after_company_id": after_company_id,
+                "sample_percent": sample_percent,
+            },
+            page_size,
+        )
+        fraction = sample_percent / 100
+        z = _z_score()
+        results = []
+        for row in page["results"]:
+            mean = row["mean_seconds"]
+            interval = None
+            if row["stddev_seconds"] is not None:
+                margin = (
+                    z
+                    * row["stddev_seconds"]
+                    / math.sqrt(row["sample_count"])
+                    * math.sqrt(1 - fraction)
+                )
+                interval = [round(mean - margin), round(mean + margin)]
+            results.append(
+                {
+                    "company_id": row["company_id"],
+                    "avg_resolution_time_seconds": round(mean),
+                    "avg_resolution_time_seconds_ci": interval,
+                }
+            )
+        return _estimates(results, page["next_cursor"], True, sample_percent)
+
+    def _should_sample(self, table_name: str) -> bool:
+        """Whether an approximate analytic over a table is worth sampling rather than running exactly."""
+        if self.columnar is not None:
+            # The columnar engine answers exactly faster than a sample scan
+            return False
+        return self._row_estimate(table_name) >= config.approximate_min_rows
+
+    def _row_estimate(self, table_name: str) -> int:
+        """Planner estimate of a table's rows, cached for ROW_ESTIMATE_TTL seconds."""
+        cached = _row_estimates.get(table_name)
+        if cached is not None and time.monotonic() - cached[1] < ROW_ESTIMATE_TTL:
+            return cached[0]
+        rows = self.db_service.execute_named(TABLE_ROW_ESTIMATE, {"table_name": table_name})
+        estimate = rows[0]["row_estimate"] or 0
+        _row_estimates[table_name] = (estimate, time.monotonic())
+        return estimate
+
+    def get_ticket_counts_by_engagement_bucket(
+        self,
+        window_days: int = DEFAULT_WINDOW_DAYS,
+        company_ids: Optional[List[int]] = None,
+        medium_threshold: int = DEFAULT_MEDIUM_THRESHOLD,
+        high_threshold: int = DEFAULT_HIGH_THRESHOLD,
+    ) -> Dict[str, Any]:
         """
         Get ticket counts by engagement bucket (high/medium/low).
 
+        Args:
+            window_days: Length of the engagement window in days, ending now
+            company_ids: Only include these companies
+            medium_threshold: Lowest engagement count in the medium bucket
+            high_threshold: Highest engagement count in the medium bucket;
+                anything above is high
+
         Returns:
             Dictionary with results containing ticket counts grouped by engagement level buckets
         """
-        query = """
-        WITH company_buckets AS (
-            SELECT
-                engagement.company_id,
-                /*
-                this calculates the engagement count twice, it simplifies the query but
-                I could separate this into another CTE to avoid the unnecessary compute
-                */
-                CASE
-                    WHEN COUNT(engagement.engagement_id) > 10 THEN 'high'
-                    WHEN COUNT(engagement.engagement_id) BETWEEN 3 AND 10 THEN 'medium'
-                    ELSE 'low'
-                END AS bucket,
-                COUNT(ticket.ticket_id) AS ticket_count
-            FROM
-                client_engagements engagement
-            JOIN 
-                support_tickets ticket
-            USING(company_id)
-            WHERE 
-                engagement.Timestamp >= CURRENT_TIMESTAMP - INTERVAL '30 days'
-            GROUP BY
-                engagement.company_id
+        _check_thresholds(medium_threshold, high_threshold)
+        if self.columnar is not None:
+            return self.columnar.get_ticket_counts_by_engagement_bucket(
+                window_days, company_ids, medium_threshold, high_threshold
+            )
+        return self._run(
+            ENGAGEMENT_BUCKET,
+            {
+                "window_days": window_days,
+                "company_ids": company_ids,
+                "medium_threshold": medium_threshold,
+                "high_threshold": high_threshold,
+            },
         )
-        SELECT
-            company_buckets.bucket,
-            SUM(company_buckets.ticket_count) AS ticket_count
-        FROM
-            company_buckets
-        GROUP BY
-            company_buckets.bucket;
-        """
-        try:
-            results = self.db_service.execute_query_df(query)
-            return {"results": results.to_dict(orient="records")}
-        finally:
-            self.db_service.close_connection()
 
-    def get_ticket_counts_by_engagement_bucket_alternative(self) -> Dict[str, Any]:
+    def get_ticket_counts_by_engagement_bucket_alternative(
+        self,
+        window_days: int = DEFAULT_WINDOW_DAYS,
+        company_ids: Optional[List[int]] = None,
+        medium_threshold: int = DEFAULT_MEDIUM_THRESHOLD,
+        high_threshold: int = DEFAULT_HIGH_THRESHOLD,
+    ) -> Dict[str, Any]:
         """
         Get ticket counts by engagement bucket (high/medium/low) using rolling window approach.
 
+        Args:
+            window_days: Length of the rolling window in days
+            company_ids: Only include these companies
+            medium_threshold: Lowest engagement count in the medium bucket
+            high_threshold: Highest engagement count in the medium bucket;
+                anything above is high
+
         Returns:
             Dictionary with results containing ticket counts grouped by engagement level buckets
         """
-        query = """
-        WITH rolling_window_stats AS (
-            SELECT DISTINCT
-                e1.Company_id,
-                e1.Timestamp as window_start,
-                COUNT(e2.Engagement_id) as engagements_in_window
-            FROM 
-                client_engagements e1
-            JOIN 
-                client_engagements e2 
-                ON e1.Company_id = e2.Company_id
-                AND e2.Timestamp >= e1.Timestamp 
-                AND e2.Timestamp <= e1.Timestamp + INTERVAL '30 days'
-            GROUP BY 
-                e1.Company_id, e1.Timestamp
-        ),
-        company_max_window_activity AS (
-            SELECT
-                Company_id,
-                MAX(engagements_in_window) AS max_engagements_in_any_window
-            FROM
-                rolling_window_stats
-            GROUP BY
-                Company_id
-        ),
-        company_buckets AS (
-            SELECT
-                Company_id,
-                CASE
-                    WHEN max_engagements_in_any_window > 10 THEN 'high'
-                    WHEN max_engagements_in_any_window BETWEEN 3 AND 10 THEN 'medium'
-                    ELSE 'low'
-                END AS bucket
-            FROM
-                company_max_window_activity
+        _check_thresholds(medium_threshold, high_threshold)
+        if self.columnar is not None:
+            return self.columnar.get_ticket_counts_by_engagement_bucket_alternative(
+                window_days, company_ids, medium_threshold, high_threshold
+            )
+        return self._run(
+            ENGAGEMENT_BUCKET_ROLLING_WINDOW,
+            {
+                "window_days": window_days,
+                "company_ids": company_ids,
+                "medium_threshold": medium_threshold,
+                "high_threshold": high_threshold,
+            },
         )
-        SELECT
-            cb.bucket,
-            COUNT(st.ticket_id) AS open_ticket_count
-        FROM
-            company_buckets cb
-        JOIN
-            support_tickets st
-        USING(company_id)
-        WHERE
-            st.status = 'Open'
-        GROUP BY
-            cb.bucket;
+
+    def get_dashboard(
+        self,
+        window_days: int = DEFAULT_WINDOW_DAYS,
+        company_ids: Optional[List[int]] = None,
+        medium_threshold: int = DEFAULT_MEDIUM_THRESHOLD,
+        high_threshold: int = DEFAULT_HIGH_THRESHOLD,
+    ) -> Dict[str, Any]:
+        """
+        Get every analytic in one call, pipelined on a single connection.
+
+        Args:
+            window_days: Length of the engagement window in days
+            company_ids: Only include these companies
+            medium_threshold: Lowest engagement count in the medium bucket
+            high_threshold: Highest engagement count in the medium bucket
+
+        Returns:
+            Dictionary with the results of each analytic
+        """
+        _check_thresholds(medium_threshold, high_threshold)
+        window = {"window_days": window_days, "company_ids": company_ids}
+        buckets = {
+            **window,
+            "medium_threshold": medium_threshold,
+            "high_threshold": high_threshold,
+        }
+        if self.columnar is not None:
+            return {
+                "engagement_counts": {
+                    "results": self.get_engagement_counts_by_company(**window)["results"]
+                },
+                "average_resolution_time": {
+                    "results": self.get_average_resolution_time_by_company(company_ids)["results"]
+                },
+                "engagement_buckets": self.get_ticket_counts_by_engagement_bucket(**buckets),
+                "engagement_buckets_rolling_window": (
+                    self.get_ticket_counts_by_engagement_bucket_alternative(**buckets)
+                ),
+            }
+        (
+            engagement_counts,
+            resolution_times,
+            engagement_buckets,
+            rolling_window_buckets,
+        ) = self.db_service.execute_named_pipeline(
+            [
+                (ENGAGEMENT_COUNTS, window),
+                (AVERAGE_RESOLUTION_TIME, {"company_ids": company_ids}),
+                (ENGAGEMENT_BUCKET, buckets),
+                (ENGAGEMENT_BUCKET_ROLLING_WINDOW, buckets),
+            ],
+            pipeline_name="get_dashboard",
+        )
+        return {
+            "engagement_counts": {"results": engagement_counts},
+            "average_resolution_time": {"results": resolution_times},
+            "engagement_buckets": {"results": engagement_buckets},
+            "engagement_buckets_rolling_window": {"results": rolling_window_buckets},
+        }
+
+    def get_query_planning_stats(self) -> Dict[str, Any]:
         """
-        try:
-            results = self.db_service.execute_query_df(query)
-            return {"results": results.to_dict(orient="records")}
-        finally:
-            self.db_service.close_connection() 
\ No newline at end of file
+        Get prepared statement reuse and planning cost for every registered query.
+
+        Planning time is measured with EXPLAIN using each query's default
+        parameters. The saved time is an upper bound: executions of a prepared
+        statement skip parsing, but only generic plans also skip planning.
+
+        Returns:
+            Dictionary with per-query execution counts and planning statistics
+        """
+        results = []
+        for query in query_registry:
+            prepared = DB_PREPARED_EXECUTIONS.value(query=query.name, prepared="true")
+            unprepared = DB_PREPARED_EXECUTIONS.value(query=query.name, prepared="false")
+            planning_ms = self.db_service.explain_planning_time(query)
+            results.append(
+                {
+                    "query": query.name,
+                    "executions": int(prepared + unprepared),
+                    "prepared_executions": int(prepared),
+                    "planning_time_ms": planning_ms,
+                    "estimated_planning_saved_ms": round(planning_ms * prepared, 3),
+                }
+            )
+        return {"results": results}
+
+
+def _check_thresholds(medium_threshold: int, high_threshold: int):
+    """Validate that the bucket thresholds describe non-empty, ordered buckets."""
+    if medium_threshold > high_threshold:
+        raise ValueError(
+            f"medium_threshold ({medium_threshold}) must not exceed high_threshold ({high_threshold})"
+        )
+
+
+def _sample_percent(sample_percent: Optional[float]) -> float:
+    """The sampling percentage to use, validated along with the configured sampling method."""
+    method = config.approximate_sample_method
+    if method not in SAMPLE_METHODS:
+        raise ValueError(
+            f"APPROXIMATE_SAMPLE_METHOD must be one of {', '.join(SAMPLE_METHODS)}, not {method}"
+            " (the confidence intervals are only valid for row sampling)"
+        )
+    if sample_percent is None:
+        sample_percent = config.approximate_sample_percent
+    if not 0 < sample_percent <= 100:
+        raise ValueError(f"sample_percent must be in (0, 100], not {sample_percent}")
+    return sample_percent
+
+
+def _z_score() -> float:
+    """Standard normal quantile of the two-sided APPROXIMATE_CONFIDENCE interval."""
+    return NormalDist().inv_cdf(0.5 + config.approximate_confidence / 2)
+
+
+def _estimates(
+    results: List[Dict[str, Any]],
+    next_cursor: Optional[int],
+    approximate: bool,
+    sample_percent: float,
+) -> Dict[str, Any]:
+    """Wrap a page of estimates with how they were made."""
+    return {
+        "results": results,
+        "next_cursor": next_cursor,
+        "approximate": approximate,
+        "sample_percent": sample_percent if approximate else 100.0,
+        "confidence": config.approximate_confidence,
+    }
+
+
+def _exact_estimates(page: Dict[str, Any], field: str) -> Dict[str, Any]:
+    """Present an exact page like an approximate one, with zero-width intervals."""
+    results = [{**row, f"{field}_ci": [row[field], row[field]]} for row in page["results"]]
+    return _estimates(results, page["next_cursor"], False, 100.0)
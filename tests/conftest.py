@@ -0,0 +1,76 @@
+"""
+Shared fixtures for the Crafty CRM tests.
+
+Tests that need PostgreSQL run against a throwaway database created on the
+configured server (POSTGRES_HOST and friends) and migrated from scratch, so
+they never touch the development data. They are skipped when the server is
+unreachable.
+"""
+
+import os
+import psycopg
+import pytest
+import connectors.replicas
+from app.config import config
+
+TEST_DATABASE = os.getenv("CRAFTY_TEST_DB", "crafty_test")
+
+
+def _admin_connection() -> psycopg.Connection:
+    """Connect to the server's maintenance database to create and drop the test database."""
+    db_config = config.database_config
+    return psycopg.connect(
+        host=db_config["host"],
+        port=db_config["port"],
+        user=db_config["user"],
+        password=db_config["password"],
+        dbname="postgres",
+        autocommit=True,
+    )
+
+
+@pytest.fixture(scope="session")
+def migrated_database():
+    """
+    Create the test database, apply every migration and seed a small dataset.
+
+    Yields:
+        The name of the test database; Database() connects to it while the
+        fixture is active
+    """
+    try:
+        admin = _admin_connection()
+    except psycopg.OperationalError as e:
+        pytest.skip(f"PostgreSQL is not reachable: {e}")
+
+    with admin:
+        admin.execute(f'DROP DATABASE IF EXISTS "{TEST_DATABASE}" WITH (FORCE)')
+        admin.execute(f"CREATE DATABASE \"{TEST_DATABASE}\" TEMPLATE template0 ENCODING 'UTF8'")
+
+    previous = os.environ.get("POSTGRES_DB")
+    os.environ["POSTGRES_DB"] = TEST_DATABASE
+    # Rebuilt on first use, against the test database
+    connectors.replicas._router = None
+    try:
+        from scripts.migrate import MigrationRunner
+        from scripts.seed_data import DatabaseSeeder
+
+        MigrationRunner().upgrade()
+        DatabaseSeeder().run_all(
+            companies_count=20, contacts_count=100, engagements_count=500, tickets_count=300
+        )
+        with psycopg.connect(MigrationRunner().db.connection_string, autocommit=True) as conn:
+            conn.execute("ANALYZE")
+        yield TEST_DATABASE
+    finally:
+        from connectors.database import _pools
+
+        connectors.replicas._router = None
+        for conninfo in [key for key in _pools if f"dbname={TEST_DATABASE}" in key]:
+            _pools.pop(conninfo).close()
+        if previous is None:
+            os.environ.pop("POSTGRES_DB", None)
+        else:
+            os.environ["POSTGRES_DB"] = previous
+        with _admin_connection() as admin:
+            admin.execute(f'DROP DATABASE IF EXISTS "{TEST_DATABASE}" WITH (FORCE)')
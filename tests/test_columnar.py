@@ -0,0 +1,258 @@
+"""
+Tests for the columnar analytics engine.
+
+The engine is first given fixed columns whose SQL results are worked out by
+hand below, including the row multiplicities the SQL joins produce; then it
+is loaded from the migrated test database and compared with the SQL
+analytics, before and after an incremental refresh.
+"""
+
+import time
+from decimal import Decimal
+from typing import Any, Dict, List
+import numpy as np
+import pytest
+from connectors.database import Database
+from connectors.replicas import ReplicaRouter
+from services.columnar_services import NULL_ID, ColumnarAnalytics, ColumnarTable, _State
+from services.sql_query_services import SQLQueryService
+
+NOW = np.datetime64(time.time_ns() // 1000, "us")
+DAY = np.timedelta64(1, "D")
+SECOND = np.timedelta64(1, "s")
+NAT = np.datetime64("NaT", "us")
+
+
+def _table(columns: Dict[str, List[Any]], categories: Dict[str, tuple]) -> ColumnarTable:
+    arrays = {}
+    for column, values in columns.items():
+        if column in categories:
+            arrays[column] = np.array(
+                [NULL_ID if value is None else categories[column].index(value) for value in values],
+                dtype=np.int16,
+            )
+        elif column.endswith(("_at", "timestamp")):
+            arrays[column] = np.array([NAT if value is None else value for value in values])
+        else:
+            arrays[column] = np.array(
+                [NULL_ID if value is None else value for value in values], dtype=np.int32
+            )
+    ids = columns.get("engagement_id") or columns["ticket_id"]
+    return ColumnarTable(arrays, categories, max(ids))
+
+
+@pytest.fixture
+def engine():
+    """
+    An engine over fixed rows, as of NOW with the database in UTC.
+
+    Engagements (id, company, when):
+        company 1: 1 (1 day ago), 2 and 3 (both 2 days ago), 4 (40 days ago)
+        company 2: 5 (3 days ago)
+        company 3: 6 (100 days ago)
+        no company: 7 (1 day ago)
+    Tickets (id, company, status):
+        company 1: 1 and 2 Closed after 100s and 201s, 3 Open
+        company 2: 4 and 5 Open
+        company 3: 6 Closed without a closed_at, 7 Open
+        no company: 8 Open
+    """
+    created = NOW - 10 * DAY
+    engagements = _table(
+        {
+            "engagement_id": [1, 2, 3, 4, 5, 6, 7],
+            "timestamp": [
+                NOW - DAY,
+                NOW - 2 * DAY,
+                NOW - 2 * DAY,
+                NOW - 40 * DAY,
+                NOW - 3 * DAY,
+                NOW - 100 * DAY,
+                NOW - DAY,
+            ],
+            "type": ["Call"] * 7,
+            "company_id": [1, 1, 1, 1, 2, 3, None],
+        },
+        {"type": ("Call",)},
+    )
+    tickets = _table(
+        {
+            "ticket_id": [1, 2, 3, 4, 5, 6, 7, 8],
+            "created_at": [created] * 8,
+            "closed_at": [created + 100 * SECOND, created + 201 * SECOND] + [None] * 6,
+            "status": ["Closed", "Closed", "Open", "Open", "Open", "Closed", "Open", "Open"],
+            "company_id": [1, 1, 1, 2, 2, 3, 3, None],
+        },
+        {"status": ("Closed", "Open")},
+    )
+    columnar = ColumnarAnalytics(refresh_interval=3600, reload_interval=3600)
+    now = time.time()
+    columnar._state = _State(engagements, tickets, np.timedelta64(0, "us"), now, now)
+    return columnar
+
+
+def test_engagement_counts_by_company(engine):
+    assert engine.get_engagement_counts_by_company(30, None, None, 0) == {
+        "results": [
+            {"company_id": 1, "engagements_last_month": 3},
+            {"company_id": 2, "engagements_last_month": 1},
+        ],
+        "next_cursor": None,
+    }
+
+
+def test_engagement_counts_are_paged_by_company(engine):
+    first = engine.get_engagement_counts_by_company(30, None, 1, 0)
+    second = engine.get_engagement_counts_by_company(30, None, 1, first["next_cursor"])
+
+    assert first == {"results": [{"company_id": 1, "engagements_last_month": 3}], "next_cursor": 1}
+    assert second == {"results": [{"company_id": 2, "engagements_last_month": 1}], "next_cursor": 2}
+
+
+def test_average_resolution_time_rounds_half_away_from_zero(engine):
+    # AVG(100, 201) is 150.5, which ROUND takes to 151; ticket 6 has no closed_at
+    assert engine.get_average_resolution_time_by_company(None, None, 0) == {
+        "results": [{"company_id": 1, "avg_resolution_time_seconds": 151}],
+        "next_cursor": None,
+    }
+
+
+def test_engagement_buckets_count_join_rows(engine):
+    # Company 1 joins its 3 recent engagements with its 3 tickets: 9 rows,
+    # high (> 5); company 2 joins 1 engagement with 2 tickets: 2 rows, medium
+    assert engine.get_ticket_counts_by_engagement_bucket(30, None, 2, 5) == {
+        "results": [
+            {"bucket": "high", "ticket_count": 9},
+            {"bucket": "medium", "ticket_count": 2},
+        ]
+    }
+    assert engine.get_ticket_counts_by_engagement_bucket(30, [2], 2, 5) == {
+        "results": [{"bucket": "medium", "ticket_count": 2}]
+    }
+
+
+def test_rolling_window_counts_duplicate_timestamps_once_per_duplicate(engine):
+    # Engagements 2 and 3 share a timestamp, so its group has 2 e1 rows each
+    # joined with the 3 engagements in its window: 6, high (> 5). Companies
+    # 2 and 3 peak at 1, low. Open tickets: 1 for company 1, 2 + 1 for the rest
+    assert engine.get_ticket_counts_by_engagement_bucket_alternative(30, None, 2, 5) == {
+        "results": [
+            {"bucket": "high", "open_ticket_count": 1},
+            {"bucket": "low", "open_ticket_count": 3},
+        ]
+    }
+
+
+def _normalize(result: Dict[str, Any], unordered: bool) -> Dict[str, Any]:
+    rows = [
+        {key: int(value) if isinstance(value, Decimal) else value for key, value in row.items()}
+        for row in result["results"]
+    ]
+    if unordered:
+        rows.sort(key=lambda row: row["bucket"])
+    return {**result, "results": rows}
+
+
+# (analytic, columnar arguments, the same as SQLQueryService keywords, unordered)
+ANALYTICS = [
+    ("get_engagement_counts_by_company", (30, None, None, 0), {}, False),
+    (
+        "get_engagement_counts_by_company",
+        (7, None, 3, 2),
+        {"window_days": 7, "page_size": 3, "after_company_id": 2},
+        False,
+    ),
+    ("get_average_resolution_time_by_company", (None, None, 0), {}, False),
+    ("get_ticket_counts_by_engagement_bucket", (30, None, 3, 10), {}, True),
+    (
+        "get_ticket_counts_by_engagement_bucket",
+        (365, None, 1, 2),
+        {"window_days": 365, "medium_threshold": 1, "high_threshold": 2},
+        True,
+    ),
+    ("get_ticket_counts_by_engagement_bucket_alternative", (30, None, 3, 10), {}, True),
+    (
+        "get_ticket_counts_by_engagement_bucket_alternative",
+        (7, [1, 2, 3], 1, 2),
+        {"window_days": 7, "company_ids": [1, 2, 3], "medium_threshold": 1, "high_threshold": 2},
+        True,
+    ),
+]
+
+
+def _assert_matches_sql(columnar: ColumnarAnalytics, sql: SQLQueryService):
+    for name, arguments, params, unordered in ANALYTICS:
+        expected = _normalize(getattr(sql, name)(**params), unordered)
+        actual = _normalize(getattr(columnar, name)(*arguments), unordered)
+        assert actual == expected, f"{name} {params}"
+
+
+@pytest.fixture
+def database_engine(migrated_database):
+    columnar = ColumnarAnalytics(refresh_interval=3600, reload_interval=3600)
+    columnar.replicas = ReplicaRouter(Database(), [])
+    sql = SQLQueryService()
+    sql.columnar = None
+    return columnar, sql
+
+
+def test_full_load_matches_sql(database_engine):
+    columnar, sql = database_engine
+
+    assert columnar.refresh(full=True)
+
+    _assert_matches_sql(columnar, sql)
+
+
+def test_incremental_refresh_appends_new_rows(database_engine):
+    columnar, sql = database_engine
+    columnar.refresh(full=True)
+    before = columnar._state
+    db = Database()
+
+    inserted_engagements = db.execute_prepared(
+        """
+        INSERT INTO client_engagements (Timestamp, Type, Contact_id, Company_id)
+        SELECT LOCALTIMESTAMP - make_interval(days => n), t, NULL, c
+        FROM (VALUES (1, 'Webinar', 1), (2, 'Webinar', 1), (2, 'Email', 2), (3, NULL, NULL))
+            AS v(n, t, c)
+        RETURNING Engagement_id
+        """
+    )
+    inserted_tickets = db.execute_prepared(
+        """
+        INSERT INTO support_tickets (Created_at, Closed_at, Status, Company_id)
+        VALUES
+            (LOCALTIMESTAMP - INTERVAL '2 days', LOCALTIMESTAMP, 'Closed', 1),
+            (LOCALTIMESTAMP - INTERVAL '1 day', NULL, 'Open', 1),
+            (LOCALTIMESTAMP, NULL, 'Escalated', 2)
+        RETURNING Ticket_id
+        """
+    )
+    try:
+        assert columnar.refresh()
+
+        after = columnar._state
+        assert after.reloaded_at == before.reloaded_at
+        assert len(after.engagements) == len(before.engagements) + 4
+        assert len(after.tickets) == len(before.tickets) + 3
+        assert after.engagements.last_id == max(
+            row["engagement_id"] for row in inserted_engagements
+        )
+        assert after.tickets.last_id == max(row["ticket_id"] for row in inserted_tickets)
+        # Existing codes stay valid; new categories are appended
+        for column, table in (("type", "engagements"), ("status", "tickets")):
+            old = getattr(before, table).categories[column]
+            assert getattr(after, table).categories[column][: len(old)] == old
+        assert "Webinar" in after.engagements.categories["type"]
+        assert "Escalated" in after.tickets.categories["status"]
+        _assert_matches_sql(columnar, sql)
+    finally:
+        db.execute_prepared(
+            "DELETE FROM client_engagements WHERE Engagement_id = ANY(%(ids)s) RETURNING 1",
+            {"ids": [row["engagement_id"] for row in inserted_engagements]},
+        )
+        db.execute_prepared(
+            "DELETE FROM support_tickets WHERE Ticket_id = ANY(%(ids)s) RETURNING 1",
+            {"ids": [row["ticket_id"] for row in inserted_tickets]},
+        )
@@ -0,0 +1,108 @@
+"""
+Tests for the logarithmic resolution time digests.
+
+Digests are filled with seeded random resolution times and their
+percentiles compared with percentile_disc computed exactly over the same
+values, alone and merged. The bucket function is checked against its SQL
+twin in migration 0005.
+"""
+
+import math
+import random
+from typing import List
+import pytest
+from connectors.database import Database
+from services.digest_services import (
+    BUCKET_ZERO_ACCURACY,
+    RELATIVE_ACCURACY,
+    LogHistogram,
+)
+
+PERCENTILES = [0.0, 1.0, 10.0, 25.0, 50.0, 75.0, 90.0, 99.0, 99.9, 100.0]
+
+
+def _resolution_times(seed: int, count: int = 5000) -> List[float]:
+    """Resolution times from zero to weeks, with many of a second or less."""
+    rng = random.Random(seed)
+    times = [rng.lognormvariate(8, 3) for _ in range(count)]
+    times += [rng.choice([0.0, rng.random()]) for _ in range(count // 10)]
+    return times
+
+
+def _percentile_disc(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percentile / 100 * len(ordered)), 1) - 1]
+
+
+def _digest(values: List[float]) -> LogHistogram:
+    digest = LogHistogram()
+    for value in values:
+        digest.add(value)
+    return digest
+
+
+def _assert_accurate(estimate: float, exact: float):
+    if exact <= 1:
+        assert abs(estimate - exact) <= BUCKET_ZERO_ACCURACY
+    else:
+        # Estimates are rounded to milliseconds
+        assert abs(estimate - exact) <= RELATIVE_ACCURACY * exact + 0.0005
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_quantiles_are_within_the_accuracy(seed):
+    values = _resolution_times(seed)
+
+    estimates = _digest(values).quantiles(PERCENTILES)
+
+    for percentile, estimate in zip(PERCENTILES, estimates):
+        _assert_accurate(estimate, _percentile_disc(values, percentile))
+
+
+def test_merged_digest_equals_digest_of_all_values():
+    first, second = _resolution_times(1), _resolution_times(2, count=300)
+
+    merged = _digest(first).merge(_digest(second))
+
+    assert merged.counts == _digest(first + second).counts
+    assert merged.count == len(first) + len(second)
+    for percentile, estimate in zip(PERCENTILES, merged.quantiles(PERCENTILES)):
+        _assert_accurate(estimate, _percentile_disc(first + second, percentile))
+
+
+def test_merge_is_order_independent():
+    digests = [_resolution_times(seed, count=200) for seed in range(4)]
+
+    forward = LogHistogram()
+    for values in digests:
+        forward.merge(_digest(values))
+    backward = LogHistogram()
+    for values in reversed(digests):
+        backward.merge(_digest(values))
+
+    assert forward.counts == backward.counts
+
+
+def test_sub_second_times_are_not_reported_as_zero():
+    digest = LogHistogram.from_buckets([0], [3])
+
+    assert digest.quantiles([50.0]) == [0.5]
+    _assert_accurate(digest.quantiles([100.0])[0], 1.0)
+    _assert_accurate(digest.quantiles([0.0])[0], 0.0)
+
+
+def test_empty_digest_has_no_quantiles():
+    assert LogHistogram().quantiles([50.0, 99.0]) == [None, None]
+
+
+def test_buckets_match_the_sql_function(migrated_database):
+    # Exact powers of DIGEST_GAMMA are left out: the logarithms may round
+    # either side of them in SQL and Python
+    seconds = [0.0, 0.5, 1.0, 1.0000001, 1.0201, 59.9, 60.0, 3600.0, 86400.5, 1e9, 1e300]
+
+    rows = Database().execute_prepared(
+        "SELECT s, crafty_resolution_time_bucket(s) AS bucket FROM unnest(%(seconds)s::float8[]) s",
+        {"seconds": seconds},
+    )
+
+    assert [row["bucket"] for row in rows] == [LogHistogram.bucket(s) for s in seconds]
@@ -0,0 +1,158 @@
+"""
+Tests for the fast-path request parsers.
+
+Every body is parsed both ways: by the fast-path parsers and by the regular
+path, json.loads and the pydantic model as FastAPI validates it. Valid
+bodies must give equal inputs, down to the types of the values, and invalid
+ones the same 422 a regular route answers.
+"""
+
+import json
+import pytest
+from fastapi import Body, FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.testclient import TestClient
+from models.fast_parsers import parse_question_one, parse_question_two
+from models.input_models import QuestionOneInput, QuestionTwoInput
+
+BIG = 123456789012345678901234567890
+
+QUESTION_ONE_BODIES = [
+    b'{"Type": ["Email", " call ", "MEETING"]}',
+    b'{"Type": []}',
+    b'{"Type": ["a"], "extra": 123456789012345678901234567890}',
+    '{"Type": ["Ünïcödé", "日本語", "emoji 😀", "tab\\there"]}'.encode(),
+    b'{"Type": ["\\u00e9t\\u00e9", "\\ud83d\\ude00"]}',
+    b'{"Type": ["a"], "extra": NaN}',
+]
+
+QUESTION_TWO_BODIES = [
+    b'{"dictionary": {"a": {"b": 1, "c": [1, 2]}, "d": null}}',
+    b'{"dictionary": {"a": {"b": 1}}, "delimiter": "/", "parent_key": "root"}',
+    b'{"dictionary": {}}',
+    b'{"dictionary": {"big": 123456789012345678901234567890}}',
+    b'{"dictionary": {"nested": {"list": [-9223372036854775809, 1]}}}',
+    b'{"dictionary": {"max": 18446744073709551615, "min": -9223372036854775808}}',
+    b'{"dictionary": {"exponent": 1e20, "fraction": 123456789012345678901234567890.5}}',
+    '{"dictionary": {"ключ": {"键": "значение"}}, "delimiter": "→"}'.encode(),
+    b'{"dictionary": {"inf": Infinity, "nan": NaN}}',
+]
+
+INVALID_QUESTION_ONE_BODIES = [
+    b"",
+    b"not json",
+    b'{"Type": ["a"',
+    b"null",
+    b"[1, 2]",
+    b"{}",
+    b'{"Type": "a"}',
+    b'{"Type": ["a", 1]}',
+    b'{"Type": [123456789012345678901234567890]}',
+    b'{"Type": [null, 2.5]}',
+    '{"Typé": ["a"]}'.encode(),
+]
+
+INVALID_QUESTION_TWO_BODIES = [
+    b"",
+    b'{"dictionary": {"a": ',
+    b"null",
+    b'"dictionary"',
+    b'{"delimiter": "."}',
+    b'{"dictionary": []}',
+    b'{"dictionary": {"a": 1}, "delimiter": 1}',
+    b'{"dictionary": {"a": 1}, "parent_key": null}',
+    b'{"dictionary": {"a": 123456789012345678901234567890}, "delimiter": ["."]}',
+    '{"dictionary": "ünïcödé"}'.encode(),
+]
+
+
+def _regular(model, body: bytes):
+    return model.model_validate(json.loads(body))
+
+
+def _assert_same_input(fast, regular, fields):
+    for field in fields:
+        fast_value = getattr(fast, field)
+        regular_value = getattr(regular, field)
+        assert fast_value == regular_value
+        # Equal is not enough: 2**100 == float(2**100)
+        assert json.dumps(fast_value) == json.dumps(regular_value)
+
+
+@pytest.mark.parametrize("body", QUESTION_ONE_BODIES)
+def test_question_one_matches_pydantic(body):
+    _assert_same_input(parse_question_one(body), _regular(QuestionOneInput, body), ["Type"])
+
+
+@pytest.mark.parametrize("body", QUESTION_TWO_BODIES)
+def test_question_two_matches_pydantic(body):
+    _assert_same_input(
+        parse_question_two(body),
+        _regular(QuestionTwoInput, body),
+        ["dictionary", "delimiter", "parent_key"],
+    )
+
+
+def test_integers_beyond_64_bits_are_kept():
+    body = b'{"dictionary": {"a": {"b": [123456789012345678901234567890]}}}'
+
+    value = parse_question_two(body).dictionary["a"]["b"][0]
+
+    assert type(value) is int and value == BIG
+
+
+def test_lone_surrogates_are_decoded_like_the_standard_library():
+    body = b'{"Type": ["\\ud800"], "dictionary": {"\\udfff": "\\ud800"}}'
+
+    assert parse_question_one(body).Type == json.loads(body)["Type"]
+    assert parse_question_two(body).dictionary == json.loads(body)["dictionary"]
+
+
+@pytest.fixture(scope="module")
+def client():
+    """An app with a regular and a fast-path route for each question."""
+    app = FastAPI()
+
+    @app.post("/regular/question_one")
+    def regular_question_one(input: QuestionOneInput = Body()):
+        return {"Type": input.Type}
+
+    @app.post("/regular/question_two")
+    def regular_question_two(input: QuestionTwoInput = Body()):
+        return [input.dictionary, input.delimiter, input.parent_key]
+
+    @app.post("/fast/question_one")
+    async def fast_question_one(request: Request):
+        return {"Type": parse_question_one(await request.body()).Type}
+
+    @app.post("/fast/question_two")
+    async def fast_question_two(request: Request):
+        input = parse_question_two(await request.body())
+        return [input.dictionary, input.delimiter, input.parent_key]
+
+    return TestClient(app)
+
+
+def _post(client, route: str, body: bytes):
+    response = client.post(route, content=body, headers={"Content-Type": "application/json"})
+    return response.status_code, response.json()
+
+
+@pytest.mark.parametrize("body", INVALID_QUESTION_ONE_BODIES)
+def test_question_one_errors_match_regular_route(client, body):
+    with pytest.raises(RequestValidationError):
+        parse_question_one(body)
+    regular = _post(client, "/regular/question_one", body)
+
+    assert regular[0] == 422
+    assert _post(client, "/fast/question_one", body) == regular
+
+
+@pytest.mark.parametrize("body", INVALID_QUESTION_TWO_BODIES)
+def test_question_two_errors_match_regular_route(client, body):
+    with pytest.raises(RequestValidationError):
+        parse_question_two(body)
+    regular = _post(client, "/regular/question_two", body)
+
+    assert regular[0] == 422
+    assert _post(client, "/fast/question_two", body) == regular
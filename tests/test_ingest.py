@@ -0,0 +1,42 @@
+"""
+Tests for acknowledging buffered ingest requests.
+"""
+
+import asyncio
+from psycopg.errors import DataError
+from services.ingest_services import DURABLE, IngestService, _Submission
+
+
+class _FailingBuffer:
+    """A buffer whose every flush fails with one shared error, as a failed batch does."""
+
+    columns = ("name",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+    def submit(self, rows, awaited=False):
+        submission = _Submission(rows, awaited)
+        submission.set_done(self.error)
+        return submission
+
+
+def test_concurrent_durable_requests_raise_their_own_error():
+    error = DataError("invalid input syntax")
+    service = IngestService.__new__(IngestService)
+    service.buffers = {"companies": _FailingBuffer(error)}
+
+    async def ingest():
+        try:
+            await service.ingest("companies", [{"name": "Acme"}], DURABLE)
+        except DataError as e:
+            return e
+
+    async def main():
+        return await asyncio.gather(ingest(), ingest())
+
+    first, second = asyncio.run(main())
+    assert first is not None and second is not None
+    assert first is not second and error not in (first, second)
+    assert first.__cause__ is error and second.__cause__ is error
+    assert str(first) == str(error)
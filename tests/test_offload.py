@@ -0,0 +1,57 @@
+"""
+Tests for the CPU offload worker pool.
+
+The tasks sleep for the seconds given as their body; they are defined here
+at module level so the spawned workers can import them.
+"""
+
+import asyncio
+import time
+import pytest
+from app.offload import CPUExecutor, CPUQueueFull, CPUTaskTimeout
+
+
+def sleep(body: bytes) -> bytes:
+    time.sleep(float(body))
+    return body
+
+
+@pytest.fixture(scope="module")
+def executor():
+    executor = CPUExecutor(workers=2, timeout=1.0, max_queue=2)
+    executor.start()
+    yield executor
+    executor.stop()
+
+
+def _run_all(executor: CPUExecutor, bodies):
+    async def run():
+        return await asyncio.gather(
+            *[executor.run(sleep, body) for body in bodies], return_exceptions=True
+        )
+
+    return asyncio.run(run())
+
+
+def test_time_waiting_for_a_worker_does_not_count(executor):
+    # Two rounds of 0.7s on two workers: the second round waits 0.7s first
+    assert _run_all(executor, [b"0.7"] * 4) == [b"0.7"] * 4
+
+
+def test_tasks_beyond_the_queue_are_rejected(executor):
+    results = _run_all(executor, [b"0.3"] * 5)
+
+    assert results[:4] == [b"0.3"] * 4
+    assert isinstance(results[4], CPUQueueFull)
+
+
+def test_timeout_replaces_only_the_overdue_worker(executor):
+    before = {worker.process.pid for worker in executor._processes}
+
+    slow, fast = _run_all(executor, [b"3", b"0.9"])
+
+    assert isinstance(slow, CPUTaskTimeout)
+    assert fast == b"0.9"
+    after = {worker.process.pid for worker in executor._processes}
+    assert len(before - after) == 1
+    assert _run_all(executor, [b"0"] * 2) == [b"0"] * 2
@@ -0,0 +1,51 @@
+"""
+Query plan tests for the analytics indexes.
+
+Each analytics query is planned against the freshly migrated test database
+and must use the BRIN or partial index its migration created for it, and
+the recent-window queries must prune partitions. Sequential scans are
+disabled as in `scripts/migrate.py check-plans`, since on a small dataset
+one is always cheapest.
+"""
+
+import pytest
+from connectors.database import Database
+from scripts.migrate import PLAN_EXPECTATIONS, explain_plan, missing_indexes
+
+
+@pytest.fixture
+def cursor(migrated_database):
+    conn = Database().get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+            yield cursor
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+@pytest.mark.parametrize("name", sorted(PLAN_EXPECTATIONS))
+def test_analytics_query_uses_its_indexes(cursor, name):
+    query, expectations, _ = PLAN_EXPECTATIONS[name]
+
+    indexes, _ = explain_plan(cursor, query)
+
+    assert missing_indexes(indexes, expectations) == [], f"plan used {sorted(indexes)}"
+
+
+@pytest.mark.parametrize(
+    "name", sorted(name for name, (_, _, prunes) in PLAN_EXPECTATIONS.items() if prunes)
+)
+def test_recent_window_prunes_partitions(cursor, name):
+    query, _, _ = PLAN_EXPECTATIONS[name]
+
+    _, removed = explain_plan(cursor, query)
+
+    assert removed > 0
+
+
+def test_check_plans_passes(migrated_database):
+    from scripts.migrate import MigrationRunner
+
+    assert MigrationRunner().check_plans()
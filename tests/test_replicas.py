@@ -0,0 +1,140 @@
+"""
+Tests for routing reads over the read replicas, against fake databases.
+"""
+
+from contextlib import contextmanager
+import pytest
+from psycopg import OperationalError
+from psycopg.errors import QueryCanceled
+from connectors.replicas import LEAST_CONNECTIONS, ROUND_ROBIN, ReplicaRouter
+
+STREAMING = {"in_recovery": True, "receiver_status": "streaming", "receipt_age_seconds": 1.0}
+
+
+class _FakeCursor:
+    def __init__(self, row):
+        self.row = row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+
+class _FakeConnection:
+    def __init__(self, row):
+        self.row = row
+
+    def cursor(self):
+        return _FakeCursor(self.row)
+
+
+class _FakeDatabase:
+    """A database whose health check reports the given lag, or fails if it is down."""
+
+    def __init__(self, name: str, lag_seconds: float = 0.0, down: bool = False):
+        self.name = name
+        self.lag_seconds = lag_seconds
+        self.down = down
+
+    @contextmanager
+    def pooled_connection(self, query_name, timeout=None):
+        if self.down:
+            raise OperationalError(f"{self.name} is unreachable")
+        yield _FakeConnection({**STREAMING, "lag_seconds": self.lag_seconds})
+
+
+def _router(*replicas: _FakeDatabase, strategy: str = ROUND_ROBIN) -> ReplicaRouter:
+    """A router over the fake replicas, checked once, without the checker thread."""
+    router = ReplicaRouter(
+        _FakeDatabase("primary"), list(replicas), strategy=strategy, max_lag_seconds=30.0
+    )
+    router.start = lambda: None
+    router.check(force=True)
+    return router
+
+
+def _read_name(database) -> str:
+    return database.name
+
+
+def test_round_robin_cycles_through_the_replicas():
+    router = _router(_FakeDatabase("a"), _FakeDatabase("b"), _FakeDatabase("c"))
+
+    names = [router.run_read(_read_name) for _ in range(6)]
+
+    assert names == ["a", "b", "c", "a", "b", "c"]
+
+
+def test_least_connections_picks_the_least_busy_replica():
+    router = _router(
+        _FakeDatabase("a"), _FakeDatabase("b"), _FakeDatabase("c"), strategy=LEAST_CONNECTIONS
+    )
+    a, b, c = router.replicas
+    a.in_flight, b.in_flight, c.in_flight = 2, 0, 1
+
+    with router.reading() as database:
+        assert database.name == "b"
+        assert b.in_flight == 1
+        with router.reading() as database:
+            # b and c are tied at one read in flight; the first wins
+            assert database.name == "b"
+    assert b.in_flight == 0
+
+
+def test_replicas_over_the_lag_threshold_are_skipped():
+    router = _router(_FakeDatabase("lagging", lag_seconds=60.0), _FakeDatabase("current"))
+
+    names = {router.run_read(_read_name) for _ in range(4)}
+
+    assert names == {"current"}
+    lagging = router.status()[0]
+    assert lagging["healthy"] is False
+    assert lagging["lag_seconds"] == 60.0
+    assert "exceeds" in lagging["last_error"]
+
+
+def test_reads_go_to_the_primary_when_no_replica_is_usable():
+    router = _router(_FakeDatabase("lagging", lag_seconds=60.0), _FakeDatabase("down", down=True))
+
+    assert router.run_read(_read_name) == "primary"
+    with router.reading() as database:
+        assert database.name == "primary"
+    assert "unreachable" in router.status()[1]["last_error"]
+
+
+def test_a_failing_replica_fails_over_to_the_primary():
+    router = _router(_FakeDatabase("a"))
+    reads = []
+
+    def operation(database):
+        reads.append(database.name)
+        if database.name == "a":
+            raise OperationalError("server closed the connection unexpectedly")
+        return database.name
+
+    assert router.run_read(operation) == "primary"
+    assert reads == ["a", "primary"]
+    replica = router.replicas[0]
+    assert replica.healthy is False
+    assert replica.in_flight == 0
+    # Until the next check marks it healthy again, reads skip it
+    assert router.run_read(_read_name) == "primary"
+
+
+def test_query_cancellations_are_not_failed_over():
+    router = _router(_FakeDatabase("a"))
+
+    def operation(database):
+        raise QueryCanceled("canceling statement due to statement timeout")
+
+    with pytest.raises(QueryCanceled):
+        router.run_read(operation)
+    assert router.replicas[0].healthy is True
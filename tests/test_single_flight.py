@@ -0,0 +1,115 @@
+"""
+Tests for single-flight coalescing of identical concurrent calls.
+"""
+
+import threading
+import pytest
+from services.single_flight import SingleFlight, SingleFlightError
+
+
+class _Uncopyable(Exception):
+    def __init__(self, code: int, *, detail: str):
+        super().__init__(code)
+        self.detail = detail
+
+
+def _run_coalesced(error: BaseException, followers: int = 3):
+    """Fail one shared call with error while followers wait on it; returns every caller's exception."""
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    raised = {}
+
+    def leader_call():
+        started.set()
+        release.wait(5)
+        raise error
+
+    def call(name, func):
+        try:
+            flight.do("key", func, timeout=5)
+        except BaseException as e:
+            raised[name] = e
+
+    leader = threading.Thread(target=call, args=("leader", leader_call))
+    leader.start()
+    started.wait(5)
+    threads = [
+        threading.Thread(target=call, args=(f"follower-{i}", lambda: None))
+        for i in range(followers)
+    ]
+    for thread in threads:
+        thread.start()
+    while len(flight._calls["key"].followers) < followers:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in [leader, *threads]:
+        thread.join(5)
+    return raised
+
+
+def test_followers_raise_their_own_copy_chained_from_the_leaders():
+    error = ValueError("bad parameter")
+
+    raised = _run_coalesced(error)
+
+    assert raised.pop("leader") is error
+    assert len({id(e) for e in raised.values()}) == len(raised) == 3
+    for follower_error in raised.values():
+        assert type(follower_error) is ValueError
+        assert follower_error.args == error.args
+        assert follower_error is not error
+        assert follower_error.__cause__ is error
+
+
+def test_uncopyable_errors_are_wrapped():
+    error = _Uncopyable(7, detail="no positional detail")
+
+    raised = _run_coalesced(error, followers=1)
+
+    follower_error = raised["follower-0"]
+    assert isinstance(follower_error, SingleFlightError)
+    assert follower_error.__cause__ is error
+
+
+def test_concurrent_callers_share_one_result():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = {}
+
+    def leader_call():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"answer": 42}
+
+    def call(name, func):
+        results[name] = flight.do("key", func, timeout=5)
+
+    leader = threading.Thread(target=call, args=("leader", leader_call))
+    leader.start()
+    started.wait(5)
+    followers = [
+        threading.Thread(target=call, args=(f"follower-{i}", leader_call)) for i in range(5)
+    ]
+    for thread in followers:
+        thread.start()
+    while len(flight._calls["key"].followers) < len(followers):
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 6
+    assert all(result is results["leader"] for result in results.values())
+
+
+def test_calls_after_completion_run_again():
+    flight = SingleFlight()
+
+    assert flight.do("key", lambda: 42) == 42
+    with pytest.raises(KeyError):
+        flight.do("key", lambda: {}["missing"])